@@ -1 +1,3 @@
 version = "2.2.6"
+
+default_app_config = "data_browser.apps.DataBrowserConfig"
@@ -23,6 +23,17 @@ class ViewAdmin(AdminMixin, admin.ModelAdmin):
             },
         ),
         ("Query", {"fields": ["model_name", "fields", "query", "limit"]}),
+        (
+            "Schedule",
+            {
+                "fields": [
+                    "refresh_interval",
+                    "snapshot_time",
+                    "watermark_field",
+                    "watermark",
+                ]
+            },
+        ),
         ("Internal", {"fields": ["id", "created_time"]}),
     ]
     list_display = ["__str__", "owner", "public"]
@@ -51,3 +62,48 @@ class ViewAdmin(AdminMixin, admin.ModelAdmin):
         get_results = super().get_changeform_initial_data(request)
         get_results["owner"] = request.user.pk
         return get_results
+
+
+class _ReadOnlyAdmin(admin.ModelAdmin):
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(models.QueryStats)
+class QueryStatsAdmin(_ReadOnlyAdmin):
+    list_display = [
+        "model_name",
+        "fields",
+        "filters",
+        "count",
+        "mean_duration",
+        "p50_duration",
+        "p95_duration",
+        "max_duration",
+        "last_seen",
+    ]
+    list_filter = ["model_name"]
+    ordering = ["-p95_duration"]
+    search_fields = ["fields", "filters"]
+
+
+@admin.register(models.QueryLog)
+class QueryLogAdmin(_ReadOnlyAdmin):
+    list_display = [
+        "created_time",
+        "model_name",
+        "fields",
+        "filters",
+        "media",
+        "user",
+        "view",
+        "duration",
+        "sql_time",
+        "rows",
+    ]
+    list_filter = ["model_name", "media"]
+    ordering = ["-created_time"]
+    search_fields = ["fingerprint", "fields", "filters"]
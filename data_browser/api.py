@@ -5,6 +5,7 @@ from django.shortcuts import get_object_or_404
 
 from .common import HttpResponse, JsonResponse, can_make_public
 from .models import View, global_data
+from .orm import densify_results
 
 
 def deserialize(request):
@@ -22,6 +23,8 @@ def deserialize(request):
             "fields",
             "query",
             "limit",
+            "refresh_interval",
+            "watermark_field",
         ]
         if f in data
     }
@@ -34,6 +37,12 @@ def deserialize(request):
         if res["limit"] < 1:
             res["limit"] = 1
 
+    if res.get("refresh_interval") is not None:
+        try:
+            res["refresh_interval"] = max(1, int(res["refresh_interval"]))
+        except:  # noqa: E722  input sanitization
+            res["refresh_interval"] = None
+
     if not can_make_public(request.user):
         res["public"] = False
 
@@ -49,6 +58,9 @@ def serialize(view):
         "fields": view.fields,
         "query": view.query,
         "limit": view.limit,
+        "refresh_interval": view.refresh_interval,
+        "snapshot_time": view.snapshot_time,
+        "watermark_field": view.watermark_field,
         "public_link": view.public_link(),
         "google_sheets_formula": view.google_sheets_formula(),
         "link": f"/query/{view.model_name}/{view.fields}.html?{view.query}&limit={view.limit}",
@@ -81,9 +93,18 @@ def view_detail(request, pk):
     view = get_object_or_404(get_queryset(request), pk=pk)
 
     if request.method == "GET":
-        return JsonResponse(serialize(view))
+        snapshot = view.get_snapshot()
+        return JsonResponse(
+            {
+                **serialize(view),
+                "snapshot": None if snapshot is None else densify_results(snapshot),
+            }
+        )
     elif request.method == "PATCH":
-        for k, v in deserialize(request).items():
+        data = deserialize(request)
+        if data.keys() & {"model_name", "fields", "query", "limit", "watermark_field"}:
+            view.clear_snapshot()
+        for k, v in data.items():
             setattr(view, k, v)
         view.save()
         return JsonResponse(serialize(view))
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class DataBrowserConfig(AppConfig):
+    name = "data_browser"
+
+    def ready(self):
+        from .metrics import record_query
+        from .orm import clear_schema_cache
+        from .signals import query_finished
+
+        post_migrate.connect(clear_schema_cache, dispatch_uid="ddb_clear_schema")
+        clear_schema_cache()
+        query_finished.connect(record_query, dispatch_uid="ddb_record_query")
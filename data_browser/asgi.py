@@ -0,0 +1,52 @@
+import asyncio
+
+DISCONNECTED_KEY = "data_browser.disconnected"
+
+
+class DisconnectMiddleware:
+    """
+    ASGI middleware that lets the async views see when the client goes away.
+
+    Django stops reading from the client once it has the request body, this
+    keeps reading and sets the ``asyncio.Event`` in the request scope when the
+    client disconnects.
+
+        application = DisconnectMiddleware(get_asgi_application())
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        disconnected = asyncio.Event()
+        scope = dict(scope, **{DISCONNECTED_KEY: disconnected})
+        messages = asyncio.Queue()
+        listener = None
+
+        async def listen():
+            # after the body the only message is the disconnect
+            message = await receive()
+            await messages.put(message)
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+
+        async def app_receive():
+            nonlocal listener
+            if listener is not None:
+                return await messages.get()
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body"):
+                # that's the whole body, watch for the disconnect from here on
+                listener = asyncio.ensure_future(listen())
+            return message
+
+        try:
+            return await self.app(scope, app_receive, send)
+        finally:
+            if listener is not None:
+                listener.cancel()
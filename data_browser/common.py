@@ -1,4 +1,13 @@
+import contextvars
+import copy
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 from django import http
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
 
 from . import version
 
@@ -9,8 +18,71 @@ def can_make_public(user):
     return user.has_perm(f"data_browser.{MAKE_PUBLIC_CODENAME}")
 
 
-def JsonResponse(data):
-    res = http.JsonResponse(data, safe=False)
+_query_context = contextvars.ContextVar("data_browser_query_context", default=None)
+
+
+def get_query_context():
+    """
+    The context of the Data Browser query being run, or None if there isn't one.
+
+    A dict of the requested ``fields`` and ``calculated_fields``, the same as
+    ``request.data_browser``.
+    """
+    return _query_context.get()
+
+
+@contextmanager
+def query_context(request, fields=()):
+    """
+    Run Data Browser calls into the admin for the given fields.
+
+    Yields a copy of the request with ``request.data_browser`` set, the original
+    request is left alone so concurrent queries don't see each others fields.
+    """
+    context = {"calculated_fields": set(fields), "fields": set(fields)}
+    request = copy.copy(request)
+    request.data_browser = context
+    token = _query_context.set(context)
+    try:
+        yield request
+    finally:
+        _query_context.reset(token)
+
+
+def _json_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def _orjson_dumps(data):
+    try:
+        import orjson
+    except ImportError:
+        return _json_dumps(data)
+
+    try:
+        # pass datetimes through so they are formatted the same as DjangoJSONEncoder
+        return orjson.dumps(
+            data,
+            default=DjangoJSONEncoder().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        ).decode("utf-8")
+    except orjson.JSONEncodeError:
+        # e.g. ints wider than 64 bits, let the standard encoder deal with it
+        return _json_dumps(data)
+
+
+_SERIALIZERS = {"json": _json_dumps, "orjson": _orjson_dumps}
+
+
+def dumps(data):
+    serializer = settings.DATA_BROWSER_JSON_SERIALIZER
+    if serializer in _SERIALIZERS:
+        return _SERIALIZERS[serializer](data)
+    return import_string(serializer)(data)
+
+
+def JsonResponse(data, status=200):
+    res = http.HttpResponse(dumps(data), content_type="application/json", status=status)
     res["X-Version"] = version
     res["Access-Control-Expose-Headers"] = "X-Version"
     return res
@@ -23,13 +95,41 @@ def HttpResponse(*args, **kwargs):
     return res
 
 
+def StreamingHttpResponse(*args, **kwargs):
+    res = http.StreamingHttpResponse(*args, **kwargs)
+    res["X-Version"] = version
+    res["Access-Control-Expose-Headers"] = "X-Version"
+    return res
+
+
 class Settings:
     _defaults = {
         "DATA_BROWSER_ALLOW_PUBLIC": False,
+        "DATA_BROWSER_ASYNC_THREADS": 4,
+        "DATA_BROWSER_ASYNC_VIEWS": False,
         "DATA_BROWSER_AUTH_USER_COMPAT": True,
+        "DATA_BROWSER_CSV_STREAMING": False,
         "DATA_BROWSER_DEFAULT_ROW_LIMIT": 1000,
         "DATA_BROWSER_DEV": False,
         "DATA_BROWSER_FE_DSN": None,
+        "DATA_BROWSER_JSON_SERIALIZER": "json",
+        "DATA_BROWSER_LAZY_CONFIG": False,
+        "DATA_BROWSER_MAX_QUERIES": 0,
+        "DATA_BROWSER_MAX_USER_QUERIES": 0,
+        "DATA_BROWSER_METRICS_TOKEN": None,
+        "DATA_BROWSER_PIVOT_THREADS": 0,
+        "DATA_BROWSER_QUERY_CONFIRM": True,
+        "DATA_BROWSER_QUERY_COST_LIMIT": 0,
+        "DATA_BROWSER_QUERY_LOG": False,
+        "DATA_BROWSER_QUERY_QUEUE_SIZE": 0,
+        "DATA_BROWSER_QUERY_QUEUE_WAIT": 5,
+        "DATA_BROWSER_QUERY_TIMEOUT": 0,
+        "DATA_BROWSER_RESULT_CACHE_TTL": 0,
+        "DATA_BROWSER_RESULT_MAX_BYTES": 2 ** 20,
+        "DATA_BROWSER_SCHEMA_CACHE": False,
+        "DATA_BROWSER_SCHEMA_CACHE_SIZE": 32,
+        "DATA_BROWSER_SERVER_TIMING": True,
+        "DATA_BROWSER_VIEW_CSV_MAX_AGE": 0,
     }
 
     def __getattr__(self, name):
@@ -41,3 +141,30 @@ class Settings:
 
 
 settings = Settings()
+
+
+class ThreadPool:
+    """
+    A ThreadPoolExecutor sized by a setting, created on first use.
+
+    If the setting changes the pool is replaced and the old one shut down once
+    its queued work is done.
+    """
+
+    def __init__(self, setting, thread_name_prefix):
+        self._setting = setting
+        self._thread_name_prefix = thread_name_prefix
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get(self):
+        threads = getattr(settings, self._setting)
+        with self._lock:
+            old = self._executor
+            if old is None or old._max_workers != threads:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=threads, thread_name_prefix=self._thread_name_prefix
+                )
+                if old is not None:
+                    old.shutdown(wait=False)
+            return self._executor
@@ -1,6 +1,8 @@
 from django.db.models import BooleanField
 from django.urls import reverse
 
+from .common import get_query_context
+
 
 class Everything:
     def __contains__(self, item):
@@ -9,7 +11,10 @@ class Everything:
 
 class AdminMixin:
     def get_fields_for_request(self, request):
-        if hasattr(request, "data_browser"):
+        context = get_query_context()
+        if context is not None:
+            return context["fields"]
+        elif hasattr(request, "data_browser"):
             return request.data_browser["fields"]
         elif request.resolver_match.func.__name__ == "changelist_view":
             return set(self.get_list_display(request))
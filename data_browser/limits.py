@@ -0,0 +1,94 @@
+import math
+import time
+
+from django.core.cache import cache
+
+from .common import settings
+
+_LIMITS_PREFIX = "data_browser_running"
+# counts expire this long after they were created so slots leaked by a dead
+# process are eventually freed
+_SLOT_TIMEOUT = 60 * 60
+_POLL_INTERVAL = 0.1
+
+
+class TooManyQueries(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many queries running, retry in {retry_after} seconds.")
+        self.retry_after = retry_after
+
+
+def _incr(key):
+    while True:
+        cache.add(key, 0, _SLOT_TIMEOUT)
+        try:
+            return cache.incr(key)
+        except ValueError:  # it expired between the add and the incr
+            pass
+
+
+def _decr(key):
+    try:
+        if cache.decr(key) < 0:
+            # it expired and was recreated since our incr, don't go below zero
+            cache.incr(key)
+    except ValueError:  # it expired, nothing to give back
+        pass
+
+
+def _try_acquire(limits):
+    acquired = []
+    for key, limit in limits:
+        acquired.append(key)
+        if _incr(key) > limit:
+            for key in acquired:
+                _decr(key)
+            return False
+    return True
+
+
+def _get_limits(user):
+    limits = []
+    if settings.DATA_BROWSER_MAX_USER_QUERIES:
+        key = f"{_LIMITS_PREFIX}:user:{user.pk}"
+        limits.append((key, settings.DATA_BROWSER_MAX_USER_QUERIES))
+    if settings.DATA_BROWSER_MAX_QUERIES:
+        limits.append((f"{_LIMITS_PREFIX}:all", settings.DATA_BROWSER_MAX_QUERIES))
+    return limits
+
+
+def _wait_for_slot(limits):
+    queue_key = f"{_LIMITS_PREFIX}:queue"
+    if not _try_acquire([(queue_key, settings.DATA_BROWSER_QUERY_QUEUE_SIZE)]):
+        return False
+    try:
+        deadline = time.monotonic() + settings.DATA_BROWSER_QUERY_QUEUE_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(_POLL_INTERVAL)
+            if _try_acquire(limits):
+                return True
+        return False
+    finally:
+        _decr(queue_key)
+
+
+def acquire_query_slot(user):
+    """
+    Reserve a slot to run a query in, queueing for one if they are all in use.
+
+    Returns a function that gives the slot back, it's safe to call more than
+    once. Raises TooManyQueries if the queue is full or no slot frees up in time.
+    """
+    limits = _get_limits(user)
+    if not (_try_acquire(limits) or _wait_for_slot(limits)):
+        raise TooManyQueries(max(1, math.ceil(settings.DATA_BROWSER_QUERY_QUEUE_WAIT)))
+
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            for key, limit in limits:
+                _decr(key)
+
+    return release
@@ -0,0 +1,47 @@
+import time
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from data_browser.models import View
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the snapshots of saved views that have a refresh interval and are due."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep running, checking for due views."
+        )
+        parser.add_argument(
+            "--sleep", type=int, default=60, help="Seconds between checks with --loop."
+        )
+
+    def handle(self, *args, loop, sleep, **options):
+        while True:
+            db.close_old_connections()
+            self.refresh_due_views()
+            if not loop:
+                break
+            time.sleep(sleep)
+
+    def refresh_due_views(self):
+        views = View.objects.filter(refresh_interval__isnull=False).select_related(
+            "owner"
+        )
+        for view in views:
+            if not view.refresh_due:
+                continue
+            # like public views, these are run as the owner
+            owner = view.owner
+            if not (owner and owner.is_active and owner.is_staff):
+                self.stderr.write(f"Skipping {view.pk}, owner can't run it")
+                continue
+            try:
+                view.refresh_snapshot()
+            except Exception as e:
+                self.stderr.write(f"Failed to refresh {view.pk}: {e!r}")
+            else:
+                self.stdout.write(f"Refreshed {view.pk}")
@@ -0,0 +1,155 @@
+import bisect
+import hmac
+import threading
+from collections import defaultdict
+
+from django import http
+
+from .common import settings
+
+# upper bounds in seconds of the query duration histogram
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, float("inf"))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(value)
+
+
+class Registry:
+    """In process totals of the queries run, rendered in the Prometheus format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.queries = defaultdict(int)
+            self.buckets = defaultdict(lambda: [0] * len(BUCKETS))
+            self.duration = defaultdict(float)
+            self.phase_seconds = defaultdict(float)
+            self.phase_queries = defaultdict(int)
+            self.rows = defaultdict(int)
+            self.cache = defaultdict(int)
+
+    def record(self, model, media, status, duration, phases, rows, cache_hit):
+        with self._lock:
+            self.queries[model, media, status] += 1
+            self.buckets[model][bisect.bisect_left(BUCKETS, duration)] += 1
+            self.duration[model] += duration
+            for name, phase in phases.items():
+                self.phase_seconds[name] += phase["dur"]
+                self.phase_queries[name] += phase["queries"]
+            if rows is not None:
+                self.rows[model] += rows
+            if cache_hit is not None:
+                self.cache["hit" if cache_hit else "miss"] += 1
+
+    def render(self):
+        lines = []
+
+        def metric(name, type_, help_):
+            lines.append(f"# HELP {name} {help_}")
+            lines.append(f"# TYPE {name} {type_}")
+
+        def sample(name, value, **labels):
+            lines.append(f"{name}{{{_labels(**labels)}}} {_number(value)}")
+
+        with self._lock:
+            metric("data_browser_queries_total", "counter", "Queries run.")
+            for (model, media, status), count in sorted(self.queries.items()):
+                sample(
+                    "data_browser_queries_total",
+                    count,
+                    model=model,
+                    media=media,
+                    status=status,
+                )
+
+            metric(
+                "data_browser_query_duration_seconds",
+                "histogram",
+                "Time taken to build each query response.",
+            )
+            for model, counts in sorted(self.buckets.items()):
+                total = 0
+                for le, count in zip(BUCKETS, counts):
+                    total += count
+                    sample(
+                        "data_browser_query_duration_seconds_bucket",
+                        total,
+                        model=model,
+                        le=_number(le),
+                    )
+                sample(
+                    "data_browser_query_duration_seconds_sum",
+                    self.duration[model],
+                    model=model,
+                )
+                sample("data_browser_query_duration_seconds_count", total, model=model)
+
+            metric(
+                "data_browser_phase_seconds_total",
+                "counter",
+                "Time spent in each phase of the queries.",
+            )
+            for name, seconds in sorted(self.phase_seconds.items()):
+                sample("data_browser_phase_seconds_total", seconds, phase=name)
+
+            metric(
+                "data_browser_sql_queries_total",
+                "counter",
+                "SQL queries run by each phase of the queries.",
+            )
+            for name, count in sorted(self.phase_queries.items()):
+                sample("data_browser_sql_queries_total", count, phase=name)
+
+            metric("data_browser_rows_total", "counter", "Result rows returned.")
+            for model, count in sorted(self.rows.items()):
+                sample("data_browser_rows_total", count, model=model)
+
+            metric(
+                "data_browser_result_cache_total",
+                "counter",
+                "Result cache lookups.",
+            )
+            for result, count in sorted(self.cache.items()):
+                sample("data_browser_result_cache_total", count, result=result)
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def record_query(
+    sender, *, model_name, media, status, duration, phases, rows, cache_hit, **kwargs
+):
+    """query_finished receiver that adds the query to the registry."""
+    if settings.DATA_BROWSER_METRICS_TOKEN:
+        registry.record(model_name, media, status, duration, phases, rows, cache_hit)
+
+
+def metrics(request):
+    token = settings.DATA_BROWSER_METRICS_TOKEN
+    if not token:
+        raise http.Http404("Metrics are not enabled.")
+
+    expected = f"Bearer {token}".encode()
+    provided = request.META.get("HTTP_AUTHORIZATION", "").encode()
+    if not hmac.compare_digest(provided, expected):
+        response = http.HttpResponse("Unauthorized", status=401)
+        response["WWW-Authenticate"] = "Bearer"
+        return response
+
+    return http.HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("data_browser", "0008_view_limit")]
+
+    operations = [
+        migrations.AddField(
+            model_name="view",
+            name="refresh_interval",
+            field=models.PositiveIntegerField(
+                blank=True, help_text="Seconds between scheduled refreshes.", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="view", name="snapshot", field=models.TextField(blank=True)
+        ),
+        migrations.AddField(
+            model_name="view",
+            name="snapshot_time",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("data_browser", "0009_view_snapshot")]
+
+    operations = [
+        migrations.AddField(
+            model_name="view",
+            name="watermark",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="view",
+            name="watermark_field",
+            field=models.CharField(
+                blank=True,
+                help_text="An ever increasing number or datetime field used to only query new rows when refreshing.",
+                max_length=64,
+            ),
+        ),
+    ]
@@ -0,0 +1,102 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("data_browser", "0010_view_watermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueryStats",
+            fields=[
+                (
+                    "fingerprint",
+                    models.CharField(max_length=40, primary_key=True, serialize=False),
+                ),
+                ("model_name", models.CharField(max_length=255)),
+                ("fields", models.TextField(blank=True)),
+                ("filters", models.TextField(blank=True)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("total_duration", models.FloatField(default=0, help_text="Seconds.")),
+                ("max_duration", models.FloatField(default=0, help_text="Seconds.")),
+                (
+                    "p50_duration",
+                    models.FloatField(
+                        default=0, help_text="Seconds, of the last 100 queries."
+                    ),
+                ),
+                (
+                    "p95_duration",
+                    models.FloatField(
+                        db_index=True,
+                        default=0,
+                        help_text="Seconds, of the last 100 queries.",
+                    ),
+                ),
+                ("total_sql_time", models.FloatField(default=0, help_text="Seconds.")),
+                ("last_seen", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "verbose_name_plural": "query stats",
+            },
+        ),
+        migrations.CreateModel(
+            name="QueryLog",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_time",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=40)),
+                ("model_name", models.CharField(max_length=255)),
+                ("fields", models.TextField(blank=True)),
+                ("filters", models.TextField(blank=True)),
+                ("media", models.CharField(max_length=8)),
+                ("duration", models.FloatField(help_text="Seconds.")),
+                ("sql_time", models.FloatField(help_text="Seconds.")),
+                ("rows", models.PositiveIntegerField()),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "view",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="data_browser.view",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="querylog",
+            index=models.Index(
+                fields=["fingerprint", "-created_time"],
+                name="data_browse_fingerp_641f48_idx",
+            ),
+        ),
+    ]
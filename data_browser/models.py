@@ -1,13 +1,32 @@
-import threading
+import contextvars
+import dataclasses
+import hashlib
+import json
+import math
 
-from django.db import models
-from django.http import QueryDict
+from django.db import IntegrityError, models, router, transaction
+from django.http import HttpRequest, QueryDict
 from django.urls import reverse
 from django.utils import crypto, timezone
 
-from .common import MAKE_PUBLIC_CODENAME, settings
+from .common import MAKE_PUBLIC_CODENAME, dumps, settings
 
-global_data = threading.local()
+
+class _GlobalData:
+    """Like a thread local but also kept separate between asyncio tasks."""
+
+    _request = contextvars.ContextVar("data_browser_request", default=None)
+
+    @property
+    def request(self):
+        return self._request.get()
+
+    @request.setter
+    def request(self, request):
+        self._request.set(request)
+
+
+global_data = _GlobalData()
 
 
 def get_id():
@@ -37,11 +56,122 @@ class View(models.Model):
     query = models.TextField(blank=True)
     limit = models.IntegerField(blank=False, null=False, default=1000)
 
+    refresh_interval = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Seconds between scheduled refreshes."
+    )
+    snapshot = models.TextField(blank=True)
+    snapshot_time = models.DateTimeField(null=True, blank=True)
+    watermark_field = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="An ever increasing number or datetime field used to only "
+        "query new rows when refreshing.",
+    )
+    watermark = models.TextField(blank=True)
+
     def get_query(self):
         from .query import Query
 
         return Query.from_request(self.model_name, self.fields, QueryDict(self.query))
 
+    @property
+    def refresh_due(self):
+        if not self.refresh_interval:
+            return False
+        if not self.snapshot_time:
+            return True
+        age = timezone.now() - self.snapshot_time
+        return age.total_seconds() >= self.refresh_interval
+
+    def refresh_snapshot(self):
+        """
+        Run the query as the owner and store the results in the snapshot.
+
+        With a watermark field only rows past the stored watermark are queried
+        and merged into the snapshot, when the query allows that.
+        """
+        from .orm import confirm_cost, get_models
+
+        request = HttpRequest()
+        request.user = self.owner
+        query = self.get_query()
+        orm_models = get_models(request, lazy=True)
+        if query.model_name not in orm_models:
+            raise ValueError(f"{query.model_name} does not exist")
+
+        # snapshots are for taking expensive queries off peak
+        with confirm_cost():
+            if self.watermark_field:
+                results, self.watermark = self._get_incremental_results(
+                    request, query, orm_models
+                )
+            else:
+                results = self._get_results(request, query, orm_models)
+
+        self.snapshot = dumps(
+            {
+                "rows": results["rows"],
+                "cols": results["cols"],
+                "cells": [[*key, cell] for key, cell in results["cells"].items()],
+                "length": results["length"],
+            }
+        )
+        self.snapshot_time = timezone.now()
+        self.save(update_fields=["snapshot", "snapshot_time", "watermark"])
+
+    @staticmethod
+    def _get_results(request, query, orm_models, *filters):
+        from .orm import get_sparse_results
+        from .query import BoundQuery
+
+        query = dataclasses.replace(query, filters=[*query.filters, *filters])
+        bound_query = BoundQuery.bind(query, orm_models)
+        return get_sparse_results(request, bound_query, orm_models)
+
+    def _get_incremental_results(self, request, query, orm_models):
+        from .orm import can_merge_results, get_watermark, merge_results
+        from .query import BoundQuery, QueryFilter
+
+        bound_query = BoundQuery.bind(query, orm_models)
+        watermark = get_watermark(
+            request, bound_query, orm_models, self.watermark_field
+        )
+        if watermark is None:
+            return self._get_results(request, query, orm_models), ""
+
+        # rows added while we're running will be picked up next time
+        upper = QueryFilter(self.watermark_field, "lte", str(watermark))
+        if (
+            self.watermark
+            and self.snapshot_time
+            and can_merge_results(bound_query, orm_models)
+        ):
+            lower = QueryFilter(self.watermark_field, "gt", self.watermark)
+            new = self._get_results(request, query, orm_models, lower, upper)
+            results = merge_results(bound_query, self._load_snapshot(), new)
+            if results is not None:
+                return results, str(watermark)
+
+        return self._get_results(request, query, orm_models, upper), str(watermark)
+
+    def _load_snapshot(self):
+        results = json.loads(self.snapshot)
+        results["cells"] = {(row, col): cell for row, col, cell in results["cells"]}
+        return results
+
+    def get_snapshot(self):
+        """
+        The stored results in the form returned by orm.get_sparse_results.
+        """
+        if not (self.refresh_interval and self.snapshot_time):
+            return None
+        return self._load_snapshot()
+
+    def clear_snapshot(self):
+        self.snapshot = ""
+        self.snapshot_time = None
+        self.watermark = ""
+
     def public_link(self):
         if self.public:
             if settings.DATA_BROWSER_ALLOW_PUBLIC:
@@ -69,3 +199,132 @@ class View(models.Model):
 
     def __str__(self):
         return f"{self.model_name} view: {self.name}"
+
+
+# how many of the latest queries the percentiles in QueryStats cover
+_STATS_SAMPLE_SIZE = 100
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * percent / 100) - 1)]
+
+
+def get_fingerprint(query):
+    """
+    The shape of a query, its model, fields and filtered fields but not the
+    filter values, along with the hash used to group queries by it.
+    """
+    filters = sorted({"__".join([*f.path, f.lookup]) for f in query.filters})
+    filters = ",".join(filters)
+    data = dumps([query.model_name, query._field_str, filters])
+    return hashlib.sha1(data.encode()).hexdigest(), query._field_str, filters
+
+
+class QueryLog(models.Model):
+    class Meta:
+        indexes = [models.Index(fields=["fingerprint", "-created_time"])]
+
+    created_time = models.DateTimeField(default=timezone.now, db_index=True)
+    fingerprint = models.CharField(max_length=40)
+    model_name = models.CharField(max_length=255)
+    fields = models.TextField(blank=True)
+    filters = models.TextField(blank=True)
+    media = models.CharField(max_length=8)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    view = models.ForeignKey(View, null=True, blank=True, on_delete=models.SET_NULL)
+    duration = models.FloatField(help_text="Seconds.")
+    sql_time = models.FloatField(help_text="Seconds.")
+    rows = models.PositiveIntegerField()
+
+    @classmethod
+    def log(cls, request, query, media, view, duration, timings):
+        """Record a query run by the Data Browser and update its QueryStats."""
+        fingerprint, fields, filters = get_fingerprint(query)
+        sql = timings.phases.get("sql", {})
+        # a savepoint so a failure doesn't break the request's transaction
+        with transaction.atomic(using=router.db_for_write(cls)):
+            log = cls.objects.create(
+                fingerprint=fingerprint,
+                model_name=query.model_name,
+                fields=fields,
+                filters=filters,
+                media=media,
+                user=request.user if request.user.is_authenticated else None,
+                view=view,
+                duration=duration,
+                sql_time=sql.get("dur", 0),
+                rows=sql.get("rows", 0),
+            )
+            QueryStats.update(log)
+        return log
+
+    def __str__(self):
+        return f"{self.model_name} query: {self.fields}"
+
+
+class QueryStats(models.Model):
+    class Meta:
+        verbose_name_plural = "query stats"
+
+    fingerprint = models.CharField(primary_key=True, max_length=40)
+    model_name = models.CharField(max_length=255)
+    fields = models.TextField(blank=True)
+    filters = models.TextField(blank=True)
+    count = models.PositiveIntegerField(default=0)
+    total_duration = models.FloatField(default=0, help_text="Seconds.")
+    max_duration = models.FloatField(default=0, help_text="Seconds.")
+    p50_duration = models.FloatField(
+        default=0, help_text=f"Seconds, of the last {_STATS_SAMPLE_SIZE} queries."
+    )
+    p95_duration = models.FloatField(
+        default=0,
+        db_index=True,
+        help_text=f"Seconds, of the last {_STATS_SAMPLE_SIZE} queries.",
+    )
+    total_sql_time = models.FloatField(default=0, help_text="Seconds.")
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def update(cls, log):
+        try:
+            cls.objects.get_or_create(
+                fingerprint=log.fingerprint,
+                defaults={
+                    "model_name": log.model_name,
+                    "fields": log.fields,
+                    "filters": log.filters,
+                },
+            )
+        except IntegrityError:
+            # a concurrent query created it but it isn't visible to our
+            # transaction yet, the updates below still see and lock the row
+            pass
+        # F expressions so concurrent updates don't lose counts
+        cls.objects.filter(fingerprint=log.fingerprint).update(
+            count=models.F("count") + 1,
+            total_duration=models.F("total_duration") + log.duration,
+            total_sql_time=models.F("total_sql_time") + log.sql_time,
+            last_seen=log.created_time,
+        )
+        cls.objects.filter(
+            fingerprint=log.fingerprint, max_duration__lt=log.duration
+        ).update(max_duration=log.duration)
+
+        durations = QueryLog.objects.filter(fingerprint=log.fingerprint).order_by(
+            "-created_time"
+        )[:_STATS_SAMPLE_SIZE]
+        durations = list(durations.values_list("duration", flat=True))
+        cls.objects.filter(fingerprint=log.fingerprint).update(
+            p50_duration=_percentile(durations, 50),
+            p95_duration=_percentile(durations, 95),
+        )
+
+    @property
+    def mean_duration(self):
+        return self.total_duration / self.count if self.count else 0
+
+    def __str__(self):
+        return f"{self.model_name} queries: {self.fields}"
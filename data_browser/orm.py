@@ -1,16 +1,33 @@
+import contextvars
+import hashlib
+import itertools
 import json
 import logging
-from collections import defaultdict
-
+import operator
+import pickle
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from django import db
 from django.contrib.admin import site
-from django.contrib.admin.options import InlineModelAdmin
+from django.contrib.admin.options import InlineModelAdmin, ModelAdmin
 from django.contrib.admin.utils import flatten_fieldsets
 from django.contrib.auth.admin import UserAdmin
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
 from django.db import models
 from django.db.models.fields.reverse_related import ForeignObjectRel
 from django.forms.models import _get_foreign_key
+from django.utils import timezone
 
-from .common import settings
+from . import version
+from .common import ThreadPool, query_context, settings
 from .helpers import AnnotationDescriptor
 from .orm_fields import (
     _AGGREGATES,
@@ -45,6 +62,7 @@ from .query import (
     StringType,
     UnknownType,
 )
+from .timing import note, phase
 
 try:
     from django.contrib.postgres.fields import ArrayField
@@ -82,59 +100,219 @@ _FIELD_TYPE_MAP = {
 }
 
 
-def _get_all_admin_fields(request):
-    request.data_browser = {"calculated_fields": set(), "fields": set()}
+def _from_fieldsets(request, admin):
+    auth_user_compat = settings.DATA_BROWSER_AUTH_USER_COMPAT
+    if auth_user_compat and isinstance(admin, UserAdmin):
+        obj = admin.model()  # get the change fieldsets, not the add ones
+    else:
+        obj = None
 
-    def from_fieldsets(admin, all_):
-        auth_user_compat = settings.DATA_BROWSER_AUTH_USER_COMPAT
-        if auth_user_compat and isinstance(admin, UserAdmin):
-            obj = admin.model()  # get the change fieldsets, not the add ones
-        else:
-            obj = None
+    for f in flatten_fieldsets(admin.get_fieldsets(request, obj)):
+        # skip calculated fields on inlines
+        if not isinstance(admin, InlineModelAdmin) or hasattr(admin.model, f):
+            yield f
 
-        for f in flatten_fieldsets(admin.get_fieldsets(request, obj)):
-            # skip calculated fields on inlines
-            if not isinstance(admin, InlineModelAdmin) or hasattr(admin.model, f):
-                yield f
 
-    def visible(model_admin, request):
-        if model_admin.has_change_permission(request):
-            return True
-        if hasattr(model_admin, "has_view_permission"):
-            return model_admin.has_view_permission(request)
+def _visible(request, model_admin):
+    if model_admin.has_change_permission(request):
+        return True
+    if hasattr(model_admin, "has_view_permission"):
+        return model_admin.has_view_permission(request)
+    else:
+        return False  # pragma: no cover  Django < 2.1
+
+
+def _get_inlines(request, model, model_admin):
+    # these are already filtered for access
+    for inline in model_admin.get_inline_instances(request):
+        try:
+            fk_field = _get_foreign_key(model, inline.model, inline.fk_name)
+        except Exception:
+            pass  # ignore things like GenericInlineModelAdmin
         else:
-            return False  # pragma: no cover  Django < 2.1
+            yield inline, fk_field
+
+
+def _get_model_admin_fields(request, model_admin):
+    res = set(_from_fieldsets(request, model_admin))
+    res.update(model_admin.get_list_display(request))
+    res.add(_OPEN_IN_ADMIN)
+    return res
+
+
+def _get_inline_admin_fields(request, inline, fk_field):
+    res = set(_from_fieldsets(request, inline))
+    res.add(fk_field.name)
+    return res
+
+
+def _clean_admin_fields(fields):
+    # we always have id and never pk
+    fields.add("id")
+    fields.discard("pk")
+    fields.discard("__str__")
+    return fields
 
+
+def _get_all_admin_fields(request):
     all_admin_fields = defaultdict(set)
     model_admins = {}
-    for model, model_admin in site._registry.items():
-        model_admins[model] = model_admin
-        if visible(model_admin, request):
-            all_admin_fields[model].update(from_fieldsets(model_admin, True))
-            all_admin_fields[model].update(model_admin.get_list_display(request))
-            all_admin_fields[model].add(_OPEN_IN_ADMIN)
-
-            # check the inlines, these are already filtered for access
-            for inline in model_admin.get_inline_instances(request):
-                try:
-                    fk_field = _get_foreign_key(model, inline.model, inline.fk_name)
-                except Exception:
-                    pass  # ignore things like GenericInlineModelAdmin
-                else:
+    with query_context(request) as request:
+        for model, model_admin in site._registry.items():
+            model_admins[model] = model_admin
+            if _visible(request, model_admin):
+                all_admin_fields[model].update(
+                    _get_model_admin_fields(request, model_admin)
+                )
+
+                for inline, fk_field in _get_inlines(request, model, model_admin):
                     if inline.model not in model_admins:  # pragma: no branch
                         model_admins[inline.model] = inline
-                    all_admin_fields[inline.model].update(from_fieldsets(inline, False))
-                    all_admin_fields[inline.model].add(fk_field.name)
+                    all_admin_fields[inline.model].update(
+                        _get_inline_admin_fields(request, inline, fk_field)
+                    )
 
-    # we always have id and never pk
     for fields in all_admin_fields.values():
-        fields.add("id")
-        fields.discard("pk")
-        fields.discard("__str__")
+        _clean_admin_fields(fields)
 
     return model_admins, all_admin_fields
 
 
+def _has_dynamic_inlines(model_admin):
+    for name in ["get_inlines", "get_inline_instances"]:
+        method = getattr(type(model_admin), name, None)
+        if method is not getattr(ModelAdmin, name, None):
+            return True
+    return False
+
+
+class _LazyAdminFields:
+    """
+    The per model admin fields from _get_all_admin_fields, calculated on demand.
+
+    Only the admins for the requested model, and any admins that have it as an
+    inline, are consulted.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._inlines = {}
+        self._visible = {}
+
+        # the static inline structure, we check it properly on use
+        self.parents = defaultdict(list)
+        self.dynamic = []
+        for model, model_admin in site._registry.items():
+            if _has_dynamic_inlines(model_admin):
+                self.dynamic.append(model)
+            else:
+                for inline in model_admin.inlines:
+                    self.parents[inline.model].append(model)
+        self.models = list(site._registry) + [
+            m for m in self.parents if m not in site._registry
+        ]
+
+    def _is_visible(self, model):
+        if model not in self._visible:
+            with query_context(self.request) as request:
+                self._visible[model] = _visible(request, site._registry[model])
+        return self._visible[model]
+
+    def _get_inlines(self, model):
+        if model not in self._inlines:
+            if self._is_visible(model):
+                with query_context(self.request) as request:
+                    self._inlines[model] = list(
+                        _get_inlines(request, model, site._registry[model])
+                    )
+            else:
+                self._inlines[model] = []
+        return self._inlines[model]
+
+    def _get_parent_inlines(self, model):
+        parents = set(self.parents.get(model, [])) | set(self.dynamic)
+        for parent in site._registry:
+            if parent in parents:
+                for inline, fk_field in self._get_inlines(parent):
+                    if inline.model is model:
+                        yield inline, fk_field
+
+    def __contains__(self, model):
+        if model in site._registry and self._is_visible(model):
+            return True
+        return any(self._get_parent_inlines(model))
+
+    def get_admin(self, model):
+        if model in site._registry:
+            return site._registry[model]
+        for inline, fk_field in self._get_parent_inlines(model):  # pragma: no branch
+            return inline
+
+    def __getitem__(self, model):
+        fields = set()
+        with query_context(self.request) as request:
+            if model in site._registry and self._is_visible(model):
+                fields.update(_get_model_admin_fields(request, site._registry[model]))
+            for inline, fk_field in self._get_parent_inlines(model):
+                fields.update(_get_inline_admin_fields(request, inline, fk_field))
+        return _clean_admin_fields(fields)
+
+
+class LazyModels(Mapping):
+    """
+    A lazy stand in for the result of get_models.
+
+    OrmModels are built on first access and memoized, so binding a query only
+    introspects the models it actually touches.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._admin_fields = _LazyAdminFields(request)
+        self._models = {get_model_name(m): m for m in self._admin_fields.models}
+        self._orm_models = {}
+
+    def _get_model(self, model_name):
+        if model_name not in self._models:
+            # inlines we can only find by asking the admins that add them
+            for parent in self._admin_fields.dynamic:
+                for inline, fk_field in self._admin_fields._get_inlines(parent):
+                    self._models.setdefault(get_model_name(inline.model), inline.model)
+        model = self._models.get(model_name)
+        if model is not None and model in self._admin_fields:
+            return model
+        return None
+
+    def __getitem__(self, model_name):
+        if model_name not in self._orm_models:
+            if model_name in TYPES:
+                self._orm_models[model_name] = _get_fields_for_type(TYPES[model_name])
+            else:
+                model = self._get_model(model_name)
+                if model is None:
+                    raise KeyError(model_name)
+                self._orm_models[model_name] = _get_fields_for_model(
+                    self.request,
+                    model,
+                    self._admin_fields.get_admin(model),
+                    self._admin_fields,
+                )
+        return self._orm_models[model_name]
+
+    def __contains__(self, model_name):
+        return model_name in TYPES or self._get_model(model_name) is not None
+
+    def __iter__(self):
+        self._get_model(None)  # find all the dynamic inlines
+        for model_name in list(self._models):
+            if model_name in self:
+                yield model_name
+        yield from TYPES
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
 def _get_calculated_field(request, field_name, model_name, model, admin, model_fields):
     field_func = getattr(admin, field_name, None)
     if isinstance(field_func, AnnotationDescriptor):
@@ -268,7 +446,84 @@ def _get_fields_for_type(type_):
     return OrmModel({**aggregates, **functions})
 
 
-def get_models(request):
+_STREAM_CHUNK_SIZE = 2000
+
+_SCHEMA_GENERATION_KEY = "data_browser_schema_generation"
+# permission fingerprint -> models, least recently used first
+_schema_cache = OrderedDict()
+_schema_cache_lock = threading.Lock()
+_schema_cache_generation = None
+schema_cache_stats = Counter(hits=0, misses=0)
+
+_RESULT_CACHE_PREFIX = "data_browser_results"
+result_cache_stats = Counter(hits=0, misses=0, bypassed=0, oversized=0)
+
+
+def _get_registry_fingerprint():
+    return sorted(
+        (get_model_name(model), type(admin).__module__, type(admin).__qualname__)
+        for model, admin in site._registry.items()
+    )
+
+
+def _get_permission_fingerprint(request):
+    user = request.user
+    data = [
+        user.is_active,
+        user.is_staff,
+        user.is_superuser,
+        sorted(user.get_all_permissions()),
+        _get_registry_fingerprint(),
+    ]
+    return hashlib.sha1(repr(data).encode()).hexdigest()
+
+
+def _get_schema_generation():
+    generation = cache.get(_SCHEMA_GENERATION_KEY)
+    if generation is None:
+        cache.add(_SCHEMA_GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(_SCHEMA_GENERATION_KEY)
+    return generation
+
+
+def clear_schema_cache(**kwargs):
+    global _schema_cache_generation
+    with _schema_cache_lock:
+        _schema_cache.clear()
+        _schema_cache_generation = None
+    if settings.DATA_BROWSER_SCHEMA_CACHE:
+        cache.set(_SCHEMA_GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def get_models(request, lazy=False):
+    if not settings.DATA_BROWSER_SCHEMA_CACHE:
+        return LazyModels(request) if lazy else _get_models(request)
+
+    global _schema_cache_generation
+    generation = _get_schema_generation()
+    key = _get_permission_fingerprint(request)
+    with _schema_cache_lock:
+        if _schema_cache_generation != generation:
+            _schema_cache.clear()
+            _schema_cache_generation = generation
+        orm_models = _schema_cache.get(key)
+        if orm_models is not None:
+            _schema_cache.move_to_end(key)
+            schema_cache_stats["hits"] += 1
+            return orm_models
+        schema_cache_stats["misses"] += 1
+
+    # build outside the lock, it's slow and other permission sets can carry on
+    orm_models = _get_models(request)
+    with _schema_cache_lock:
+        if _schema_cache_generation == generation:
+            _schema_cache[key] = orm_models
+            while len(_schema_cache) > settings.DATA_BROWSER_SCHEMA_CACHE_SIZE:
+                _schema_cache.popitem(last=False)
+    return orm_models
+
+
+def _get_models(request):
     model_admins, admin_fields = _get_all_admin_fields(request)
     models = {
         get_model_name(model): _get_fields_for_model(
@@ -355,7 +610,14 @@ def _rows_sub_query(bound_query):
     )
 
 
-def _get_results(request, bound_query, orm_models):
+def _sorts_first(bound_query, fields):
+    # are the sorted members of fields ahead of all other sorts
+    path_strs = {f.path_str for f in fields if f.direction}
+    leading = bound_query.sort_fields[: len(path_strs)]
+    return all(f.path_str in path_strs for f in leading)
+
+
+def _get_filtered_queryset(request, bound_query, orm_models):
     all_fields = {f.queryset_path: f for f in bound_query.bound_fields}
     all_fields.update({f.queryset_path: f for f in bound_query.bound_filters})
 
@@ -371,31 +633,29 @@ def _get_results(request, bound_query, orm_models):
         if filter_.orm_bound_field.filter_:
             qs = _filter(qs, filter_, filter_.orm_bound_field.queryset_path)
 
-    # nothing to group on, early out with an aggregate
-    if not any(f.group_by for f in bound_query.bound_fields):
-        return [
-            qs.aggregate(
-                **dict(
-                    field.aggregate_clause
-                    for field in bound_query.bound_fields + bound_query.bound_filters
-                    if field.aggregate_clause
-                )
-            )
-        ]
+    return qs
 
+
+def _get_aggregate_clauses(bound_query):
+    return dict(
+        field.aggregate_clause
+        for field in bound_query.bound_fields + bound_query.bound_filters
+        if field.aggregate_clause
+    )
+
+
+def _is_aggregate_only(bound_query):
+    return not any(f.group_by for f in bound_query.bound_fields)
+
+
+def _get_grouped_queryset(qs, bound_query):
     # group by
     qs = qs.values(
         *[field.queryset_path for field in bound_query.bound_fields if field.group_by]
     ).distinct()
 
     # aggregates
-    qs = qs.annotate(
-        **dict(
-            field.aggregate_clause
-            for field in bound_query.bound_fields + bound_query.bound_filters
-            if field.aggregate_clause
-        )
-    )
+    qs = qs.annotate(**_get_aggregate_clauses(bound_query))
 
     # having, aka filter aggregate fields
     for filter_ in bound_query.valid_filters:
@@ -411,27 +671,327 @@ def _get_results(request, bound_query, orm_models):
             sort_fields.append(f"-{field.orm_bound_field.queryset_path}")
     qs = qs.order_by(*sort_fields)
 
-    return list(qs[: bound_query.limit])
+    return qs[: bound_query.limit]
 
 
-def admin_get_queryset(admin, request, fields=()):
-    request.data_browser = {"calculated_fields": set(fields), "fields": set(fields)}
-    return admin.get_queryset(request)
+class QueryTimeout(Exception):
+    pass
 
 
-def get_results(request, bound_query, orm_models):
-    if not bound_query.fields:
-        return {"rows": [], "cols": [], "body": []}
+# how many SQLite VM instructions to run between checks of the deadline
+_SQLITE_PROGRESS_OPCODES = 1000
 
-    if bound_query.bound_col_fields and bound_query.bound_row_fields:
-        res = _get_results(request, bound_query, orm_models)
-        rows_res = _get_results(request, _rows_sub_query(bound_query), orm_models)
-        cols_res = _get_results(request, _cols_sub_query(bound_query), orm_models)
-    else:
-        res = _get_results(request, bound_query, orm_models)
-        rows_res = res
-        cols_res = res
 
+def _run_sql(connection, sql, params=()):  # pragma: postgres
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+@contextmanager
+def _query_timeout(using):
+    """Abort queries run on the connection after DATA_BROWSER_QUERY_TIMEOUT."""
+    timeout = settings.DATA_BROWSER_QUERY_TIMEOUT
+    connection = db.connections[using]
+    if not timeout or connection.vendor not in ["sqlite", "postgresql", "mysql"]:
+        yield
+        return
+
+    deadline = time.monotonic() + timeout
+    connection.ensure_connection()
+    if connection.vendor == "sqlite":  # pragma: sqlite
+        # a true return from the handler interrupts the query
+        connection.connection.set_progress_handler(
+            lambda: time.monotonic() > deadline, _SQLITE_PROGRESS_OPCODES
+        )
+    elif connection.vendor == "postgresql":  # pragma: postgres
+        _run_sql(connection, "SET statement_timeout = %s", [int(timeout * 1000)])
+    elif connection.mysql_is_mariadb:  # pragma: no cover
+        _run_sql(connection, "SET SESSION max_statement_time = %s", [timeout])
+    else:  # pragma: no cover
+        _run_sql(
+            connection, "SET SESSION max_execution_time = %s", [int(timeout * 1000)]
+        )
+
+    try:
+        yield
+    except db.DatabaseError as e:
+        if time.monotonic() < deadline:
+            raise
+        raise QueryTimeout(f"Query timed out after {timeout} seconds.") from e
+    finally:
+        try:
+            if connection.vendor == "sqlite":  # pragma: sqlite
+                connection.connection.set_progress_handler(None, 0)
+            elif connection.vendor == "postgresql":  # pragma: postgres
+                _run_sql(connection, "SET statement_timeout TO DEFAULT")
+            elif connection.mysql_is_mariadb:  # pragma: no cover
+                _run_sql(connection, "SET SESSION max_statement_time = DEFAULT")
+            else:  # pragma: no cover
+                _run_sql(connection, "SET SESSION max_execution_time = DEFAULT")
+        except db.DatabaseError:  # pragma: no cover
+            pass  # the transaction failed, rolling it back will undo the SET
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+def _cancel_query(connection):
+    # called from another thread, only thread safe calls here
+    if connection.vendor == "sqlite":  # pragma: sqlite
+        connection.connection.interrupt()
+    elif connection.vendor == "postgresql":  # pragma: postgres
+        connection.connection.cancel()
+    elif connection.vendor == "mysql":  # pragma: no cover
+        # KILL QUERY has to come from another connection
+        killer = connection.get_new_connection(connection.get_connection_params())
+        try:
+            _run_sql_raw(killer, f"KILL QUERY {connection.connection.thread_id()}")
+        finally:
+            killer.close()
+
+
+def _run_sql_raw(raw_connection, sql):  # pragma: no cover
+    cursor = raw_connection.cursor()
+    try:
+        cursor.execute(sql)
+    finally:
+        cursor.close()
+
+
+class CancelScope:
+    """
+    The connections running queries for a request, so they can be cancelled.
+
+    Queries run while the scope is current register their connection with it,
+    cancel can then be called from any thread to abort them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = set()
+        self.cancelled = False
+
+    def cancel(self):
+        # hold the lock so connections can't leave running and start on
+        # something else while they are being cancelled
+        with self._lock:
+            self.cancelled = True
+            for connection in self._connections:
+                try:
+                    _cancel_query(connection)
+                except Exception:  # e.g. the connection has been closed
+                    logging.getLogger(__name__).debug(
+                        "Failed to cancel query", exc_info=True
+                    )
+
+    @contextmanager
+    def running(self, connection):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled("Query cancelled.")
+            self._connections.add(connection)
+        try:
+            yield
+        except db.DatabaseError as e:
+            if not self.cancelled:
+                raise
+            raise QueryCancelled("Query cancelled.") from e
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+
+
+cancel_scope = contextvars.ContextVar("data_browser_cancel_scope", default=None)
+
+
+@contextmanager
+def _cancellable(using):
+    scope = cancel_scope.get()
+    if scope is None:
+        yield
+        return
+
+    connection = db.connections[using]
+    connection.ensure_connection()
+    with scope.running(connection):
+        yield
+
+
+class QueryTooExpensive(Exception):
+    def __init__(self, rows):
+        super().__init__(
+            f"This query is estimated to read {rows} rows, more than the"
+            f" {settings.DATA_BROWSER_QUERY_COST_LIMIT} allowed."
+        )
+        self.rows = rows
+
+
+# whether the user has confirmed they want to run queries over the cost limit
+cost_confirmed = contextvars.ContextVar("data_browser_cost_confirmed", default=False)
+
+
+@contextmanager
+def confirm_cost():
+    """Allow queries over the cost limit, for refreshes that run off peak."""
+    token = cost_confirmed.set(True)
+    try:
+        yield
+    finally:
+        cost_confirmed.reset(token)
+
+
+_SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\S+)(?: AS (\S+))?")
+
+
+def _explain_sql(connection, prefix, qs):
+    sql, params = qs.query.get_compiler(qs.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {sql}", params)
+        return [col[0] for col in cursor.description], cursor.fetchall()
+
+
+def _iter_plan(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _iter_plan(child)
+
+
+def _get_seq_scans(plan):
+    return {
+        n["Relation Name"] for n in _iter_plan(plan) if n["Node Type"] == "Seq Scan"
+    }
+
+
+def _get_plan_rows_read(plan, table_rows):
+    """
+    The most rows any node of a Postgres JSON plan reads.
+
+    Plan Rows is what a node returns after filtering, so sequential scans
+    count the whole table, table_rows maps relation names to their reltuples.
+    """
+    rows = 0
+    for node in _iter_plan(plan):
+        rows = max(rows, node["Plan Rows"])
+        if node["Node Type"] == "Seq Scan":
+            rows = max(rows, table_rows.get(node["Relation Name"], 0))
+    return int(rows)
+
+
+def _get_table_rows(connection, tables):  # pragma: postgres
+    table_rows = {}
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                [connection.ops.quote_name(table)],
+            )
+            row = cursor.fetchone()
+            table_rows[table] = row[0] if row else 0
+    return table_rows
+
+
+def _get_sqlite_table_rows(connection, table):  # pragma: sqlite
+    # rowids are allocated in order so the largest bounds the table's size
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}")
+            return cursor.fetchone()[0] or 0
+    except db.DatabaseError:
+        return None  # views and WITHOUT ROWID tables have no rowid
+
+
+def _estimate_rows(qs):
+    """
+    The backend's estimate of the most rows any step of the query reads.
+
+    Full table scans count every row in the table whatever the filters. SQLite
+    has no row estimates so it's just the size of the largest table the query
+    scans in full. None when the backend can't estimate.
+    """
+    connection = db.connections[qs.db]
+    try:
+        if connection.vendor == "sqlite":  # pragma: sqlite
+            _, plan = _explain_sql(connection, "EXPLAIN QUERY PLAN", qs)
+            # compiling the query fills in the aliases
+            tables = {
+                alias: join.table_name for alias, join in qs.query.alias_map.items()
+            }
+            rows = 0
+            for *_, detail in plan:
+                match = _SQLITE_SCAN.match(detail)
+                table = match and tables.get(match.group(2) or match.group(1))
+                if table:
+                    table_rows = _get_sqlite_table_rows(connection, table)
+                    if table_rows is None:
+                        return None
+                    rows = max(rows, table_rows)
+            return rows
+        elif connection.vendor == "postgresql":  # pragma: postgres
+            _, [[plan]] = _explain_sql(connection, "EXPLAIN (FORMAT JSON)", qs)
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plan = plan[0]["Plan"]
+            table_rows = _get_table_rows(connection, _get_seq_scans(plan))
+            return _get_plan_rows_read(plan, table_rows)
+        elif connection.vendor == "mysql":  # pragma: no cover
+            cols, plan = _explain_sql(connection, "EXPLAIN", qs)
+            return max(row[cols.index("rows")] or 0 for row in plan)
+        else:  # pragma: no cover
+            return None
+    except EmptyResultSet:
+        return 0  # the query won't touch the database
+
+
+def _check_query_cost(qs):
+    limit = settings.DATA_BROWSER_QUERY_COST_LIMIT
+    if not limit or cost_confirmed.get():
+        return
+
+    rows = _estimate_rows(qs)
+    if rows is not None and rows > limit:
+        raise QueryTooExpensive(rows)
+
+
+def _get_results(request, bound_query, orm_models):
+    qs = _get_filtered_queryset(request, bound_query, orm_models)
+    _check_query_cost(qs)
+
+    with _query_timeout(qs.db), _cancellable(qs.db):
+        with phase("sql", qs.db, bound_query) as sql:
+            # nothing to group on, early out with an aggregate
+            if _is_aggregate_only(bound_query):
+                res = [qs.aggregate(**_get_aggregate_clauses(bound_query))]
+            else:
+                res = list(_get_grouped_queryset(qs, bound_query))
+            sql.rows = len(res)
+    return res
+
+
+def _iter_results(request, bound_query, orm_models, chunk_size):
+    qs = _get_filtered_queryset(request, bound_query, orm_models)
+    # check now, once the response starts streaming it's too late for an error
+    _check_query_cost(qs)
+
+    def rows():
+        # the timeout covers reading the whole stream
+        with _query_timeout(qs.db), _cancellable(qs.db):
+            if _is_aggregate_only(bound_query):
+                yield qs.aggregate(**_get_aggregate_clauses(bound_query))
+            else:
+                yield from _get_grouped_queryset(qs, bound_query).iterator(
+                    chunk_size=chunk_size
+                )
+
+    return rows()
+
+
+def admin_get_queryset(admin, request, fields=()):
+    with query_context(request, fields) as request:
+        return admin.get_queryset(request)
+
+
+def _load_calculated_objects(request, bound_query, orm_models, res):
     # gather up all the objects to fetch for calculated fields
     to_load = defaultdict(set)
     loading_for = defaultdict(set)
@@ -446,67 +1006,479 @@ def get_results(request, bound_query, orm_models):
     cache = {}
     for model_name, pks in to_load.items():
         admin = orm_models[model_name].admin
-        cache[model_name] = admin_get_queryset(
-            admin, request, loading_for[model_name]
-        ).in_bulk(pks)
+        qs = admin_get_queryset(admin, request, loading_for[model_name])
+        with phase("calculated", qs.db, bound_query) as calculated:
+            cache[model_name] = qs.in_bulk(pks)
+            calculated.rows = len(cache[model_name])
+    return cache
+
+
+def _format_row(fields, row, cache):
+    res_row = {}
+    for field in fields:
+        value = row[field.queryset_path]
+        if field.model_name:
+            value = cache[field.model_name].get(value)
+        res_row[field.path_str] = field.format(value)
+    return res_row
+
+
+def _get_fields(row, fields):
+    res = []
+    for field in fields:
+        v = row[field.queryset_path]
+        if isinstance(v, list):  # pragma: postgres
+            v = tuple(v)
+        try:
+            hash(v)
+        except TypeError:
+            v = json.dumps(v)
+        res.append((field.queryset_path, v))
+    return tuple(res)
+
+
+def _get_result_cache_key(request, bound_query):
+    fields = [
+        (f.path_str, f.pivoted, f.direction, f.priority) for f in bound_query.fields
+    ]
+    filters = sorted((f.path_str, f.lookup, f.value) for f in bound_query.filters)
+    data = [
+        version,
+        bound_query.model_name,
+        fields,
+        filters,
+        bound_query.limit,
+        timezone.get_current_timezone_name(),
+        _get_permission_fingerprint(request),
+    ]
+    return f"{_RESULT_CACHE_PREFIX}:{hashlib.sha1(repr(data).encode()).hexdigest()}"
+
+
+def _bypass_result_cache(request):
+    directives = [
+        directive.strip().lower()
+        for value in [request.META.get("HTTP_CACHE_CONTROL"), request.GET.get("cache")]
+        if value
+        for directive in value.split(",")
+    ]
+    return "no-cache" in directives or "no-store" in directives
+
+
+def get_sparse_results(request, bound_query, orm_models):
+    """
+    The results of a query with the pivot body as a sparse mapping.
+
+    Rows and cols are as per get_results, cells maps (row index, col index) to
+    the data for only the populated cells of the pivot.
+
+    With DATA_BROWSER_RESULT_CACHE_TTL set the results are cached in the Django
+    cache, a no-cache Cache-Control header or cache parameter skips the lookup.
+    """
+    if not bound_query.fields:
+        return {"rows": [], "cols": [], "cells": {}, "length": 0}
+
+    ttl = settings.DATA_BROWSER_RESULT_CACHE_TTL
+    if not ttl:
+        return _get_sparse_results(request, bound_query, orm_models)
+
+    key = _get_result_cache_key(request, bound_query)
+    if _bypass_result_cache(request):
+        result_cache_stats["bypassed"] += 1
+    else:
+        pickled = cache.get(key)
+        if pickled is not None:
+            result_cache_stats["hits"] += 1
+            results = pickle.loads(pickled)
+            note(cache_hit=True, rows=len(results["rows"]), cols=len(results["cols"]))
+            return results
+        result_cache_stats["misses"] += 1
+    note(cache_hit=False)
+
+    results = _get_sparse_results(request, bound_query, orm_models)
+    pickled = pickle.dumps(results, pickle.HIGHEST_PROTOCOL)
+    if len(pickled) <= settings.DATA_BROWSER_RESULT_MAX_BYTES:
+        cache.set(key, pickled, ttl)
+    else:
+        result_cache_stats["oversized"] += 1
+    return results
+
+
+_pivot_executor = ThreadPool("DATA_BROWSER_PIVOT_THREADS", "data_browser_pivot")
+
+
+def _get_pivot_executor():
+    return _pivot_executor.get()
+
+
+def _on_own_connection(func, *args):
+    # pool threads get their own connections, don't leave them open
+    try:
+        return func(*args)
+    finally:
+        db.connections.close_all()
+
+
+def _run_now(func, *args):
+    future = Future()
+    future.set_result(func(*args))
+    return future
+
+
+def _get_pivot_results(request, bound_query, orm_models):
+    if settings.DATA_BROWSER_PIVOT_THREADS:
+        executor = _get_pivot_executor()
+
+        def run(query):
+            return executor.submit(
+                contextvars.copy_context().run,
+                _on_own_connection,
+                _get_results,
+                request,
+                query,
+                orm_models,
+            )
+
+    else:
+
+        def run(query):
+            return _run_now(_get_results, request, query, orm_models)
+
+    main = run(bound_query)
+    # sub queries that can't be read off the main query can start straight away
+    rows = cols = None
+    if not _sorts_first(bound_query, bound_query.row_fields):
+        rows = run(_rows_sub_query(bound_query))
+    if not _sorts_first(bound_query, bound_query.col_fields):
+        cols = run(_cols_sub_query(bound_query))
+
+    # the rest are only needed when the limit cut something off
+    res = main.result()
+    complete = len(res) < bound_query.limit
+    if rows is None and not complete:
+        rows = run(_rows_sub_query(bound_query))
+    if cols is None and not complete:
+        cols = run(_cols_sub_query(bound_query))
+
+    rows_res = res if rows is None else rows.result()
+    cols_res = res if cols is None else cols.result()
+    return res, rows_res, cols_res
+
+
+def _get_sparse_results(request, bound_query, orm_models):
+    if bound_query.bound_col_fields and bound_query.bound_row_fields:
+        res, rows_res, cols_res = _get_pivot_results(request, bound_query, orm_models)
+    else:
+        res = _get_results(request, bound_query, orm_models)
+        rows_res = res
+        cols_res = res
+
+    cache = _load_calculated_objects(request, bound_query, orm_models, res)
 
-    # dump out the results
     def format_table(fields, data):
-        results = []
-        for row in data:
-            if row:
-                res_row = {}
-                for field in fields:
-                    value = row[field.queryset_path]
-                    if field.model_name:
-                        value = cache[field.model_name].get(value)
-                    res_row[field.path_str] = field.format(value)
-                results.append(res_row)
-            else:
-                results.append(row)
-        return results
-
-    def get_fields(row, fields):
-        res = []
-        for field in fields:
-            v = row[field.queryset_path]
-            if isinstance(v, list):  # pragma: postgres
-                v = tuple(v)
-            try:
-                hash(v)
-            except TypeError:
-                v = json.dumps(v)
-            res.append((field.queryset_path, v))
-        return tuple(res)
-
-    col_keys = {}
-    for row in cols_res:
-        col_keys[get_fields(row, bound_query.bound_col_fields)] = None
-
-    row_keys = {}
-    for row in rows_res:
-        row_keys[get_fields(row, bound_query.bound_row_fields)] = None
-
-    data = defaultdict(dict)
-    for row in res:
-        row_key = get_fields(row, bound_query.bound_row_fields)
-        col_key = get_fields(row, bound_query.bound_col_fields)
-        data[row_key][col_key] = dict(get_fields(row, bound_query.bound_data_fields))
+        return [_format_row(fields, row, cache) if row else row for row in data]
 
-    body = []
-    for col_key in col_keys:
-        table = []
-        for row_key in row_keys:
-            table.append(data[row_key].get(col_key, None))
-        body.append(format_table(bound_query.bound_data_fields, table))
+    with phase("pivot", bound_query=bound_query):
+        col_keys = {}
+        for row in cols_res:
+            col_keys.setdefault(
+                _get_fields(row, bound_query.bound_col_fields), len(col_keys)
+            )
 
-    return {
-        "rows": format_table(
+        row_keys = {}
+        for row in rows_res:
+            row_keys.setdefault(
+                _get_fields(row, bound_query.bound_row_fields), len(row_keys)
+            )
+
+        cells = {}
+        for row in res:
+            row_key = _get_fields(row, bound_query.bound_row_fields)
+            col_key = _get_fields(row, bound_query.bound_col_fields)
+            if row_key in row_keys and col_key in col_keys:
+                cell = dict(_get_fields(row, bound_query.bound_data_fields))
+                if cell:
+                    cell = _format_row(bound_query.bound_data_fields, cell, cache)
+                cells[row_keys[row_key], col_keys[col_key]] = cell
+
+    with phase("format", bound_query=bound_query):
+        rows = format_table(
             bound_query.bound_row_fields, [dict(row) for row in row_keys]
-        ),
-        "cols": format_table(
+        )
+        cols = format_table(
             bound_query.bound_col_fields, [dict(col) for col in col_keys]
-        ),
+        )
+    note(rows=len(rows), cols=len(cols))
+    return {"rows": rows, "cols": cols, "cells": cells, "length": len(res)}
+
+
+def get_results(request, bound_query, orm_models):
+    if not bound_query.fields:
+        return {"rows": [], "cols": [], "body": []}
+
+    return densify_results(get_sparse_results(request, bound_query, orm_models))
+
+
+def densify_results(results):
+    """
+    Convert the output of get_sparse_results into that of get_results.
+    """
+    cells = results["cells"]
+    with phase("pivot"):
+        body = [
+            [cells.get((row, col)) for row in range(len(results["rows"]))]
+            for col in range(len(results["cols"]))
+        ]
+    return {
+        "rows": results["rows"],
+        "cols": results["cols"],
         "body": body,
-        "length": len(res),
+        "length": results["length"],
+    }
+
+
+def get_columnar_results(request, bound_query, orm_models):
+    """
+    The same data as get_results but with one array per field instead of one
+    dict per row, col and cell. The header lists the fields in BoundQuery order
+    and the counts, which can't be recovered from the arrays when an axis has
+    no fields.
+    """
+    results = get_sparse_results(request, bound_query, orm_models)
+    rows, cols, cells = results["rows"], results["cols"], results["cells"]
+    row_fields = [f.path_str for f in bound_query.row_fields]
+    col_fields = [f.path_str for f in bound_query.col_fields]
+    data_fields = [f.path_str for f in bound_query.data_fields]
+
+    body = []
+    for col_index in range(len(cols)):
+        col_cells = [
+            cells.get((row_index, col_index)) for row_index in range(len(rows))
+        ]
+        body.append(
+            [[cell[f] if cell else None for cell in col_cells] for f in data_fields]
+        )
+
+    return {
+        "header": {
+            "rows": row_fields,
+            "cols": col_fields,
+            "body": data_fields,
+            "rowCount": len(rows),
+            "colCount": len(cols),
+        },
+        "rows": [[row[f] for row in rows] for f in row_fields],
+        "cols": [[col[f] for col in cols] for f in col_fields],
+        "body": body,
+        "length": results["length"],
+    }
+
+
+def get_watermark(request, bound_query, orm_models, field_name):
+    """
+    The max of a number or datetime field of the root model over the rows the
+    query covers, formatted for use as a filter value.
+    """
+    orm_field = orm_models[bound_query.model_name].fields.get(field_name)
+    if not (
+        isinstance(orm_field, OrmConcreteField)
+        and orm_field.type_ in [NumberType, DateTimeType]
+    ):
+        raise ValueError(f"{field_name} can't be used as a watermark")
+    orm_bound_field = orm_field.bind(None)
+
+    qs = _get_filtered_queryset(request, bound_query, orm_models)
+    value = qs.aggregate(_watermark=models.Max(orm_bound_field.queryset_path))
+    return orm_bound_field.type_.format(value["_watermark"])
+
+
+def _ignoring_none(func):
+    def merge(a, b):
+        if a is None or b is None:
+            return b if a is None else a
+        return func(a, b)
+
+    return merge
+
+
+_MERGE_FUNCS = {
+    "count": _ignoring_none(operator.add),
+    "sum": _ignoring_none(operator.add),
+    "min": _ignoring_none(min),
+    "max": _ignoring_none(max),
+}
+
+
+def can_merge_results(bound_query, orm_models):
+    """
+    Whether the results of this query over two disjoint sets of rows can be
+    combined with merge_results.
+    """
+    if bound_query.col_fields:
+        return False
+
+    for filter_ in bound_query.valid_filters:
+        if filter_.orm_bound_field.having:
+            return False
+        if filter_.value.lower().strip() in ["now", "today"]:
+            return False
+
+    pk = orm_models[bound_query.model_name].admin.model._meta.pk.name
+    for field in bound_query.fields:
+        orm_bound_field = field.orm_bound_field
+        if orm_bound_field.group_by:
+            continue
+        # only aggregates over the root model, the others would need the old rows
+        if len(field.path) != 2 or not orm_bound_field.aggregate_clause:
+            return False
+        if orm_bound_field.aggregate not in _MERGE_FUNCS:
+            return False
+        # counts are distinct so only the pk is safe to sum
+        if orm_bound_field.aggregate == "count" and field.path[0] != pk:
+            return False
+
+    for field in bound_query.sort_fields:
+        if not issubclass(field.orm_bound_field.type_, NumberType):
+            return False
+
+    return True
+
+
+def merge_results(bound_query, old, new):
+    """
+    Combine two outputs of get_sparse_results for a query that passes
+    can_merge_results. Returns None when the combined result would need to be
+    truncated, as the rows lost to the limit can't be recovered.
+    """
+    group_fields = [
+        f.path_str for f in bound_query.fields if f.orm_bound_field.group_by
+    ]
+    agg_fields = {
+        f.path_str: _MERGE_FUNCS[f.orm_bound_field.aggregate]
+        for f in bound_query.fields
+        if not f.orm_bound_field.group_by
     }
+
+    if old["length"] >= bound_query.limit or new["length"] >= bound_query.limit:
+        return None
+
+    rows = [dict(row) for row in old["rows"]]
+    index = {tuple(row[f] for f in group_fields): row for row in rows}
+    for new_row in new["rows"]:
+        key = tuple(new_row[f] for f in group_fields)
+        if key in index:
+            row = index[key]
+            for f, merge in agg_fields.items():
+                row[f] = merge(row[f], new_row[f])
+        else:
+            index[key] = dict(new_row)
+            rows.append(index[key])
+
+    if len(rows) >= bound_query.limit:
+        return None
+
+    for field in reversed(bound_query.sort_fields):
+        values = [row[field.path_str] for row in rows]
+        if None in values:
+            return None  # backends differ on where nulls sort
+        rows.sort(key=lambda row: row[field.path_str], reverse=field.direction == DSC)
+
+    return {
+        "rows": rows,
+        "cols": old["cols"] or new["cols"],
+        "cells": {(i, 0): {} for i in range(len(rows))},
+        "length": len(rows),
+    }
+
+
+def iter_results(request, bound_query, orm_models, chunk_size=None):
+    """
+    The rows of an unpivoted query as they would appear in get_results.
+
+    The rows are fetched, calculated fields loaded and formatted a chunk at a
+    time so memory use doesn't depend on the query limit.
+    """
+    assert not bound_query.col_fields
+    if not bound_query.fields:
+        return iter([])
+
+    chunk_size = chunk_size or _STREAM_CHUNK_SIZE
+    res = _iter_results(request, bound_query, orm_models, chunk_size)
+    return _format_chunks(request, bound_query, orm_models, res, chunk_size)
+
+
+def _format_chunks(request, bound_query, orm_models, res, chunk_size):
+    fields = bound_query.bound_row_fields
+    while True:
+        chunk = list(itertools.islice(res, chunk_size))
+        if not chunk:
+            break
+        cache = _load_calculated_objects(request, bound_query, orm_models, chunk)
+        for row in chunk:
+            yield _format_row(fields, dict(_get_fields(row, fields)), cache)
+
+
+def _get_explain_queryset(request, bound_query, orm_models):
+    qs = _get_filtered_queryset(request, bound_query, orm_models)
+    if not _is_aggregate_only(bound_query):
+        return _get_grouped_queryset(qs, bound_query)
+
+    # the same sql as qs.aggregate but as a queryset so it can be explained
+    aggregates = _get_aggregate_clauses(bound_query)
+    return (
+        qs.annotate(_ddb_all=models.Value(1, models.IntegerField()))
+        .values("_ddb_all")
+        .annotate(**aggregates)
+        .values(*aggregates)
+    )
+
+
+def _supports_explain_analyze(connection):
+    return connection.vendor == "postgresql" or getattr(
+        connection.features, "supports_explain_analyze", False
+    )
+
+
+def supports_explain():
+    return hasattr(models.QuerySet, "explain")  # Django 2.1+
+
+
+def explain_results(request, bound_query, orm_models, analyze=False):
+    """
+    The database's plan for each query get_results would run.
+
+    Pivots include the row and column sub queries, these only run when the
+    main query is sorted on other fields or hits the limit. With analyze the
+    queries are run on backends that support EXPLAIN ANALYZE. Queries whose
+    filters can't match anything never reach the database and have no plan.
+    """
+    if not bound_query.fields:
+        return {"queries": []}
+
+    queries = {"main": bound_query}
+    if bound_query.bound_col_fields and bound_query.bound_row_fields:
+        queries["rows"] = _rows_sub_query(bound_query)
+        queries["cols"] = _cols_sub_query(bound_query)
+
+    res = []
+    for name, query in queries.items():
+        qs = _get_explain_queryset(request, query, orm_models)
+        try:
+            sql = str(qs.query)
+        except EmptyResultSet:
+            res.append({"name": name, "sql": None, "plan": None, "analyzed": False})
+            continue
+        options = {}
+        if analyze and _supports_explain_analyze(db.connections[qs.db]):
+            options["analyze"] = True  # pragma: postgres
+        with _query_timeout(qs.db), _cancellable(qs.db):
+            with phase("sql", qs.db, query):
+                plan = qs.explain(**options)
+        res.append(
+            {
+                "name": name,
+                "sql": sql,
+                "plan": plan,
+                "analyzed": bool(options),
+            }
+        )
+    return {"queries": res}
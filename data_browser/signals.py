@@ -0,0 +1,15 @@
+from django.dispatch import Signal
+
+# Sent around each phase of a query with a phase argument, one of "get_models",
+# "bind", "sql", "calculated", "pivot", "format" and "serialize".
+# Both get a bound_query argument, which is None until the query is bound.
+phase_started = Signal()
+# Also gets duration in seconds and the number of SQL queries and rows.
+phase_finished = Signal()
+
+# Sent by the query and view endpoints once the response is ready. The arguments
+# are request, view (for public views), model_name, bound_query, media, status,
+# duration, phases (the totals for each phase as in the Server-Timing header),
+# rows, cols and cache_hit. The last three are None when they don't apply,
+# e.g. for streamed responses.
+query_finished = Signal()
@@ -0,0 +1,122 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django import db
+
+from . import signals
+
+_timings = contextvars.ContextVar("data_browser_timings", default=None)
+
+
+def _plural(count, singular, plural):
+    return f"{count} {singular if count == 1 else plural}"
+
+
+class Phase:
+    """A single run of a phase, the block being timed can set the row count."""
+
+    def __init__(self, name, bound_query):
+        self.name = name
+        self.bound_query = bound_query
+        self.duration = 0
+        self.queries = 0
+        self.rows = 0
+
+
+class Timings:
+    """
+    How long each phase of a request took, for the Server-Timing header.
+
+    Phases that run more than once, e.g. the sql for each part of a pivot, are
+    added together. ``info`` holds other facts about the request, see note.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}
+        self.info = {}
+
+    def add(self, phase):
+        with self._lock:
+            totals = self.phases.setdefault(
+                phase.name, {"dur": 0, "queries": 0, "rows": 0}
+            )
+            totals["dur"] += phase.duration
+            totals["queries"] += phase.queries
+            totals["rows"] += phase.rows
+
+    def header(self):
+        metrics = []
+        for name, phase in self.phases.items():
+            desc = []
+            if phase["rows"]:
+                desc.append(_plural(phase["rows"], "row", "rows"))
+            if phase["queries"]:
+                desc.append(_plural(phase["queries"], "query", "queries"))
+            metric = f"{name};dur={phase['dur'] * 1000:.1f}"
+            if desc:
+                metric += f';desc="{" in ".join(desc)}"'
+            metrics.append(metric)
+        return ", ".join(metrics)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the timings of the phases run inside this block."""
+    timings = Timings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def note(**info):
+    """Record facts about the current request, e.g. if it hit the result cache."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.info.update(info)
+
+
+@contextmanager
+def phase(name, using=None, bound_query=None):
+    """
+    Time the block as the named phase, counting queries on the ``using`` db.
+
+    Yields a Phase, the times are added to the Timings being collected and sent
+    with the phase signals.
+    """
+    current = Phase(name, bound_query)
+    timings = _timings.get()
+    if timings is None and not (
+        signals.phase_started.has_listeners() or signals.phase_finished.has_listeners()
+    ):
+        yield current
+        return
+
+    def count_queries(execute, *args):
+        current.queries += 1
+        return execute(*args)
+
+    signals.phase_started.send(sender=None, phase=name, bound_query=bound_query)
+    start = time.perf_counter()
+    try:
+        if using is None:
+            yield current
+        else:
+            with db.connections[using].execute_wrapper(count_queries):
+                yield current
+    finally:
+        current.duration = time.perf_counter() - start
+        if timings is not None:
+            timings.add(current)
+        signals.phase_finished.send(
+            sender=None,
+            phase=name,
+            bound_query=current.bound_query,
+            duration=current.duration,
+            queries=current.queries,
+            rows=current.rows,
+        )
@@ -7,7 +7,18 @@ from django.views.static import serve
 
 from .api import view_detail, view_list
 from .common import settings
-from .views import proxy_js_dev_server, query, query_ctx, query_html, view
+from .metrics import metrics
+from .views import (
+    model_fields,
+    proxy_js_dev_server,
+    query,
+    query_async,
+    query_ctx,
+    query_ctx_async,
+    query_html,
+    view,
+    view_async,
+)
 
 FE_BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fe_build")
 WEB_ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "web_root")
@@ -29,19 +40,27 @@ if settings.DATA_BROWSER_DEV:  # pragma: no cover
 else:
     static_view = (serve, {"document_root": FE_BUILD_DIR})
 
+if settings.DATA_BROWSER_ASYNC_VIEWS:  # pragma: no cover
+    query_view, query_ctx_view, view_view = query_async, query_ctx_async, view_async
+else:
+    query_view, query_ctx_view, view_view = query, query_ctx, view
+
 urlpatterns = [
     # queries
     path(f"{QUERY_PATH}.html", query_html, name="query_html"),
-    path(f"{QUERY_PATH}.ctx", query_ctx),
-    path(f"{QUERY_PATH}.<media>", query, name="query"),
+    path(f"{QUERY_PATH}.ctx", query_ctx_view),
+    path(f"{QUERY_PATH}.<media>", query_view, name="query"),
     # views
-    path("view/<pk>.<media>", view, name="view"),
+    path("view/<pk>.<media>", view_view, name="view"),
     # api
     path("api/views/", view_list, name="view_list"),
     path("api/views/<pk>/", view_detail, name="view_detail"),
+    path("api/models/<model_name>/", model_fields, name="model_fields"),
+    # monitoring
+    path("metrics", metrics, name="metrics"),
     # other html pages
     re_path(r".*\.html", query_html),
-    re_path(r".*\.ctx", query_ctx),
+    re_path(r".*\.ctx", query_ctx_view),
     path("", query_html, name="home"),
     # static files
     re_path(r"^(?P<path>static/.*)$", *static_view, name="static"),
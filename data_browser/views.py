@@ -1,24 +1,59 @@
+import asyncio
+import contextvars
 import csv
+import functools
+import hashlib
 import io
-import itertools
-import json
+import logging
 import sys
+import threading
+import time
 
 import django.contrib.admin.views.decorators as admin_decorators
-from django import http
-from django.core.serializers.json import DjangoJSONEncoder
+from django import db, http
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.template import engines, loader
 from django.template.response import TemplateResponse
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags
 from django.views.decorators import csrf
 
-from . import version
-from .common import HttpResponse, JsonResponse, can_make_public, settings
-from .models import View
-from .orm import _OPEN_IN_ADMIN, get_models, get_results
+from . import signals, version
+from .asgi import DISCONNECTED_KEY
+from .common import (
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+    ThreadPool,
+    can_make_public,
+    dumps,
+    settings,
+)
+from .limits import TooManyQueries, acquire_query_slot
+from .models import QueryLog, View
+from .orm import (
+    _OPEN_IN_ADMIN,
+    CancelScope,
+    QueryTimeout,
+    QueryTooExpensive,
+    cancel_scope,
+    confirm_cost,
+    cost_confirmed,
+    densify_results,
+    explain_results,
+    get_columnar_results,
+    get_models,
+    get_results,
+    get_sparse_results,
+    iter_results,
+    supports_explain,
+)
 from .query import TYPES, BoundQuery, Query
+from .timing import collect_timings, note, phase
 
 
 def _get_query_data(bound_query):
@@ -72,7 +107,8 @@ def _get_model_fields(orm_model):
 
 
 def _get_config(request):
-    orm_models = get_models(request)
+    lazy = settings.DATA_BROWSER_LAZY_CONFIG
+    orm_models = get_models(request, lazy=lazy)
     types = {
         name: {
             "lookups": {n: {"type": t} for n, t in type_.lookups.items()},
@@ -83,38 +119,72 @@ def _get_config(request):
         for name, type_ in TYPES.items()
     }
 
-    all_model_fields = {
-        model_name: _get_model_fields(orm_model)
-        for model_name, orm_model in orm_models.items()
-    }
-
-    return {
+    config = {
         "baseUrl": reverse("data_browser:home"),
         "types": types,
-        "allModelFields": all_model_fields,
-        "sortedModels": sorted(
-            name for name, model in orm_models.items() if model.root
-        ),
         "canMakePublic": can_make_public(request.user),
         "sentryDsn": settings.DATA_BROWSER_FE_DSN,
         "defaultRowLimit": settings.DATA_BROWSER_DEFAULT_ROW_LIMIT,
     }
 
+    if lazy:
+        # the frontend will fetch model fields from model_fields as it needs them
+        config["sortedModels"] = sorted(
+            name for name in orm_models if name not in TYPES
+        )
+    else:
+        config["allModelFields"] = {
+            model_name: _get_model_fields(orm_model)
+            for model_name, orm_model in orm_models.items()
+        }
+        config["sortedModels"] = sorted(
+            name for name, model in orm_models.items() if model.root
+        )
+
+    return config
+
+
+def _get_etag(data):
+    return f'"{hashlib.sha1(f"{version}:{data}".encode()).hexdigest()}"'
+
+
+def _not_modified(request, etag):
+    etags = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+    return etag in etags or "*" in etags
+
+
+def _conditional_response(request, etag, get_response):
+    if _not_modified(request, etag):
+        response = http.HttpResponseNotModified()
+    else:
+        response = get_response()
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 
 @admin_decorators.staff_member_required
 def query_ctx(request, *, model_name="", fields=""):
-    config = _get_config(request)
-    return JsonResponse(config)
+    config = dumps(_get_config(request))
+    return _conditional_response(
+        request,
+        _get_etag(config),
+        lambda: HttpResponse(config, content_type="application/json"),
+    )
+
+
+@admin_decorators.staff_member_required
+def model_fields(request, model_name):
+    orm_models = get_models(request, lazy=True)
+    if model_name not in orm_models:
+        raise http.Http404(f"{model_name} does not exist")
+    return JsonResponse(_get_model_fields(orm_models[model_name]))
 
 
 @csrf.ensure_csrf_cookie
 @admin_decorators.staff_member_required
 def query_html(request, *, model_name="", fields=""):
-    config = _get_config(request)
-    config = json.dumps(config, cls=DjangoJSONEncoder)
-    config = (
-        config.replace("<", "\\u003C").replace(">", "\\u003E").replace("&", "\\u0026")
-    )
+    config = dumps(_get_config(request))
 
     if settings.DATA_BROWSER_DEV:  # pragma: no cover
         try:
@@ -123,10 +193,27 @@ def query_html(request, *, model_name="", fields=""):
             return HttpResponse(f"Error loading from JS dev server.<br><br>{e}")
 
         template = engines["django"].from_string(response.text)
-    else:
-        template = loader.get_template("data_browser/index.html")
+        return TemplateResponse(
+            request, template, {"config": _escape_config(config), "version": version}
+        )
 
-    return TemplateResponse(request, template, {"config": config, "version": version})
+    etag = _get_etag(config)
+    return _conditional_response(
+        request, etag, lambda: HttpResponse(_get_index_html(etag, config))
+    )
+
+
+def _escape_config(config):
+    return (
+        config.replace("<", "\\u003C").replace(">", "\\u003E").replace("&", "\\u0026")
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _get_index_html(etag, config):
+    # the rendered page only depends on the config and version, both in the etag
+    template = loader.get_template("data_browser/index.html")
+    return template.render({"config": _escape_config(config), "version": version})
 
 
 @admin_decorators.staff_member_required
@@ -146,99 +233,437 @@ def view(request, pk, media):
     ):
         request.user = view.owner  # public views are run as the person who owns them
         query = view.get_query()
-        return _data_response(request, query, media, meta=False)
+        snapshot = view.get_snapshot()
+        if snapshot is not None and media in ["csv", "json"]:
+            return _snapshot_response(request, view, query, media, snapshot)
+        if media == "csv" and settings.DATA_BROWSER_VIEW_CSV_MAX_AGE:
+            return _cached_view_csv(request, view, query)
+        return _data_response(request, query, media, meta=False, view=view)
     else:
         raise http.Http404("No View matches the given query.")
 
 
+def _snapshot_response(request, view, query, media, snapshot):
+    orm_models = get_models(request, lazy=True)
+    if query.model_name not in orm_models:
+        raise http.Http404(f"{query.model_name} does not exist")
+    bound_query = BoundQuery.bind(query, orm_models)
+
+    if media == "csv":
+        response = _csv_response(
+            query, HttpResponse(_get_csv(bound_query, snapshot), content_type="text")
+        )
+    else:
+        response = JsonResponse(densify_results(snapshot))
+    response["Last-Modified"] = http_date(view.snapshot_time.timestamp())
+    return response
+
+
+_VIEW_CSV_PREFIX = "data_browser_view_csv"
+_VIEW_REFRESH_LOCK_TIMEOUT = 300
+_VIEW_CSV_POLL_INTERVAL = 0.1
+# how long a cold request waits for another to fill the cache before giving up
+_VIEW_CSV_WAIT = 30
+# CSVs nobody fetches for this many max ages drop out of the cache
+_VIEW_CSV_TIMEOUT_AGES = 10
+
+
+def _run_in_background(func):
+    def target():
+        try:
+            func()
+        finally:
+            db.connections.close_all()
+
+    # carry the callers context vars over to the thread
+    context = contextvars.copy_context()
+    thread = threading.Thread(target=context.run, args=(target,), daemon=True)
+    thread.start()
+    return thread
+
+
+def _refresh_view_csv(request, view, query, key):
+    """
+    Run the view's CSV like any other data response and cache it.
+
+    Returns the new cache entry, or None and the response when it failed.
+    """
+    response = _data_response(request, query, "csv", meta=False, view=view)
+    if response.status_code != 200:
+        return None, response
+    try:
+        content = b"".join(response)
+    finally:
+        response.close()
+    entry = (time.time(), content)
+    timeout = settings.DATA_BROWSER_VIEW_CSV_MAX_AGE * _VIEW_CSV_TIMEOUT_AGES
+    cache.set(key, entry, timeout)
+    return entry, response
+
+
+def _refresh_view_csv_in_background(request, view, query, key):
+    # the lock coalesces a burst of stale requests into a single refresh
+    lock = f"{key}:lock"
+    if not cache.add(lock, True, _VIEW_REFRESH_LOCK_TIMEOUT):
+        return
+
+    def refresh():
+        try:
+            # nobody is waiting on background refreshes so they can be expensive
+            with confirm_cost():
+                entry, response = _refresh_view_csv(request, view, query, key)
+            if entry is None:
+                logging.getLogger(__name__).warning(
+                    "Failed to refresh %s: %s", key, response.content.decode()
+                )
+        except (http.Http404, PermissionDenied):
+            # the owner can't run it anymore so stop serving the old CSV
+            cache.delete(key)
+            logging.getLogger(__name__).warning("Removed %s", key, exc_info=True)
+        except Exception:
+            logging.getLogger(__name__).exception("Failed to refresh %s", key)
+        finally:
+            cache.delete(lock)
+
+    _run_in_background(refresh)
+
+
+def _get_view_csv_key(view, query):
+    data = f"{version}:{view.owner_id}:{query.limit}:{query.get_url('csv')}"
+    return f"{_VIEW_CSV_PREFIX}:{view.pk}:{hashlib.sha1(data.encode()).hexdigest()}"
+
+
+def _get_view_csv(request, view, query, key):
+    # only one request runs the query, the rest wait for it to land in the cache
+    lock = f"{key}:lock"
+    deadline = time.monotonic() + _VIEW_CSV_WAIT
+    while not cache.add(lock, True, _VIEW_REFRESH_LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            response = JsonResponse(
+                {"error": "The view is still being refreshed, try again later."},
+                status=503,
+            )
+            response["Retry-After"] = str(_VIEW_CSV_WAIT)
+            return None, response
+        time.sleep(_VIEW_CSV_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry, None
+    try:
+        # the last holder may have filled it between our last check and the add
+        entry = cache.get(key)
+        if entry is not None:
+            return entry, None
+        return _refresh_view_csv(request, view, query, key)
+    finally:
+        cache.delete(lock)
+
+
+def _cached_view_csv(request, view, query):
+    """
+    Serve the last CSV of a public view, refreshing it in the background once
+    it's older than DATA_BROWSER_VIEW_CSV_MAX_AGE.
+    """
+    key = _get_view_csv_key(view, query)
+    entry = cache.get(key)
+    if entry is None:
+        entry, response = _get_view_csv(request, view, query, key)
+        if entry is None:
+            return response
+    elif time.time() - entry[0] > settings.DATA_BROWSER_VIEW_CSV_MAX_AGE:
+        _refresh_view_csv_in_background(request, view, query, key)
+
+    created, content = entry
+    response = _csv_response(query, HttpResponse(content, content_type="text"))
+    response["Age"] = str(max(0, int(time.time() - created)))
+    return response
+
+
+def _csv_response(query, response):
+    response[
+        "Content-Disposition"
+    ] = f"attachment; filename={query.model_name}-{timezone.now().isoformat()}.csv"
+    return response
+
+
 def pad(x):
     return [None] * max(0, x)
 
 
-def concat(*lists):
-    return list(itertools.chain.from_iterable(lists))
+def _csv_rows(bound_query, rows, cols, cells):
+    """
+    The lines of the CSV, generated straight from the sparse pivot cells.
 
+    Rows can be an iterator, cols must be a sequence.
+    """
+    row_fields = bound_query.row_fields
+    col_fields = bound_query.col_fields
+    data_fields = bound_query.data_fields
+    blank_cell = [""] * len(data_fields)
+
+    # the pivoted column headers
+    for field in col_fields:
+        line = pad(len(row_fields) - 1) + [" ".join(field.pretty_path)]
+        for col in cols:
+            line.append(col[field.path_str])
+            line.extend(pad(len(data_fields) - 1))
+        yield line
+
+    # the row headers
+    yield (
+        pad(1 - len(row_fields))
+        + [" ".join(f.pretty_path) for f in row_fields]
+        + [" ".join(f.pretty_path) for f in data_fields] * len(cols)
+    )
 
-def flip_table(table):
-    return [list(x) for x in zip(*table)]
+    # and the data area
+    for row_index, row in enumerate(rows):
+        line = pad(1 - len(row_fields)) + [row[f.path_str] for f in row_fields]
+        for col_index in range(len(cols)):
+            cell = cells.get((row_index, col_index))
+            line.extend([cell[f.path_str] for f in data_fields] if cell else blank_cell)
+        yield line
 
 
-def join_tables(*tables):
-    return [concat(*ts) for ts in zip(*tables)]
+class _Echo:
+    def write(self, value):
+        return value
 
 
-def format_table(fields, table, spacing=0):
-    return concat(
-        [[" ".join(f.pretty_path) for f in fields]],
-        *[
-            [[(row[f.path_str] if row else "") for f in fields]]
-            + [pad(len(fields))] * spacing
-            for row in table
-        ],
+def _stream_csv(lines):
+    writer = csv.writer(_Echo())
+    for line in lines:
+        yield writer.writerow(line)
+
+
+def _get_csv(bound_query, results):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        _csv_rows(bound_query, results["rows"], results["cols"], results["cells"])
     )
+    return buffer.getvalue()
 
 
-def pad_table(x, table):
-    return [pad(x) + row for row in table]
+class _ReleaseOnClose:
+    """Streaming content that gives back its query slot when the response closes."""
 
+    def __init__(self, content, release):
+        self.content = content
+        self.release = release
 
-def _data_response(request, query, media, meta):
-    orm_models = get_models(request)
-    if query.model_name not in orm_models:
-        raise http.Http404(f"{query.model_name} does not exist")
-    bound_query = BoundQuery.bind(query, orm_models)
+    def __iter__(self):
+        return iter(self.content)
 
-    if media == "csv":
-        results = get_results(request, bound_query, orm_models)
-        buffer = io.StringIO()
-        writer = csv.writer(buffer)
-
-        # the pivoted column headers
-        writer.writerows(
-            pad_table(
-                len(bound_query.row_fields) - 1,
-                flip_table(
-                    format_table(
-                        bound_query.col_fields,
-                        results["cols"],
-                        spacing=len(bound_query.data_fields) - 1,
-                    )
-                ),
+    def close(self):
+        self.release()
+
+
+def _data_response(request, query, media, meta, view=None):
+    try:
+        release = acquire_query_slot(request.user)
+    except TooManyQueries as e:
+        response = JsonResponse({"error": str(e)}, status=429)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+
+    held = False
+    try:
+        response = _run_data_response(request, query, media, meta, view)
+        if response.streaming:
+            # the query runs as the response is read so hold the slot until done
+            response.streaming_content = _ReleaseOnClose(
+                response.streaming_content, release
             )
-        )
+            held = True
+        return response
+    finally:
+        if not held:
+            release()
+
 
-        # the row headers and data area
-        writer.writerows(
-            pad_table(
-                1 - len(bound_query.row_fields),
-                join_tables(
-                    format_table(bound_query.row_fields, results["rows"]),
-                    *(
-                        format_table(bound_query.data_fields, sub_table)
-                        for sub_table in results["body"]
-                    ),
-                ),
+def _run_data_response(request, query, media, meta, view):
+    # public views can't confirm expensive queries
+    can_confirm = meta and settings.DATA_BROWSER_QUERY_CONFIRM
+    token = cost_confirmed.set(
+        cost_confirmed.get() or (can_confirm and request.GET.get("confirm") == "true")
+    )
+    start = time.perf_counter()
+    try:
+        with collect_timings() as timings:
+            response = _get_data_response(request, query, media, meta)
+    except QueryTimeout as e:
+        response = JsonResponse({"error": str(e)}, status=504)
+    except QueryTooExpensive as e:
+        error = f"{e} Add confirm=true to run it anyway." if can_confirm else str(e)
+        response = JsonResponse({"error": error, "estimatedRows": e.rows}, status=422)
+    finally:
+        cost_confirmed.reset(token)
+    duration = time.perf_counter() - start
+
+    # public views don't get the timings
+    if meta and settings.DATA_BROWSER_SERVER_TIMING:
+        response["Server-Timing"] = timings.header()
+    # .query and .explain don't query and streamed responses haven't run yet
+    if (
+        settings.DATA_BROWSER_QUERY_LOG
+        and media not in ["query", "explain"]
+        and not response.streaming
+    ):
+        try:
+            QueryLog.log(request, query, media, view, duration, timings)
+        except Exception:  # the query log mustn't break the response
+            logging.getLogger(__name__).exception("Failed to log query")
+    # nor must the receivers
+    results = signals.query_finished.send_robust(
+        sender=None,
+        request=request,
+        view=view,
+        model_name=query.model_name,
+        bound_query=timings.info.get("bound_query"),
+        media=media,
+        status=response.status_code,
+        duration=duration,
+        phases=timings.phases,
+        rows=timings.info.get("rows"),
+        cols=timings.info.get("cols"),
+        cache_hit=timings.info.get("cache_hit"),
+    )
+    for receiver, result in results:
+        if isinstance(result, Exception):
+            logging.getLogger(__name__).error(
+                "query_finished receiver %r failed",
+                receiver,
+                exc_info=(type(result), result, result.__traceback__),
             )
-        )
+    return response
 
-        buffer.seek(0)
-        response = HttpResponse(buffer, content_type="text")
-        response[
-            "Content-Disposition"
-        ] = f"attachment; filename={query.model_name}-{timezone.now().isoformat()}.csv"
-        return response
+
+def _get_data_response(request, query, media, meta):
+    with phase("get_models"):
+        orm_models = get_models(request, lazy=True)
+        if query.model_name not in orm_models:
+            raise http.Http404(f"{query.model_name} does not exist")
+    with phase("bind") as bind:
+        bound_query = BoundQuery.bind(query, orm_models)
+        bind.bound_query = bound_query
+    note(bound_query=bound_query)
+
+    if media == "csv":
+        if settings.DATA_BROWSER_CSV_STREAMING:
+            if bound_query.col_fields:
+                results = get_sparse_results(request, bound_query, orm_models)
+                rows, cols, cells = results["rows"], results["cols"], results["cells"]
+            else:
+                rows = iter_results(request, bound_query, orm_models)
+                cols, cells = [], {}
+            response = StreamingHttpResponse(
+                _stream_csv(_csv_rows(bound_query, rows, cols, cells)),
+                content_type="text",
+            )
+        else:
+            results = get_sparse_results(request, bound_query, orm_models)
+            with phase("serialize", bound_query=bound_query):
+                content = _get_csv(bound_query, results)
+            response = HttpResponse(content, content_type="text")
+        return _csv_response(query, response)
     elif media == "json":
-        results = get_results(request, bound_query, orm_models)
+        if request.GET.get("body") == "sparse":
+            # only the populated cells as [col_index, row_index, cell]
+            results = get_sparse_results(request, bound_query, orm_models)
+            results["body"] = [
+                [col, row, cell] for (row, col), cell in results.pop("cells").items()
+            ]
+        else:
+            results = get_results(request, bound_query, orm_models)
         resp = _get_query_data(bound_query) if meta else {}
         resp.update(results)
-        return JsonResponse(resp)
+        with phase("serialize", bound_query=bound_query):
+            return JsonResponse(resp)
+    elif media == "cjson":
+        results = get_columnar_results(request, bound_query, orm_models)
+        resp = _get_query_data(bound_query) if meta else {}
+        resp.update(results)
+        with phase("serialize", bound_query=bound_query):
+            return JsonResponse(resp)
     elif media == "query":
         resp = _get_query_data(bound_query) if meta else {}
         return JsonResponse(resp)
+    elif media == "explain" and meta:  # not for public views
+        if not supports_explain():
+            return JsonResponse(
+                {"error": "Explaining queries needs Django 2.1 or later."}, status=400
+            )
+        analyze = request.GET.get("analyze") == "true"
+        return JsonResponse(explain_results(request, bound_query, orm_models, analyze))
     else:
         raise http.Http404(f"Bad file format {media} requested")
 
 
+_async_executor = ThreadPool("DATA_BROWSER_ASYNC_THREADS", "data_browser_async")
+
+
+def _get_async_executor():
+    return _async_executor.get()
+
+
+def _run_view(view_func, request, *args, **kwargs):
+    try:
+        response = view_func(request, *args, **kwargs)
+        if response.streaming:
+            # the ASGI handler would iterate it on the event loop, where the
+            # db can't be touched, so read it all in here
+            content = b"".join(response.streaming_content)
+            response.close()
+            streaming, response = response, http.HttpResponse(content)
+            for header, value in streaming.items():
+                response[header] = value
+        return response
+    finally:
+        db.connections.close_all()
+
+
+def _async_view(view_func):
+    """
+    An async version of a sync view that runs it on the Data Browser executor.
+
+    Keeps long queries off the event loop and out of the shared sync_to_async
+    thread so they can't starve the rest of the site.
+    """
+
+    @functools.wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        loop = asyncio.get_event_loop()
+        scope = CancelScope()
+        context = contextvars.copy_context()
+        context.run(cancel_scope.set, scope)
+        func = functools.partial(_run_view, view_func, request, *args, **kwargs)
+        response = loop.run_in_executor(_get_async_executor(), context.run, func)
+
+        # set by asgi.DisconnectMiddleware
+        disconnected = getattr(request, "scope", {}).get(DISCONNECTED_KEY)
+        if disconnected is None:
+            return await response
+
+        disconnect = asyncio.ensure_future(disconnected.wait())
+        await asyncio.wait([response, disconnect], return_when=asyncio.FIRST_COMPLETED)
+        if response.done():
+            disconnect.cancel()
+            return response.result()
+
+        # the client has gone, stop the queries and don't wait for them
+        response.add_done_callback(lambda f: f.cancelled() or f.exception())
+        await loop.run_in_executor(None, scope.cancel)
+        return http.HttpResponse(status=499)
+
+    return wrapper
+
+
+query_ctx_async = _async_view(query_ctx)
+query_async = _async_view(query)
+view_async = _async_view(view)
+
+
 def _get_from_js_dev_server(request):  # pragma: no cover
     import requests
 
@@ -10,7 +10,7 @@ import {
 import "./App.css";
 import { HomePage, QueryPage, Logo, EditSavedView } from "./Components";
 import { Query, getUrlForQuery, empty } from "./Query";
-import { doGet, fetchInProgress } from "./Util";
+import { doGet, doGetConcurrent, fetchInProgress } from "./Util";
 
 const assert = require("assert");
 
@@ -25,12 +25,52 @@ class QueryApp extends React.Component {
       fields: [],
       filters: [],
       limit: props.config.defaultRowLimit,
+      allModelFields: props.config.allModelFields || {},
       ...empty,
     };
+    // with DATA_BROWSER_LAZY_CONFIG model fields are fetched as they are needed
+    this.allModelFields = this.state.allModelFields;
+    this.pendingModelFields = {};
+  }
+
+  loadModelFields(model) {
+    if (model in this.allModelFields)
+      return Promise.resolve(this.allModelFields[model]);
+    if (!(model in this.pendingModelFields)) {
+      const url = `${this.props.config.baseUrl}api/models/${model}/`;
+      this.pendingModelFields[model] = doGetConcurrent(url).then(
+        (modelFields) => {
+          this.allModelFields = {
+            ...this.allModelFields,
+            [model]: modelFields,
+          };
+          delete this.pendingModelFields[model];
+          this.setState({ allModelFields: this.allModelFields });
+          return modelFields;
+        },
+        (e) => {
+          // so the next attempt fetches again
+          delete this.pendingModelFields[model];
+          throw e;
+        }
+      );
+    }
+    return this.pendingModelFields[model];
+  }
+
+  loadModelFieldsForPath(model, path) {
+    return this.loadModelFields(model).then((modelFields) => {
+      const field = modelFields.fields[path[0]];
+      if (path.length > 1 && field && field.model)
+        return this.loadModelFieldsForPath(field.model, path.slice(1));
+    });
   }
 
   handleError(e) {
-    if (e.name !== "AbortError") {
+    if (e.name === "QueryError") {
+      // expected so show the reason and don't report it
+      this.setState({ error: e.message, loading: false });
+    } else if (e.name !== "AbortError") {
       this.setState({ error: true, loading: false });
       console.log(e);
       Sentry.captureException(e);
@@ -39,51 +79,90 @@ class QueryApp extends React.Component {
 
   fetchResults(state) {
     this.setState({ loading: true });
-    const url = getUrlForQuery(this.props.config.baseUrl, state, "json");
-
-    return doGet(url).then((response) => {
-      this.setState({
-        body: response.body,
-        cols: response.cols,
-        rows: response.rows,
-        length: response.length,
-        filterErrors: response.filterErrors,
-        loading: fetchInProgress,
-        error: undefined,
+    const url = `${getUrlForQuery(
+      this.props.config.baseUrl,
+      state,
+      "json"
+    )}&body=sparse`;
+
+    return doGet(url)
+      .catch((e) => {
+        // the query is over the cost limit, ask before running it anyway
+        const rows =
+          e.name === "QueryError" && e.status === 422 && e.body.estimatedRows;
+        if (
+          rows &&
+          window.confirm(
+            `This query will read about ${rows} rows. Run it anyway?`
+          )
+        )
+          return doGet(`${url}&confirm=true`);
+        throw e;
+      })
+      .then((response) => {
+        this.setState({
+          body: response.body,
+          cols: response.cols,
+          rows: response.rows,
+          length: response.length,
+          filterErrors: response.filterErrors,
+          loading: fetchInProgress,
+          error: undefined,
+        });
+        return response;
       });
-      return response;
-    });
+  }
+
+  loadModelFieldsForQuery(query) {
+    return Promise.all([
+      this.loadModelFields(query.model),
+      ...[...query.fields, ...query.filters].map((f) =>
+        this.loadModelFieldsForPath(query.model, f.path)
+      ),
+    ]);
   }
 
   popstate(e) {
-    this.setState(e.state);
-    this.fetchResults(e.state).catch(this.handleError.bind(this));
+    const state = e.state;
+    this.poppedState = state;
+    // the fields must be loaded before rendering the query
+    this.loadModelFieldsForQuery(state)
+      .then(() => {
+        if (this.poppedState !== state) return; // navigated again meanwhile
+        this.setState(state);
+        return this.fetchResults(state);
+      })
+      .catch(this.handleError.bind(this));
   }
   popstate = this.popstate.bind(this);
 
   componentDidMount() {
     const { model, fieldStr, queryStr, config } = this.props;
     const url = `${config.baseUrl}query/${model}/${fieldStr}.query${queryStr}`;
-    doGet(url).then((response) => {
-      const reqState = {
-        booting: false,
-        loading: true,
-        error: undefined,
-        model: response.model,
-        fields: response.fields,
-        filters: response.filters,
-        limit: response.limit,
-        ...empty,
-      };
-      this.setState(reqState);
-      window.history.replaceState(
-        reqState,
-        null,
-        getUrlForQuery(this.props.config.baseUrl, reqState, "html")
-      );
-      window.addEventListener("popstate", this.popstate);
-      this.fetchResults(this.state).catch(this.handleError.bind(this));
-    });
+    doGet(url)
+      .then((response) =>
+        this.loadModelFieldsForQuery(response).then(() => response)
+      )
+      .then((response) => {
+        const reqState = {
+          booting: false,
+          loading: true,
+          error: undefined,
+          model: response.model,
+          fields: response.fields,
+          filters: response.filters,
+          limit: response.limit,
+          ...empty,
+        };
+        this.setState(reqState);
+        window.history.replaceState(
+          reqState,
+          null,
+          getUrlForQuery(this.props.config.baseUrl, reqState, "html")
+        );
+        window.addEventListener("popstate", this.popstate);
+        this.fetchResults(this.state).catch(this.handleError.bind(this));
+      });
   }
 
   componentWillUnmount() {
@@ -91,6 +170,10 @@ class QueryApp extends React.Component {
   }
 
   handleQueryChange(queryChange) {
+    if (queryChange.model)
+      this.loadModelFields(queryChange.model).catch(
+        this.handleError.bind(this)
+      );
     this.setState(queryChange);
     const newState = { ...this.state, ...queryChange };
     const request = {
@@ -116,9 +199,10 @@ class QueryApp extends React.Component {
   render() {
     if (this.state.booting) return "";
     const query = new Query(
-      this.props.config,
+      { ...this.props.config, allModelFields: this.state.allModelFields },
       this.state,
-      this.handleQueryChange.bind(this)
+      this.handleQueryChange.bind(this),
+      (model) => this.loadModelFields(model).catch(this.handleError.bind(this))
     );
     return (
       <QueryPage
@@ -181,6 +181,8 @@ class Field extends React.Component {
   }
 
   toggle() {
+    if (!this.state.toggled)
+      this.props.query.loadModelFields(this.props.modelField.model);
     this.setState((state) => ({
       toggled: !state.toggled,
     }));
@@ -235,6 +237,7 @@ class Field extends React.Component {
 function AllFields(props) {
   const { query, model, path, prettyPath } = props;
   const modelFields = query.getModelFields(model);
+  if (!modelFields) return <p>Loading...</p>;
   return (
     <table>
       <tbody>
@@ -295,7 +298,7 @@ function QueryPage(props) {
 
   let overlay;
   if (loading) overlay = "Loading...";
-  else if (error) overlay = "Error";
+  else if (error) overlay = error === true ? "Error" : error;
 
   let results;
   if (query.rowFields().length || query.colFields().length)
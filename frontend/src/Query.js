@@ -1,7 +1,7 @@
 const empty = {
   rows: [{}],
   cols: [{}],
-  body: [[{}]],
+  body: [[0, 0, {}]],
   length: 0,
   filterErrors: [],
 };
@@ -31,10 +31,11 @@ function getUrlForQuery(baseUrl, query, media) {
 }
 
 class Query {
-  constructor(config, query, setQuery) {
+  constructor(config, query, setQuery, loadModelFields) {
     this.config = config;
     this.query = query;
     this.setQuery = setQuery;
+    this.loadModelFields = loadModelFields;
   }
 
   getField(path) {
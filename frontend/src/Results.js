@@ -105,8 +105,19 @@ function HTableRow(props) {
   );
 }
 
+function getCells(body) {
+  // the sparse body is a list of [colIndex, rowIndex, cell]
+  const cells = {};
+  for (const [col, row, cell] of body) {
+    if (!cells[row]) cells[row] = {};
+    cells[row][col] = cell;
+  }
+  return cells;
+}
+
 function Results(props) {
   const { query, cols, rows, body, overlay } = props;
+  const cells = getCells(body);
   return (
     <div className="Results">
       <Overlay message={overlay} />
@@ -153,11 +164,11 @@ function Results(props) {
               <tr key={rowIndex}>
                 <Spacer spaces={1 - query.rowFields().length} />
                 <VTableBodyRow {...{ query, row }} fields={query.rowFields()} />
-                {body.map((table, key) => (
+                {cols.map((_, key) => (
                   <VTableBodyRow
                     {...{ key, query }}
                     fields={query.resFields()}
-                    row={table[rowIndex]}
+                    row={cells[rowIndex] && cells[rowIndex][key]}
                     classNameFirst="LeftBorder"
                   />
                 ))}
@@ -62,6 +62,16 @@ class AbortError extends Error {
     name = "AbortError";
 }
 
+class QueryError extends Error {
+    // the server refused to run the query and says why
+    name = "QueryError";
+    constructor(status, body) {
+        super(body.error);
+        this.status = status;
+        this.body = body;
+    }
+}
+
 function doFetch(url, options, process) {
     if (fetchInProgress) {
         if (nextFetch) {
@@ -91,32 +101,46 @@ function doFetch(url, options, process) {
                 return response;
             }
         })
-        .then((response) => {
-            // check status
-            assert.ok(response.status >= 200);
-            assert.ok(response.status < 300);
-            return response;
-        })
-        .then((response) => {
-            // check server version
-            const response_version = response.headers.get("x-version");
-            if (response_version !== version) {
-                console.log(
-                    "Version mismatch, hard reload",
-                    version,
-                    response_version
-                );
-                window.location.reload(true);
-            }
-            return response;
-        })
+        .then(checkResponse)
         .then((response) => process(response)); // process data
 }
 
+function checkResponse(response) {
+    // too expensive, too many queries or timed out
+    if ([422, 429, 504].includes(response.status)) {
+        return response.json().then((body) => {
+            throw new QueryError(response.status, body);
+        });
+    }
+
+    // check status
+    assert.ok(response.status >= 200);
+    assert.ok(response.status < 300);
+
+    // check server version
+    const response_version = response.headers.get("x-version");
+    if (response_version !== version) {
+        console.log(
+            "Version mismatch, hard reload",
+            version,
+            response_version
+        );
+        window.location.reload(true);
+    }
+    return response;
+}
+
 function doGet(url) {
     return doFetch(url, { method: "GET" }, (response) => response.json());
 }
 
+function doGetConcurrent(url) {
+    // unlike doGet this neither supersedes nor is superseded by other fetches
+    return fetch(url, { method: "GET" })
+        .then(checkResponse)
+        .then((response) => response.json());
+}
+
 function doDelete(url) {
     return doFetch(
         url,
@@ -294,6 +318,7 @@ export {
     SLink,
     doPatch,
     doGet,
+    doGetConcurrent,
     doDelete,
     doPost,
     useData,
@@ -36,6 +36,8 @@ setuptools.setup(
     install_requires=[
         "Django>=2.0",
         "python-dateutil",
+        'contextvars; python_version<"3.7"',
         'dataclasses; python_version<"3.7"',
     ],
+    extras_require={"orjson": ["orjson"]},
 )
@@ -172,6 +172,261 @@ snapshots["test_query_html config"] = {
             },
             "sortedFields": ["average", "sum"],
         },
+        "data_browser.QueryLog": {
+            "fields": {
+                "admin": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": False,
+                    "model": None,
+                    "prettyName": "admin",
+                    "type": "html",
+                },
+                "created_time": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "datetime",
+                    "prettyName": "created_time",
+                    "type": "datetime",
+                },
+                "duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "duration",
+                    "type": "number",
+                },
+                "fields": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "fields",
+                    "type": "string",
+                },
+                "filters": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "filters",
+                    "type": "string",
+                },
+                "fingerprint": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "fingerprint",
+                    "type": "string",
+                },
+                "id": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "id",
+                    "type": "number",
+                },
+                "media": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "media",
+                    "type": "string",
+                },
+                "model_name": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "model_name",
+                    "type": "string",
+                },
+                "rows": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "rows",
+                    "type": "number",
+                },
+                "sql_time": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "sql_time",
+                    "type": "number",
+                },
+                "user": {
+                    "canPivot": False,
+                    "choices": [],
+                    "concrete": False,
+                    "model": "auth.User",
+                    "prettyName": "user",
+                    "type": None,
+                },
+                "view": {
+                    "canPivot": False,
+                    "choices": [],
+                    "concrete": False,
+                    "model": "data_browser.View",
+                    "prettyName": "view",
+                    "type": None,
+                },
+            },
+            "sortedFields": [
+                "id",
+                "admin",
+                "created_time",
+                "duration",
+                "fields",
+                "filters",
+                "fingerprint",
+                "media",
+                "model_name",
+                "rows",
+                "sql_time",
+                "user",
+                "view",
+            ],
+        },
+        "data_browser.QueryStats": {
+            "fields": {
+                "admin": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": False,
+                    "model": None,
+                    "prettyName": "admin",
+                    "type": "html",
+                },
+                "count": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "count",
+                    "type": "number",
+                },
+                "fields": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "fields",
+                    "type": "string",
+                },
+                "filters": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "filters",
+                    "type": "string",
+                },
+                "fingerprint": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "fingerprint",
+                    "type": "string",
+                },
+                "id": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": False,
+                    "model": None,
+                    "prettyName": "id",
+                    "type": "string",
+                },
+                "last_seen": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "datetime",
+                    "prettyName": "last_seen",
+                    "type": "datetime",
+                },
+                "max_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "max_duration",
+                    "type": "number",
+                },
+                "mean_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": False,
+                    "model": None,
+                    "prettyName": "mean_duration",
+                    "type": "string",
+                },
+                "model_name": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "model_name",
+                    "type": "string",
+                },
+                "p50_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "p50_duration",
+                    "type": "number",
+                },
+                "p95_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "p95_duration",
+                    "type": "number",
+                },
+                "total_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "total_duration",
+                    "type": "number",
+                },
+                "total_sql_time": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "total_sql_time",
+                    "type": "number",
+                },
+            },
+            "sortedFields": [
+                "id",
+                "admin",
+                "count",
+                "fields",
+                "filters",
+                "fingerprint",
+                "last_seen",
+                "max_duration",
+                "mean_duration",
+                "model_name",
+                "p50_duration",
+                "p95_duration",
+                "total_duration",
+                "total_sql_time",
+            ],
+        },
         "data_browser.View": {
             "fields": {
                 "admin": {
@@ -294,6 +549,38 @@ snapshots["test_query_html config"] = {
                     "prettyName": "query",
                     "type": "string",
                 },
+                "refresh_interval": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "refresh_interval",
+                    "type": "number",
+                },
+                "snapshot_time": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "datetime",
+                    "prettyName": "snapshot_time",
+                    "type": "datetime",
+                },
+                "watermark": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "watermark",
+                    "type": "string",
+                },
+                "watermark_field": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "watermark_field",
+                    "type": "string",
+                },
             },
             "sortedFields": [
                 "id",
@@ -311,6 +598,10 @@ snapshots["test_query_html config"] = {
                 "public_link",
                 "public_slug",
                 "query",
+                "refresh_interval",
+                "snapshot_time",
+                "watermark",
+                "watermark_field",
             ],
         },
         "date": {
@@ -981,6 +1272,8 @@ snapshots["test_query_html config"] = {
     "sortedModels": [
         "auth.Group",
         "auth.User",
+        "data_browser.QueryLog",
+        "data_browser.QueryStats",
         "data_browser.View",
         "tests.Address",
         "tests.InAdmin",
@@ -2079,6 +2372,261 @@ snapshots["test_query_ctx config"] = {
             },
             "sortedFields": ["average", "sum"],
         },
+        "data_browser.QueryLog": {
+            "fields": {
+                "admin": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": False,
+                    "model": None,
+                    "prettyName": "admin",
+                    "type": "html",
+                },
+                "created_time": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "datetime",
+                    "prettyName": "created_time",
+                    "type": "datetime",
+                },
+                "duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "duration",
+                    "type": "number",
+                },
+                "fields": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "fields",
+                    "type": "string",
+                },
+                "filters": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "filters",
+                    "type": "string",
+                },
+                "fingerprint": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "fingerprint",
+                    "type": "string",
+                },
+                "id": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "id",
+                    "type": "number",
+                },
+                "media": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "media",
+                    "type": "string",
+                },
+                "model_name": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "model_name",
+                    "type": "string",
+                },
+                "rows": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "rows",
+                    "type": "number",
+                },
+                "sql_time": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "sql_time",
+                    "type": "number",
+                },
+                "user": {
+                    "canPivot": False,
+                    "choices": [],
+                    "concrete": False,
+                    "model": "auth.User",
+                    "prettyName": "user",
+                    "type": None,
+                },
+                "view": {
+                    "canPivot": False,
+                    "choices": [],
+                    "concrete": False,
+                    "model": "data_browser.View",
+                    "prettyName": "view",
+                    "type": None,
+                },
+            },
+            "sortedFields": [
+                "id",
+                "admin",
+                "created_time",
+                "duration",
+                "fields",
+                "filters",
+                "fingerprint",
+                "media",
+                "model_name",
+                "rows",
+                "sql_time",
+                "user",
+                "view",
+            ],
+        },
+        "data_browser.QueryStats": {
+            "fields": {
+                "admin": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": False,
+                    "model": None,
+                    "prettyName": "admin",
+                    "type": "html",
+                },
+                "count": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "count",
+                    "type": "number",
+                },
+                "fields": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "fields",
+                    "type": "string",
+                },
+                "filters": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "filters",
+                    "type": "string",
+                },
+                "fingerprint": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "fingerprint",
+                    "type": "string",
+                },
+                "id": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": False,
+                    "model": None,
+                    "prettyName": "id",
+                    "type": "string",
+                },
+                "last_seen": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "datetime",
+                    "prettyName": "last_seen",
+                    "type": "datetime",
+                },
+                "max_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "max_duration",
+                    "type": "number",
+                },
+                "mean_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": False,
+                    "model": None,
+                    "prettyName": "mean_duration",
+                    "type": "string",
+                },
+                "model_name": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "model_name",
+                    "type": "string",
+                },
+                "p50_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "p50_duration",
+                    "type": "number",
+                },
+                "p95_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "p95_duration",
+                    "type": "number",
+                },
+                "total_duration": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "total_duration",
+                    "type": "number",
+                },
+                "total_sql_time": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "total_sql_time",
+                    "type": "number",
+                },
+            },
+            "sortedFields": [
+                "id",
+                "admin",
+                "count",
+                "fields",
+                "filters",
+                "fingerprint",
+                "last_seen",
+                "max_duration",
+                "mean_duration",
+                "model_name",
+                "p50_duration",
+                "p95_duration",
+                "total_duration",
+                "total_sql_time",
+            ],
+        },
         "data_browser.View": {
             "fields": {
                 "admin": {
@@ -2201,6 +2749,38 @@ snapshots["test_query_ctx config"] = {
                     "prettyName": "query",
                     "type": "string",
                 },
+                "refresh_interval": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "number",
+                    "prettyName": "refresh_interval",
+                    "type": "number",
+                },
+                "snapshot_time": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "datetime",
+                    "prettyName": "snapshot_time",
+                    "type": "datetime",
+                },
+                "watermark": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "watermark",
+                    "type": "string",
+                },
+                "watermark_field": {
+                    "canPivot": True,
+                    "choices": [],
+                    "concrete": True,
+                    "model": "string",
+                    "prettyName": "watermark_field",
+                    "type": "string",
+                },
             },
             "sortedFields": [
                 "id",
@@ -2218,6 +2798,10 @@ snapshots["test_query_ctx config"] = {
                 "public_link",
                 "public_slug",
                 "query",
+                "refresh_interval",
+                "snapshot_time",
+                "watermark",
+                "watermark_field",
             ],
         },
         "date": {
@@ -2888,6 +3472,8 @@ snapshots["test_query_ctx config"] = {
     "sortedModels": [
         "auth.Group",
         "auth.User",
+        "data_browser.QueryLog",
+        "data_browser.QueryStats",
         "data_browser.View",
         "tests.Address",
         "tests.InAdmin",
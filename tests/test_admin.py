@@ -4,7 +4,7 @@ from django.contrib.admin.utils import flatten_fieldsets
 from django.contrib.auth.models import Permission, User
 
 from data_browser.admin import ViewAdmin
-from data_browser.models import View
+from data_browser.models import QueryStats, View
 
 
 @pytest.fixture
@@ -81,6 +81,10 @@ class TestAdminFieldsSuperUser:
             "open_view",
             "public_link",
             "limit",
+            "refresh_interval",
+            "snapshot_time",
+            "watermark_field",
+            "watermark",
         }
 
     def test_private_view_edit_everything(self, admin_user, get_admin_details, view):
@@ -100,6 +104,10 @@ class TestAdminFieldsSuperUser:
             "open_view",
             "public_link",
             "limit",
+            "refresh_interval",
+            "snapshot_time",
+            "watermark_field",
+            "watermark",
         }
 
     def test_public_view_edit_everything(self, admin_user, get_admin_details, view):
@@ -120,6 +128,10 @@ class TestAdminFieldsSuperUser:
             "open_view",
             "public_link",
             "limit",
+            "refresh_interval",
+            "snapshot_time",
+            "watermark_field",
+            "watermark",
         }
 
 
@@ -137,6 +149,10 @@ class TestAdminFieldsStaffUser:
             "id",
             "open_view",
             "limit",
+            "refresh_interval",
+            "snapshot_time",
+            "watermark_field",
+            "watermark",
         }
 
     def test_private_view_no_public_fields(self, staff_user, get_admin_details, view):
@@ -152,6 +168,10 @@ class TestAdminFieldsStaffUser:
             "id",
             "open_view",
             "limit",
+            "refresh_interval",
+            "snapshot_time",
+            "watermark_field",
+            "watermark",
         }
 
     def test_public_view_readonly(self, staff_user, get_admin_details, view):
@@ -168,4 +188,16 @@ class TestAdminFieldsStaffUser:
             "owner",
             "query",
             "limit",
+            "refresh_interval",
+            "snapshot_time",
+            "watermark_field",
+            "watermark",
         }
+
+
+@pytest.mark.parametrize("model", ["querylog", "querystats"])
+def test_query_log_admin(admin_client, model):
+    QueryStats.objects.create(fingerprint="abc", model_name="app.model", count=1)
+    res = admin_client.get(f"/admin/data_browser/{model}/")
+    assert res.status_code == 200
+    assert admin_client.get(f"/admin/data_browser/{model}/add/").status_code == 403
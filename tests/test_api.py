@@ -1,7 +1,9 @@
 import json
+from datetime import datetime
 
 import pytest
 from django.contrib.auth.models import Permission, User
+from django.utils import timezone
 
 from data_browser.common import MAKE_PUBLIC_CODENAME
 from data_browser.models import View
@@ -74,6 +76,9 @@ class TestViewList:
                 "link": "/query/core.Product/admin.html?name__contains=sql&limit=1000",
                 "pk": view.pk,
                 "limit": 1000,
+                "refresh_interval": None,
+                "snapshot_time": None,
+                "watermark_field": "",
             }
         ]
 
@@ -108,6 +113,9 @@ class TestViewList:
             "link": "/query/core.Product/.html?&limit=1000",
             "pk": view.pk,
             "limit": 1000,
+            "refresh_interval": None,
+            "snapshot_time": None,
+            "watermark_field": "",
         }
 
         assert view.owner == admin_user
@@ -162,8 +170,54 @@ class TestViewDetail:
             "link": "/query/core.Product/admin.html?name__contains=sql&limit=1000",
             "pk": view.pk,
             "limit": 1000,
+            "refresh_interval": None,
+            "snapshot_time": None,
+            "watermark_field": "",
+            "snapshot": None,
         }
 
+    def test_get_snapshot(self, admin_client, view):
+        view.refresh_interval = 60
+        view.snapshot = json.dumps(
+            {"rows": [{"a": 1}], "cols": [{}], "cells": [[0, 0, {}]], "length": 1}
+        )
+        view.snapshot_time = datetime(2020, 1, 2, 3, 4, 5)
+        view.save()
+        resp = admin_client.get(f"/data_browser/api/views/{view.pk}/")
+        assert resp.json()["snapshot_time"] == "2020-01-02T03:04:05"
+        assert resp.json()["snapshot"] == {
+            "rows": [{"a": 1}],
+            "cols": [{}],
+            "body": [[{}]],
+            "length": 1,
+        }
+
+    @pytest.mark.parametrize(
+        "data,refresh_interval,cleared",
+        [
+            ({"refresh_interval": 60}, 60, False),
+            ({"refresh_interval": "bob"}, None, False),
+            ({"refresh_interval": 0}, 1, False),
+            ({"refresh_interval": None, "name": "bob"}, None, False),
+            ({"fields": "name"}, 10, True),
+            ({"watermark_field": "id"}, 10, True),
+        ],
+    )
+    def test_patch_schedule(self, admin_client, view, data, refresh_interval, cleared):
+        view.refresh_interval = 10
+        view.snapshot = "{}"
+        view.snapshot_time = timezone.now()
+        view.save()
+        resp = admin_client.patch(
+            f"/data_browser/api/views/{view.pk}/",
+            json.dumps(data),
+            content_type="application/json",
+        )
+        assert resp.status_code == 200
+        view.refresh_from_db()
+        assert view.refresh_interval == refresh_interval
+        assert (view.snapshot_time is None) == cleared
+
     def test_get_other_owner(self, admin_client, other_view):
         resp = admin_client.get(f"/data_browser/api/views/{other_view.pk}/")
         assert resp.status_code == 404
@@ -211,6 +265,9 @@ class TestViewDetail:
             "link": "/query/core.Product/admin.html?name__contains=sql&limit=1000",
             "pk": view.pk,
             "limit": 1000,
+            "refresh_interval": None,
+            "snapshot_time": None,
+            "watermark_field": "",
         }
 
         assert view.owner == admin_user
@@ -0,0 +1,84 @@
+import asyncio
+
+from data_browser.asgi import DISCONNECTED_KEY, DisconnectMiddleware
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def client(*messages):
+    async def receive():
+        if messages_left:
+            return messages_left.pop(0)
+        await asyncio.sleep(3600)  # pragma: no cover
+
+    messages_left = list(messages)
+    return receive
+
+
+BODY = [
+    {"type": "http.request", "body": b"a", "more_body": True},
+    {"type": "http.request", "body": b"b"},
+]
+DISCONNECT = {"type": "http.disconnect"}
+
+
+def test_disconnect():
+    async def app(scope, receive, send):
+        disconnected = scope[DISCONNECTED_KEY]
+        body = [await receive(), await receive()]
+        await disconnected.wait()
+        # anything read after the body is still passed through
+        return body, await receive()
+
+    body, message = run(
+        DisconnectMiddleware(app)({"type": "http"}, client(*BODY, DISCONNECT), None)
+    )
+    assert body == BODY
+    assert message == DISCONNECT
+
+
+def test_disconnect_during_body():
+    async def app(scope, receive, send):
+        await receive()
+        return await receive(), scope[DISCONNECTED_KEY].is_set()
+
+    res = run(
+        DisconnectMiddleware(app)({"type": "http"}, client(BODY[0], DISCONNECT), None)
+    )
+    assert res == (DISCONNECT, True)
+
+
+def test_connected():
+    async def app(scope, receive, send):
+        await receive()
+        await asyncio.sleep(0)
+        return scope[DISCONNECTED_KEY].is_set()
+
+    assert (
+        run(DisconnectMiddleware(app)({"type": "http"}, client(BODY[1]), None)) is False
+    )
+
+
+def test_other_scopes():
+    async def app(scope, receive, send):
+        return scope
+
+    assert run(DisconnectMiddleware(app)({"type": "lifespan"}, None, None)) == {
+        "type": "lifespan"
+    }
+
+
+def test_other_messages():
+    async def app(scope, receive, send):
+        await receive()
+        return await receive(), scope[DISCONNECTED_KEY].is_set()
+
+    other = {"type": "http.other"}
+    res = run(DisconnectMiddleware(app)({"type": "http"}, client(BODY[1], other), None))
+    assert res == (other, False)
@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+
+from data_browser.models import View
+
+
+@pytest.fixture
+def views(admin_user):
+    def make(name, **kwargs):
+        kwargs.setdefault("owner", admin_user)
+        kwargs.setdefault("model_name", "tests.Product")
+        return View.objects.create(name=name, **kwargs)
+
+    inactive = User.objects.create(username="inactive", is_staff=True, is_active=False)
+    an_hour_ago = timezone.now() - timedelta(hours=1)
+    return [
+        make("unscheduled"),
+        make("never_run", refresh_interval=60),
+        make("due", refresh_interval=60, snapshot_time=an_hour_ago),
+        make("not_due", refresh_interval=7200, snapshot_time=an_hour_ago),
+        make("no_owner", refresh_interval=60, owner=None),
+        make("inactive", refresh_interval=60, owner=inactive),
+        make("bad_model", refresh_interval=60, model_name="tests.Bob"),
+    ]
+
+
+def test_refresh_views(views, capsys):
+    call_command("refresh_views")
+    out, err = capsys.readouterr()
+
+    refreshed = {v.name for v in View.objects.all() if v.snapshot}
+    assert refreshed == {"never_run", "due"}
+    assert out.count("Refreshed") == 2
+    assert err.count("Skipping") == 2
+    assert err.count("Failed") == 1
+
+
+def test_refresh_views_loop(views, mocker):
+    sleep = mocker.patch("time.sleep", side_effect=[None, KeyboardInterrupt])
+    refresh = mocker.patch.object(View, "refresh_snapshot")
+    with pytest.raises(KeyboardInterrupt):
+        call_command("refresh_views", "--loop", "--sleep=5")
+    sleep.assert_called_with(5)
+    assert refresh.call_count == 2 * 3
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from django.utils import timezone
+
+from data_browser.common import (
+    JsonResponse,
+    ThreadPool,
+    _json_dumps,
+    dumps,
+    get_query_context,
+    query_context,
+)
+
+DATA = {
+    "date": date(2020, 1, 2),
+    "datetime": datetime(2020, 1, 2, 3, 4, 5, 678901),
+    "aware": datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+    "time": time(3, 4, 5),
+    "duration": timedelta(days=1, seconds=5),
+    "decimal": Decimal("1.50"),
+    "uuid": UUID("12345678123456781234567812345678"),
+    "nested": [{1: "a", "b": None, "c": [1.5, True, "é"]}],
+}
+
+
+def upper_dumps(data):
+    return json.dumps(data).upper()
+
+
+def test_dumps_orjson(settings):
+    expected = json.loads(dumps(DATA))
+    settings.DATA_BROWSER_JSON_SERIALIZER = "orjson"
+    assert json.loads(dumps(DATA)) == expected
+
+
+def test_dumps_dotted_path(settings):
+    settings.DATA_BROWSER_JSON_SERIALIZER = "tests.test_common.upper_dumps"
+    assert dumps({"a": 1}) == '{"A": 1}'
+
+
+def test_orjson_fallback(settings, monkeypatch):
+    settings.DATA_BROWSER_JSON_SERIALIZER = "orjson"
+    assert dumps({"big": 2**70}) == '{"big": 1180591620717411303424}'
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    assert dumps(DATA) == _json_dumps(DATA)
+
+
+def test_orjson_unserializable(settings):
+    settings.DATA_BROWSER_JSON_SERIALIZER = "orjson"
+    with pytest.raises(TypeError):
+        dumps({"a": object()})
+
+
+def test_json_response(settings):
+    settings.DATA_BROWSER_JSON_SERIALIZER = "orjson"
+    res = JsonResponse({"a": Decimal("1.5")})
+    assert res["Content-Type"] == "application/json"
+    assert json.loads(res.content) == {"a": "1.5"}
+
+
+def test_query_context(rf):
+    request = rf.get("/")
+    assert get_query_context() is None
+    with query_context(request, ["a"]) as outer:
+        assert get_query_context() == {"calculated_fields": {"a"}, "fields": {"a"}}
+        with query_context(outer, ["b"]) as inner:
+            assert get_query_context() is inner.data_browser
+            assert inner.data_browser["fields"] == {"b"}
+        assert get_query_context() is outer.data_browser
+        assert outer.data_browser["fields"] == {"a"}
+    assert get_query_context() is None
+    assert not hasattr(request, "data_browser")
+
+
+def test_query_context_threads(rf):
+    # each thread has its own query context
+    def get_fields(fields):
+        with query_context(rf.get("/"), fields):
+            barrier.wait()
+            return get_query_context()["fields"]
+
+    barrier = threading.Barrier(2)
+    with ThreadPoolExecutor(2) as executor:
+        results = list(executor.map(get_fields, [["a"], ["b"]]))
+    assert results == [{"a"}, {"b"}]
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="asyncio contexts need 3.7")
+def test_query_context_tasks(rf):
+    # and so does each asyncio task
+    async def get_fields(fields, ready, go):
+        with query_context(rf.get("/"), fields):
+            ready.set()
+            await go.wait()
+            return get_query_context()["fields"]
+
+    async def main():
+        events = [asyncio.Event() for _ in range(3)]
+        tasks = [
+            asyncio.ensure_future(get_fields(["a"], events[0], events[2])),
+            asyncio.ensure_future(get_fields(["b"], events[1], events[2])),
+        ]
+        await events[0].wait()
+        await events[1].wait()
+        events[2].set()
+        return await asyncio.gather(*tasks)
+
+    assert asyncio.new_event_loop().run_until_complete(main()) == [{"a"}, {"b"}]
+
+
+def test_thread_pool(settings):
+    settings.DATA_BROWSER_PIVOT_THREADS = 2
+    pool = ThreadPool("DATA_BROWSER_PIVOT_THREADS", "test_pool")
+    # concurrent first calls share one executor
+    with ThreadPoolExecutor(max_workers=8) as callers:
+        executors = set(callers.map(lambda _: pool.get(), range(8)))
+    assert len(executors) == 1
+    (first,) = executors
+    assert first.submit(threading.current_thread).result().name.startswith("test_pool")
+
+    # resizing replaces the pool and shuts down the old one
+    settings.DATA_BROWSER_PIVOT_THREADS = 3
+    second = pool.get()
+    assert second is not first
+    assert second._max_workers == 3
+    assert first._shutdown
+    assert pool.get() is second
@@ -1,3 +1,5 @@
+from data_browser.helpers import AdminMixin
+
 from .admin import AddressAdmin, ProductAdmin
 from .models import Address, Producer, Product
 
@@ -40,3 +42,10 @@ class TestAnnotationOptimization:
         )
         assert admin_client.get(f"/admin/tests/address/").status_code == 200
         get_queryset.assert_not_called()
+
+
+def test_fields_for_request_without_query_context(rf):
+    # for code that sets request.data_browser itself
+    request = rf.get("/")
+    request.data_browser = {"calculated_fields": {"a"}, "fields": {"a"}}
+    assert AdminMixin().get_fields_for_request(request) == {"a"}
@@ -0,0 +1,114 @@
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from data_browser import limits
+from data_browser.limits import TooManyQueries, acquire_query_slot
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def users():
+    return [User(pk=1), User(pk=2)]
+
+
+def test_unlimited(users, mocker):
+    incr = mocker.patch.object(cache, "incr")
+    release = acquire_query_slot(users[0])
+    acquire_query_slot(users[0])
+    release()
+    incr.assert_not_called()
+
+
+def test_user_limit(users, settings):
+    settings.DATA_BROWSER_MAX_USER_QUERIES = 1
+    release = acquire_query_slot(users[0])
+    with pytest.raises(TooManyQueries) as e:
+        acquire_query_slot(users[0])
+    assert e.value.retry_after == 5
+    acquire_query_slot(users[1])
+
+    release()
+    release()  # only gives back the one slot
+    acquire_query_slot(users[0])
+    with pytest.raises(TooManyQueries):
+        acquire_query_slot(users[0])
+
+
+def test_global_limit(users, settings):
+    settings.DATA_BROWSER_MAX_QUERIES = 2
+    settings.DATA_BROWSER_MAX_USER_QUERIES = 2
+    acquire_query_slot(users[0])
+    acquire_query_slot(users[1])
+    with pytest.raises(TooManyQueries):
+        acquire_query_slot(users[1])
+    # the user's slot is given back when the global limit is hit
+    assert cache.get(f"{limits._LIMITS_PREFIX}:user:2") == 1
+
+
+def test_queue(users, settings, mocker):
+    settings.DATA_BROWSER_MAX_QUERIES = 1
+    settings.DATA_BROWSER_QUERY_QUEUE_SIZE = 1
+    release = acquire_query_slot(users[0])
+    # the slot is freed while we wait
+    sleep = mocker.patch.object(limits.time, "sleep", side_effect=lambda s: release())
+    acquire_query_slot(users[1])
+    sleep.assert_called_once_with(limits._POLL_INTERVAL)
+    assert cache.get(f"{limits._LIMITS_PREFIX}:queue") == 0
+
+
+def test_queue_timeout(users, settings, mocker):
+    settings.DATA_BROWSER_MAX_QUERIES = 1
+    settings.DATA_BROWSER_QUERY_QUEUE_SIZE = 1
+    settings.DATA_BROWSER_QUERY_QUEUE_WAIT = 0.05
+    mocker.patch.object(limits, "_POLL_INTERVAL", 0.01)
+    acquire_query_slot(users[0])
+    with pytest.raises(TooManyQueries) as e:
+        acquire_query_slot(users[1])
+    assert e.value.retry_after == 1
+    assert cache.get(f"{limits._LIMITS_PREFIX}:queue") == 0
+
+
+def test_queue_full(users, settings, mocker):
+    settings.DATA_BROWSER_MAX_QUERIES = 1
+    settings.DATA_BROWSER_QUERY_QUEUE_SIZE = 1
+    cache.set(f"{limits._LIMITS_PREFIX}:queue", 1)
+    sleep = mocker.patch.object(limits.time, "sleep")
+    acquire_query_slot(users[0])
+    with pytest.raises(TooManyQueries):
+        acquire_query_slot(users[1])
+    sleep.assert_not_called()
+
+
+def test_count_expires(users, settings, mocker):
+    settings.DATA_BROWSER_MAX_QUERIES = 1
+    incr = cache.incr
+    calls = []
+
+    def expire_first(key, delta=1, **kwargs):
+        # the count expires between being added and incremented
+        calls.append(key)
+        if len(calls) == 1:
+            cache.delete(key)
+        return incr(key, delta, **kwargs)
+
+    mocker.patch.object(cache, "incr", side_effect=expire_first)
+    release = acquire_query_slot(users[0])
+    assert cache.get(f"{limits._LIMITS_PREFIX}:all") == 1
+    cache.clear()
+    release()
+
+
+def test_count_restarted(users, settings):
+    settings.DATA_BROWSER_MAX_QUERIES = 1
+    release = acquire_query_slot(users[0])
+    # the count expires and a new one is started
+    cache.set(f"{limits._LIMITS_PREFIX}:all", 0)
+    release()
+    assert cache.get(f"{limits._LIMITS_PREFIX}:all") == 0
@@ -0,0 +1,92 @@
+import pytest
+
+from data_browser import metrics
+from data_browser.metrics import Registry
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.registry.reset()
+    yield
+    metrics.registry.reset()
+
+
+def test_render():
+    registry = Registry()
+    phases = {"sql": {"dur": 0.25, "queries": 2, "rows": 3}}
+    registry.record("tests.Product", "json", 200, 0.05, phases, 3, False)
+    registry.record("tests.Product", "json", 200, 0.3, phases, 3, True)
+    registry.record("tests.Product", "csv", 504, 20, {}, None, None)
+    registry.record('te"st\\s\n', "json", 200, 0.001, {}, 0, None)
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == [
+        "# HELP data_browser_queries_total Queries run.",
+        "# TYPE data_browser_queries_total counter",
+    ]
+    assert (
+        'data_browser_queries_total{model="te\\"st\\\\s\\n",media="json",status="200"} 1'
+        in lines
+    )
+    assert (
+        'data_browser_queries_total{model="tests.Product",media="csv",status="504"} 1'
+        in lines
+    )
+    assert (
+        'data_browser_queries_total{model="tests.Product",media="json",status="200"} 2'
+        in lines
+    )
+    buckets = [
+        line
+        for line in lines
+        if line.startswith('data_browser_query_duration_seconds_bucket{model="tests')
+    ]
+    assert [line.split(" ")[-1] for line in buckets] == [
+        "0",
+        "1",
+        "1",
+        "2",
+        "2",
+        "2",
+        "2",
+        "3",
+    ]
+    assert buckets[-1].startswith(
+        'data_browser_query_duration_seconds_bucket{model="tests.Product",le="+Inf"}'
+    )
+    assert (
+        'data_browser_query_duration_seconds_sum{model="tests.Product"} 20.35' in lines
+    )
+    assert 'data_browser_query_duration_seconds_count{model="tests.Product"} 3' in lines
+    assert 'data_browser_phase_seconds_total{phase="sql"} 0.5' in lines
+    assert 'data_browser_sql_queries_total{phase="sql"} 4' in lines
+    assert 'data_browser_rows_total{model="tests.Product"} 6' in lines
+    assert 'data_browser_result_cache_total{result="hit"} 1' in lines
+    assert 'data_browser_result_cache_total{result="miss"} 1' in lines
+
+
+def test_disabled(admin_client):
+    admin_client.get("/data_browser/query/tests.Product/name.json")
+    assert "tests.Product" not in metrics.registry.render()
+    assert admin_client.get("/data_browser/metrics").status_code == 404
+
+
+def test_metrics(admin_client, client, settings):
+    settings.DATA_BROWSER_METRICS_TOKEN = "secret"
+    admin_client.get("/data_browser/query/tests.Product/name.json")
+
+    res = client.get("/data_browser/metrics")
+    assert res.status_code == 401
+    assert res["WWW-Authenticate"] == "Bearer"
+    res = client.get("/data_browser/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+    assert res.status_code == 401
+
+    res = client.get("/data_browser/metrics", HTTP_AUTHORIZATION="Bearer secret")
+    assert res.status_code == 200
+    assert res["Content-Type"] == "text/plain; version=0.0.4; charset=utf-8"
+    content = res.content.decode()
+    assert (
+        'data_browser_queries_total{model="tests.Product",media="json",status="200"} 1'
+        in content
+    )
+    assert 'data_browser_sql_queries_total{phase="sql"} 1' in content
@@ -1,6 +1,17 @@
+import threading
+from datetime import timedelta
+
 import pytest
+from django.db import IntegrityError
+from django.http import QueryDict
+from django.utils import timezone
+
+import data_browser.models
+from data_browser import orm
+from data_browser.models import QueryLog, QueryStats, View, global_data
+from data_browser.query import Query
 
-from data_browser.models import View, global_data
+from . import models
 
 
 @pytest.fixture
@@ -30,6 +41,15 @@ def test_public_link(view, global_request, settings):
     assert view.public_link() == "Public Views are disabled in Django settings."
 
 
+def test_global_request_per_thread(global_request):
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(global_data.request))
+    thread.start()
+    thread.join()
+    assert seen == [None]
+    assert global_data.request is global_request
+
+
 def test_google_sheets_formula(view, global_request, settings):
     assert view.google_sheets_formula() == "N/A"
     view.public = True
@@ -41,3 +61,232 @@ def test_google_sheets_formula(view, global_request, settings):
     assert (
         view.google_sheets_formula() == "Public Views are disabled in Django settings."
     )
+
+
+def test_refresh_due(view):
+    assert not view.refresh_due
+    view.refresh_interval = 60
+    assert view.refresh_due
+    view.snapshot_time = timezone.now() - timedelta(seconds=59)
+    assert not view.refresh_due
+    view.snapshot_time = timezone.now() - timedelta(seconds=60)
+    assert view.refresh_due
+
+
+@pytest.mark.django_db
+def test_refresh_snapshot(admin_user):
+    address = models.Address.objects.create(city="london")
+    producer = models.Producer.objects.create(name="Bob", address=address)
+    models.Product.objects.create(name="a", size=1, producer=producer)
+    view = View.objects.create(
+        model_name="tests.Product",
+        fields="name,&size,id__count",
+        owner=admin_user,
+        refresh_interval=60,
+    )
+    assert view.get_snapshot() is None
+
+    view.refresh_snapshot()
+    view.refresh_from_db()
+    assert view.snapshot_time
+    assert view.get_snapshot() == {
+        "rows": [{"name": "a"}],
+        "cols": [{"size": 1}],
+        "cells": {(0, 0): {"id__count": 1}},
+        "length": 1,
+    }
+
+    view.refresh_interval = None
+    assert view.get_snapshot() is None
+
+
+@pytest.mark.django_db
+def test_refresh_snapshot_over_cost_limit(admin_user, settings, mocker):
+    mocker.patch.object(orm, "_estimate_rows", return_value=10)
+    settings.DATA_BROWSER_QUERY_COST_LIMIT = 1
+    view = View.objects.create(
+        model_name="tests.Product", fields="name", owner=admin_user
+    )
+    view.refresh_snapshot()  # snapshots are how expensive views are run off peak
+    view.refresh_from_db()
+    assert view.snapshot_time
+    assert not orm.cost_confirmed.get()
+
+
+@pytest.mark.django_db
+def test_refresh_snapshot_bad_model(admin_user):
+    view = View.objects.create(model_name="tests.Bob", owner=admin_user)
+    with pytest.raises(ValueError):
+        view.refresh_snapshot()
+
+
+class TestIncrementalRefresh:
+    @pytest.fixture
+    def producer(self, db):
+        address = models.Address.objects.create(city="london")
+        return models.Producer.objects.create(name="Bob", address=address)
+
+    @pytest.fixture
+    def add(self, producer):
+        def helper(name, size):
+            models.Product.objects.create(name=name, size=size, producer=producer)
+
+        return helper
+
+    @pytest.fixture
+    def make_view(self, admin_user):
+        def helper(fields, query=""):
+            return View.objects.create(
+                model_name="tests.Product",
+                fields=fields,
+                owner=admin_user,
+                refresh_interval=60,
+                watermark_field="id",
+                query=query,
+            )
+
+        return helper
+
+    def full_results(self, view):
+        full = View(
+            model_name=view.model_name,
+            fields=view.fields,
+            query=view.query,
+            owner=view.owner,
+            refresh_interval=60,
+        )
+        full.refresh_snapshot()
+        return full.get_snapshot()
+
+    def test_merged(self, add, make_view, mocker):
+        add("a", 1)
+        add("b", 2)
+        view = make_view(
+            "name,id__count,size__sum,size__min,size__max-1", query="size__lt=10"
+        )
+        merge = mocker.spy(orm, "merge_results")
+
+        view.refresh_snapshot()
+        assert view.watermark
+        merge.assert_not_called()
+
+        add("a", 3)
+        add("c", 4)
+        add("d", 11)
+        view.refresh_snapshot()
+        assert merge.spy_return is not None
+        assert view.get_snapshot() == self.full_results(view)
+        assert view.get_snapshot()["rows"][0] == {
+            "name": "c",
+            "id__count": 1,
+            "size__sum": 4,
+            "size__min": 4,
+            "size__max": 4,
+        }
+
+        view.refresh_snapshot()  # nothing new
+        assert view.get_snapshot() == self.full_results(view)
+
+    def test_unmergeable(self, add, make_view, mocker):
+        add("a", 1)
+        view = make_view("name,size__average")
+        view.refresh_snapshot()
+        add("a", 3)
+        merge = mocker.spy(orm, "merge_results")
+        view.refresh_snapshot()
+        merge.assert_not_called()
+        assert view.get_snapshot()["rows"] == [{"name": "a", "size__average": 2}]
+
+    def test_truncated(self, add, make_view, settings):
+        settings.DATA_BROWSER_DEFAULT_ROW_LIMIT = 1
+        add("a", 1)
+        view = make_view("name")
+        view.refresh_snapshot()
+        add("b", 2)
+        view.refresh_snapshot()
+        assert view.get_snapshot()["rows"] == [{"name": "a"}]
+
+    def test_no_rows(self, make_view, add):
+        view = make_view("name")
+        view.refresh_snapshot()
+        assert view.watermark == ""
+        add("a", 1)
+        view.refresh_snapshot()
+        assert view.get_snapshot()["rows"] == [{"name": "a"}]
+
+
+class TestQueryLog:
+    @pytest.fixture
+    def log(self, rf, admin_user, mocker):
+        def helper(query="size__lt=1&size__gt=0&name__equals=a", duration=1):
+            request = rf.get("/")
+            request.user = admin_user
+            query = Query.from_request(
+                "tests.Product", "size-0,&name", QueryDict(query)
+            )
+            timings = mocker.Mock(phases={"sql": {"dur": 0.5, "rows": 3}})
+            return QueryLog.log(request, query, "json", None, duration, timings)
+
+        return helper
+
+    def test_fingerprint(self, log):
+        first = log()
+        assert first.fields == "size-0,&name"
+        assert first.filters == "name__equals,size__gt,size__lt"
+        assert first.sql_time == 0.5
+        assert first.rows == 3
+        assert str(first) == "tests.Product query: size-0,&name"
+        # the filter values don't matter
+        assert log("name__equals=b&size__gt=1&size__lt=2").fingerprint == (
+            first.fingerprint
+        )
+        assert log("size__lt=1").fingerprint != first.fingerprint
+
+    def test_stats(self, log, mocker):
+        mocker.patch.object(data_browser.models, "_STATS_SAMPLE_SIZE", 20)
+        for duration in range(1, 21):
+            log(duration=duration)
+        log("size__lt=1", duration=100)
+
+        stats = QueryStats.objects.order_by("-p95_duration")
+        assert [(s.count, s.p50_duration, s.p95_duration) for s in stats] == [
+            (1, 100, 100),
+            (20, 10, 19),
+        ]
+        assert stats[1].max_duration == 20
+        assert stats[1].mean_duration == 10.5
+        assert stats[1].total_sql_time == 10
+        assert str(stats[1]) == "tests.Product queries: size-0,&name"
+
+        # only the latest are used for the percentiles
+        for _ in range(20):
+            log(duration=1)
+        stats = QueryStats.objects.get(pk=stats[1].pk)
+        assert (stats.count, stats.p95_duration, stats.max_duration) == (40, 1, 20)
+
+    def test_long_model_name(self, rf, admin_user, mocker):
+        request = rf.get("/")
+        request.user = admin_user
+        model_name = "django_celery_beat.IntervalSchedule"
+        query = Query.from_request(model_name, "every", QueryDict())
+        timings = mocker.Mock(phases={})
+        QueryLog.log(request, query, "json", None, 1, timings)
+        assert QueryStats.objects.get().model_name == model_name
+
+    def test_stats_created_concurrently(self, log, mocker):
+        log()
+        mocker.patch.object(
+            QueryStats.objects, "get_or_create", side_effect=IntegrityError("dupe")
+        )
+        log(duration=3)
+        stats = QueryStats.objects.get()
+        assert (stats.count, stats.max_duration) == (2, 3)
+
+    def test_atomic(self, log, mocker):
+        mocker.patch.object(QueryStats, "update", side_effect=Exception("boom"))
+        with pytest.raises(Exception, match="boom"):
+            log()
+        assert not QueryLog.objects.exists()
+
+    def test_mean_duration_unused(self):
+        assert QueryStats().mean_duration == 0
@@ -1,8 +1,13 @@
+import contextvars
+import threading
 from datetime import datetime
 
 import pytest
+from django import db
+from django.contrib.admin import site
 from django.contrib.admin.options import BaseModelAdmin
 from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
 from django.utils import timezone
 
 from data_browser import orm, orm_fields
@@ -10,7 +15,8 @@ from data_browser.orm import admin_get_queryset
 from data_browser.query import BoundQuery, Query
 
 from . import models
-from .util import ANY, KEYS
+from .admin import InAdmin, TagAdmin
+from .util import ANY, KEYS, SLOW_SQL
 
 
 def sortedAssert(a, b):
@@ -22,6 +28,14 @@ def admin_link(obj):
     return f'<a href="/admin/tests/{model}/{obj.pk}/change/">{obj}</a>'
 
 
+def summarize(orm_models):
+    # inline admins are instantiated per request so compare their types
+    return {
+        name: (sorted(orm_model.fields), type(orm_model.admin))
+        for name, orm_model in orm_models.items()
+    }
+
+
 def flatten_table(fields, data):
     return [[(row[f.path_str] if row else None) for f in fields] for row in data]
 
@@ -182,6 +196,11 @@ def test_get_annotated_field_down_tree(products, get_product_flat, mocker):
     assert len(mock.call_args_list) == 2
 
 
+def test_admin_get_queryset_leaves_request_alone(req):
+    admin_get_queryset(site._registry[models.Product], req, ["annotated"])
+    assert not hasattr(req, "data_browser")
+
+
 @pytest.mark.usefixtures("products")
 def test_get_multiple_calculated_fields_on_admins(get_product_flat):
     data = get_product_flat(3, "producer__address__bob,producer__frank", {})
@@ -388,8 +407,9 @@ def test_get_results_admin_causes_query(get_product_flat, products):
 
 @pytest.mark.usefixtures("pivot_products")
 def test_get_pivot(get_product_pivot):
+    # the rows are read off the main query, the cols aren't sorted first
     data = get_product_pivot(
-        3, "created_time__year+0,&created_time__month+1,id__count", {}
+        2, "created_time__year+0,&created_time__month+1,id__count", {}
     )
     assert data == {
         "body": [[[1], [3]], [[2], [4]]],
@@ -398,10 +418,19 @@ def test_get_pivot(get_product_pivot):
     }
 
 
+@pytest.mark.usefixtures("pivot_products")
+def test_get_pivot_limited(get_product_pivot):
+    # the main query has cells for rows that don't make the row limit
+    data = get_product_pivot(
+        3, "created_time__year+1,&created_time__month+0,id__count", {"limit": ["2"]}
+    )
+    assert data == {"body": [[[1]]], "cols": [["January"]], "rows": [[2020]]}
+
+
 @pytest.mark.usefixtures("pivot_products")
 def test_get_pivot_multi_agg(get_product_pivot):
     data = get_product_pivot(
-        3, "created_time__year+0,&created_time__month+1,size__count,size__max", {}
+        2, "created_time__year+0,&created_time__month+1,size__count,size__max", {}
     )
     assert data == {
         "body": [[[1, 1], [3, 6]], [[2, 3], [4, 10]]],
@@ -443,7 +472,7 @@ def test_pivot_sorting(get_product_pivot):
         models.Product.objects.create(created_time=dt, name=str(dt), producer=producer)
 
     data = get_product_pivot(
-        3, "&created_time__year+1,created_time__month+2,id__count", {}
+        2, "&created_time__year+1,created_time__month+2,id__count", {}
     )
     assert data == {
         "body": [[[None], [1]], [[2], [3]]],
@@ -452,7 +481,7 @@ def test_pivot_sorting(get_product_pivot):
     }
 
     data = get_product_pivot(
-        3, "&created_time__year+2,created_time__month+1,id__count", {}
+        2, "&created_time__year+2,created_time__month+1,id__count", {}
     )
     assert data == {
         "body": [[[None], [1]], [[2], [3]]],
@@ -461,10 +490,63 @@ def test_pivot_sorting(get_product_pivot):
     }
 
 
+@pytest.mark.usefixtures("pivot_products")
+@pytest.mark.parametrize(
+    "fields,queries",
+    [
+        ("created_time__year,&created_time__month,id__count", 1),
+        ("created_time__year+0,&created_time__month,id__count-1", 1),
+        ("created_time__year,&created_time__month,id__count-1", 1),
+        ("created_time__year+1,&created_time__month,id__count-0", 2),
+        ("created_time__year+1,&created_time__month-0,id__count", 2),
+        ("created_time__year+1,&created_time__month-2,id__count+0", 3),
+    ],
+)
+def test_pivot_sub_queries(get_product_pivot, fields, queries, mocker):
+    def cells(data):
+        return {
+            (*row, *col): data["body"][col_index][row_index]
+            for row_index, row in enumerate(data["rows"])
+            for col_index, col in enumerate(data["cols"])
+        }
+
+    data = get_product_pivot(queries, fields, {})
+    mocker.patch.object(orm, "_sorts_first", return_value=False)
+    expected = get_product_pivot(3, fields, {})
+    # order on unsorted axes is up to the db
+    assert cells(data) == cells(expected)
+    if "year+" in fields:
+        assert data["rows"] == expected["rows"]
+    if "month-" in fields:
+        assert data["cols"] == expected["cols"]
+
+
+@pytest.mark.usefixtures("pivot_products")
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize(
+    "fields",
+    [
+        "&created_time__year+,created_time__month-,id__count",
+        "&created_time__year,created_time__month,id__count",
+    ],
+)
+@pytest.mark.parametrize("limit", [1000, 3])
+def test_pivot_threads(req, orm_models, settings, fields, limit):
+    def get_results():
+        query = Query.from_request("tests.Product", fields, {"limit": [str(limit)]})
+        bound_query = BoundQuery.bind(query, orm_models)
+        return orm.get_results(req, bound_query, orm_models)
+
+    expected = get_results()
+    settings.DATA_BROWSER_PIVOT_THREADS = 2
+    assert get_results() == expected
+    assert orm._get_pivot_executor() is orm._get_pivot_executor()
+
+
 @pytest.mark.usefixtures("pivot_products")
 def test_pivot_having(get_product_pivot):
     data = get_product_pivot(
-        3,
+        1,
         "&created_time__year,created_time__month,id__count",
         {"id__count__equals": [4]},
     )
@@ -507,7 +589,7 @@ def test_get_pivot_permutations(get_product_pivot, key, rows, cols, body):
 
     queries = 0 if key.endswith("---") else 1
     if "r" in key and "c" in key:
-        queries += 2
+        queries += 1  # only the cols sub query
 
     results = get_product_pivot(queries, ",".join(fields), filters)
     assert results["rows"] == rows
@@ -515,6 +597,211 @@ def test_get_pivot_permutations(get_product_pivot, key, rows, cols, body):
     assert results["body"] == body
 
 
+@pytest.mark.parametrize(
+    "fields",
+    [
+        "",
+        "size-0,name+1,producer__address__bob,producer__address__admin",
+        "size__max,id__count",
+        "size,id__count",
+    ],
+)
+def test_iter_results(products, req, orm_models, fields):
+    query = Query.from_request("tests.Product", fields, {})
+    bound_query = BoundQuery.bind(query, orm_models)
+    expected = orm.get_results(req, bound_query, orm_models)["rows"]
+    rows = orm.iter_results(req, bound_query, orm_models, chunk_size=1)
+    assert list(rows) == expected
+
+
+@pytest.mark.usefixtures("products")
+class TestQueryTimeout:
+    @pytest.fixture
+    def get_results(self, req, orm_models):
+        def helper(fields="size-0,name+1", iterate=False):
+            query = Query.from_request("tests.Product", fields, {})
+            bound_query = BoundQuery.bind(query, orm_models)
+            if iterate:
+                return list(orm.iter_results(req, bound_query, orm_models))
+            return orm.get_results(req, bound_query, orm_models)["rows"]
+
+        return helper
+
+    @pytest.fixture
+    def timed_out(self, settings, mocker):
+        # check the deadline on every instruction and have it already passed
+        mocker.patch.object(orm, "_SQLITE_PROGRESS_OPCODES", 1)
+        settings.DATA_BROWSER_QUERY_TIMEOUT = 1e-9
+
+    def test_in_time(self, get_results, settings):
+        expected = get_results()
+        settings.DATA_BROWSER_QUERY_TIMEOUT = 60
+        assert get_results() == expected
+        assert get_results("size__max,id__count", iterate=True) == [
+            {"size__max": 2, "id__count": 3}
+        ]
+
+    @pytest.mark.skipif(db.connection.vendor != "sqlite", reason="sqlite progress")
+    @pytest.mark.parametrize("fields", ["size-0,name+1", "size__max"])
+    @pytest.mark.parametrize("iterate", [False, True])
+    def test_timeout(  # pragma: sqlite
+        self, get_results, timed_out, settings, fields, iterate
+    ):
+        with pytest.raises(orm.QueryTimeout):
+            get_results(fields, iterate)
+        # the connection is left as it was
+        settings.DATA_BROWSER_QUERY_TIMEOUT = 0
+        assert get_results(fields, iterate)
+
+    def test_other_errors(self, get_results, settings, mocker):
+        settings.DATA_BROWSER_QUERY_TIMEOUT = 60
+        mocker.patch.object(
+            orm, "_get_grouped_queryset", side_effect=db.DatabaseError("bad")
+        )
+        with pytest.raises(db.DatabaseError, match="bad"):
+            get_results()
+
+    def test_unsupported_db(self, get_results, timed_out, mocker):
+        mocker.patch.object(db.connection, "vendor", "oracle")
+        assert get_results()
+
+
+@pytest.mark.usefixtures("products")
+class TestQueryCost:
+    @pytest.fixture
+    def get_qs(self, req, orm_models):
+        def helper(fields="name", filters=None):
+            query = Query.from_request("tests.Product", fields, filters or {})
+            bound_query = BoundQuery.bind(query, orm_models)
+            return orm._get_filtered_queryset(req, bound_query, orm_models)
+
+        return helper
+
+    @pytest.fixture
+    def get_results(self, req, orm_models):
+        def helper(fields="size-0,name+1", iterate=False):
+            query = Query.from_request("tests.Product", fields, {})
+            bound_query = BoundQuery.bind(query, orm_models)
+            if iterate:
+                return orm.iter_results(req, bound_query, orm_models)
+            return orm.get_results(req, bound_query, orm_models)["rows"]
+
+        return helper
+
+    @pytest.mark.skipif(db.connection.vendor != "sqlite", reason="sqlite scans")
+    def test_estimate_sqlite(self, get_qs, mocker):  # pragma: sqlite
+        max_id = models.Product.objects.order_by("-id").first().id
+        assert orm._estimate_rows(get_qs()) == max_id
+        assert orm._estimate_rows(get_qs("producer__address__city")) == max_id
+        assert orm._estimate_rows(get_qs("name", {"id__equals": ["1"]})) == 0
+
+        with db.connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE ddb_t (x INTEGER PRIMARY KEY) WITHOUT ROWID")
+        assert orm._get_sqlite_table_rows(db.connection, "ddb_t") is None
+        mocker.patch.object(orm, "_get_sqlite_table_rows", return_value=None)
+        assert orm._estimate_rows(get_qs()) is None
+
+    def test_estimate(self, get_qs):
+        assert orm._estimate_rows(get_qs()) > 0
+        assert orm._estimate_rows(models.Product.objects.none()) == 0
+
+    @pytest.mark.parametrize("iterate", [False, True])
+    def test_guard(self, get_results, settings, mocker, iterate):
+        mocker.patch.object(orm, "_estimate_rows", return_value=10)
+        assert get_results(iterate=iterate)
+
+        settings.DATA_BROWSER_QUERY_COST_LIMIT = 10
+        assert get_results(iterate=iterate)
+
+        settings.DATA_BROWSER_QUERY_COST_LIMIT = 9
+        with pytest.raises(orm.QueryTooExpensive, match="read 10 rows") as e:
+            get_results(iterate=iterate)  # iter_results raises before iterating
+        assert e.value.rows == 10
+
+        token = orm.cost_confirmed.set(True)
+        try:
+            assert get_results(iterate=iterate)
+        finally:
+            orm.cost_confirmed.reset(token)
+
+    def test_plan_rows_read(self):
+        # a filtered scan of a big table joined to an index lookup
+        plan = {
+            "Node Type": "Nested Loop",
+            "Plan Rows": 10,
+            "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": "big", "Plan Rows": 10},
+                {"Node Type": "Index Scan", "Relation Name": "small", "Plan Rows": 1},
+            ],
+        }
+        assert orm._get_seq_scans(plan) == {"big"}
+        assert orm._get_plan_rows_read(plan, {"big": 5e8}) == 500000000
+        # reltuples is unknown before the table is analyzed
+        assert orm._get_plan_rows_read(plan, {}) == 10
+
+    def test_no_estimate(self, get_results, settings, mocker):
+        mocker.patch.object(orm, "_estimate_rows", return_value=None)
+        settings.DATA_BROWSER_QUERY_COST_LIMIT = 1
+        assert get_results()
+
+
+@pytest.mark.django_db
+class TestCancelScope:
+    @pytest.mark.skipif(db.connection.vendor != "sqlite", reason="sqlite interrupts")
+    def test_cancel(self):  # pragma: sqlite
+        scope = orm.CancelScope()
+        timer = threading.Timer(0.1, scope.cancel)
+        timer.start()
+        with pytest.raises(orm.QueryCancelled):
+            connection = db.connections["default"]
+            with scope.running(connection), connection.cursor() as cursor:
+                cursor.execute(SLOW_SQL)
+        timer.join()
+
+    def test_cancel_under_lock(self, mocker):
+        scope = orm.CancelScope()
+        locked = []
+        mocker.patch.object(
+            orm,
+            "_cancel_query",
+            side_effect=lambda c: locked.append(scope._lock.locked()),
+        )
+        with scope.running(db.connections["default"]):
+            scope.cancel()
+        assert locked == [True]
+
+    def test_cancel_closed_connection(self, mocker):
+        scope = orm.CancelScope()
+        connection = mocker.Mock(vendor="sqlite", connection=None)
+        with scope.running(connection):
+            scope.cancel()  # doesn't raise
+        assert scope.cancelled
+
+    def test_already_cancelled(self):
+        scope = orm.CancelScope()
+        scope.cancel()
+        with pytest.raises(orm.QueryCancelled):
+            with scope.running(db.connections["default"]):
+                pass  # pragma: no cover
+
+    def test_other_errors(self):
+        scope = orm.CancelScope()
+        with pytest.raises(db.DatabaseError):
+            connection = db.connections["default"]
+            with scope.running(connection), connection.cursor() as cursor:
+                cursor.execute("SELECT * FROM missing")
+
+    @pytest.mark.usefixtures("products")
+    def test_get_results(self, req, orm_models):
+        query = Query.from_request("tests.Product", "size-0,name+1", {})
+        bound_query = BoundQuery.bind(query, orm_models)
+        expected = orm.get_results(req, bound_query, orm_models)
+
+        context = contextvars.copy_context()
+        context.run(orm.cancel_scope.set, orm.CancelScope())
+        assert context.run(orm.get_results, req, bound_query, orm_models) == expected
+
+
 def test_get_fields(orm_models):
 
     # remap pk to id
@@ -536,7 +823,9 @@ class TestPermissions:
 
         request = rf.get("/")
         request.user = user
-        return orm.get_models(request)
+        orm_models = orm.get_models(request)
+        assert summarize(orm.get_models(request, lazy=True)) == summarize(orm_models)
+        return orm_models
 
     def test_all_perms(self, rf, admin_user):
         orm_models = self.get_fields_with_perms(
@@ -589,3 +878,282 @@ class TestPermissions:
         assert orm_models["tests.Normal"] == orm_fields.OrmModel(
             fields=KEYS("admin", "id", "name", "in_admin"), admin=ANY(BaseModelAdmin)
         )
+
+
+class TestLazyModels:
+    def test_matches_get_models(self, req):
+        lazy = orm.get_models(req, lazy=True)
+        orm_models = orm.get_models(req)
+        assert len(lazy) == len(orm_models)
+        assert summarize(lazy) == summarize(orm_models)
+        assert "tests.NotInAdmin" not in lazy
+        with pytest.raises(KeyError):
+            lazy["tests.NotInAdmin"]
+        with pytest.raises(KeyError):
+            lazy["tests.Bob"]
+
+    def test_only_touches_queried_models(self, req, mocker):
+        mock = mocker.patch(
+            "data_browser.orm._get_fields_for_model", wraps=orm._get_fields_for_model
+        )
+        orm_models = orm.get_models(req, lazy=True)
+        query = Query.from_request("tests.Product", "name,producer__address__city", {})
+        bound_query = BoundQuery.bind(query, orm_models)
+        assert [f.path_str for f in bound_query.fields] == [
+            "name",
+            "producer__address__city",
+        ]
+        assert sorted(c.args[1].__name__ for c in mock.call_args_list) == [
+            "Address",
+            "Producer",
+            "Product",
+        ]
+
+    def test_dynamic_inlines(self, req, mocker):
+        class DynamicInAdmin(InAdmin):
+            inlines = []
+
+            def get_inline_instances(self, request, obj=None):
+                return [
+                    inline(self.model, self.admin_site) for inline in InAdmin.inlines
+                ]
+
+        mocker.patch.dict(
+            site._registry,
+            {models.InAdmin: DynamicInAdmin(models.InAdmin, site)},
+        )
+        lazy = orm.get_models(req, lazy=True)
+        assert "tests.InlineAdmin" in lazy
+        assert summarize(lazy) == summarize(orm.get_models(req))
+
+    @pytest.mark.django_db
+    def test_invisible_parent(self, rf):
+        user = User.objects.create()
+        user.user_permissions.add(Permission.objects.get(codename="change_normal"))
+        request = rf.get("/")
+        request.user = user
+        lazy = orm.get_models(request, lazy=True)
+        assert "tests.InlineAdmin" not in lazy
+        assert "tests.InAdmin" not in lazy
+        assert "tests.Normal" in lazy
+
+
+class TestSchemaCache:
+    @pytest.fixture
+    def schema_cache(self, settings):
+        settings.DATA_BROWSER_SCHEMA_CACHE = True
+        orm.clear_schema_cache()
+        yield orm.schema_cache_stats
+        orm.clear_schema_cache()
+
+    def test_disabled(self, req):
+        stats = dict(orm.schema_cache_stats)
+        assert orm.get_models(req) is not orm.get_models(req)
+        assert orm.schema_cache_stats == stats
+
+    def test_hit(self, req, schema_cache):
+        hits, misses = schema_cache["hits"], schema_cache["misses"]
+        orm_models = orm.get_models(req)
+        assert orm.get_models(req) is orm_models
+        assert schema_cache["hits"] == hits + 1
+        assert schema_cache["misses"] == misses + 1
+
+    def test_keyed_on_permissions(self, req, rf, schema_cache):
+        user = User.objects.create(is_staff=True)
+        user.user_permissions.add(Permission.objects.get(codename="change_normal"))
+        other = rf.get("/")
+        other.user = user
+
+        assert "tests.Product" in orm.get_models(req)
+        assert "tests.Product" not in orm.get_models(other)
+
+    def test_clear(self, req, schema_cache):
+        orm_models = orm.get_models(req)
+        orm.clear_schema_cache()
+        assert orm.get_models(req) is not orm_models
+
+    def test_other_process_clear(self, req, schema_cache):
+        orm_models = orm.get_models(req)
+        cache.set(orm._SCHEMA_GENERATION_KEY, "elsewhere")
+        assert orm.get_models(req) is not orm_models
+
+    def test_registry_change(self, req, schema_cache, mocker):
+        orm_models = orm.get_models(req)
+        mocker.patch.dict(
+            site._registry, {models.NotInAdmin: TagAdmin(models.NotInAdmin, site)}
+        )
+        assert orm.get_models(req) is not orm_models
+
+    def test_size_limit(self, req, rf, schema_cache, settings):
+        settings.DATA_BROWSER_SCHEMA_CACHE_SIZE = 2
+        others = []
+        for codename in ["change_normal", "change_product"]:
+            user = User.objects.create(is_staff=True, username=codename)
+            user.user_permissions.add(Permission.objects.get(codename=codename))
+            other = rf.get("/")
+            other.user = user
+            others.append(other)
+
+        orm_models = orm.get_models(req)
+        orm.get_models(others[0])
+        assert orm.get_models(req) is orm_models  # now the most recently used
+        orm.get_models(others[1])  # evicts others[0]
+        assert len(orm._schema_cache) == 2
+        assert orm.get_models(req) is orm_models
+        misses = schema_cache["misses"]
+        orm.get_models(others[0])
+        assert schema_cache["misses"] == misses + 1
+
+    def test_cleared_while_building(self, req, schema_cache, mocker):
+        get_models = orm._get_models
+
+        def clear_then_build(request):
+            orm.clear_schema_cache()
+            return get_models(request)
+
+        mocker.patch.object(orm, "_get_models", side_effect=clear_then_build)
+        orm.get_models(req)
+        assert not orm._schema_cache  # built for an old generation, not kept
+
+    def test_generation_evicted(self, req, schema_cache):
+        orm_models = orm.get_models(req)
+        cache.delete(orm._SCHEMA_GENERATION_KEY)
+        assert orm.get_models(req) is not orm_models
+        assert orm.get_models(req) is orm.get_models(req)
+
+
+@pytest.mark.usefixtures("products")
+class TestResultCache:
+    @pytest.fixture
+    def result_cache(self, settings):
+        settings.DATA_BROWSER_RESULT_CACHE_TTL = 60
+        cache.clear()
+        yield orm.result_cache_stats
+        cache.clear()
+
+    @pytest.fixture
+    def get_results(self, orm_models, django_assert_num_queries):
+        def helper(req, queries, fields="size-0,name+1", filters=None):
+            query = Query.from_request("tests.Product", fields, filters or {})
+            bound_query = BoundQuery.bind(query, orm_models)
+            orm._get_permission_fingerprint(req)  # loads the users permissions
+            with django_assert_num_queries(queries):
+                return orm.get_results(req, bound_query, orm_models)
+
+        return helper
+
+    def test_disabled(self, req, get_results):
+        stats = dict(orm.result_cache_stats)
+        assert get_results(req, 1) == get_results(req, 1)
+        assert orm.result_cache_stats == stats
+
+    def test_hit(self, req, get_results, result_cache):
+        hits, misses = result_cache["hits"], result_cache["misses"]
+        assert get_results(req, 1) == get_results(req, 0)
+        assert result_cache["hits"] == hits + 1
+        assert result_cache["misses"] == misses + 1
+
+    def test_normalized(self, req, get_results, result_cache):
+        filters = {"size__lt": ["3"], "name__not_equals": ["x"], "bob__equals": ["1"]}
+        get_results(req, 1, "size-0,name+1,bob", filters)
+        filters = {"name__not_equals": ["x"], "size__lt": ["3"]}
+        get_results(req, 0, "size-0,name+1", filters)
+        get_results(req, 1, "size-0,name+2", filters)
+
+    def test_keyed_on_permissions(self, req, rf, get_results, result_cache):
+        def make_req(**kwargs):
+            res = rf.get("/")
+            res.user = User.objects.create(is_staff=True, **kwargs)
+            return res
+
+        get_results(req, 1)
+        get_results(make_req(username="a", is_superuser=True), 0)
+        get_results(make_req(username="b"), 1)
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"HTTP_CACHE_CONTROL": "max-age=0, no-cache"},
+            {"data": {"cache": "no-store"}},
+        ],
+    )
+    def test_bypass(self, rf, admin_user, req, get_results, result_cache, kwargs):
+        bypass = rf.get("/", **kwargs)
+        bypass.user = admin_user
+        bypassed = result_cache["bypassed"]
+        get_results(req, 1)
+        get_results(bypass, 1)
+        assert result_cache["bypassed"] == bypassed + 1
+        # and the bypass refreshed the cache
+        get_results(req, 0)
+
+    def test_oversized(self, req, get_results, result_cache, settings):
+        settings.DATA_BROWSER_RESULT_MAX_BYTES = 10
+        oversized = result_cache["oversized"]
+        get_results(req, 1)
+        get_results(req, 1)
+        assert result_cache["oversized"] == oversized + 2
+
+
+@pytest.mark.parametrize(
+    "fields,filters,expected",
+    [
+        ("name,id__count,size__sum,size__min,size__max", {}, True),
+        ("size__sum", {"name__equals": ["a"]}, True),
+        ("name,size__sum-1", {}, True),
+        ("name,&size,id__count", {}, False),
+        ("name,size__sum", {"size__sum__gt": ["1"]}, False),
+        ("name,size__sum", {"created_time__lt": ["now"]}, False),
+        ("name,producer__address__id__count", {}, False),
+        ("name,size__average", {}, False),
+        ("name,size__count", {}, False),
+        ("name+1,size__sum", {}, False),
+    ],
+)
+def test_can_merge_results(orm_models, fields, filters, expected):
+    query = Query.from_request("tests.Product", fields, filters)
+    bound_query = BoundQuery.bind(query, orm_models)
+    assert orm.can_merge_results(bound_query, orm_models) == expected
+
+
+def test_merge_results(orm_models):
+    query = Query.from_request("tests.Product", "size,id__count-1,size__max", {})
+    bound_query = BoundQuery.bind(query, orm_models)
+
+    def results(*rows):
+        rows = [{"size": s, "id__count": c, "size__max": m} for s, c, m in rows]
+        cells = {(i, 0): {} for i in range(len(rows))}
+        return {"rows": rows, "cols": [{}], "cells": cells, "length": len(rows)}
+
+    old = results((2, 3, None), (1, 1, 1))
+    new = results((3, 5, 3), (2, 1, 2))
+    assert orm.merge_results(bound_query, old, new) == results(
+        (3, 5, 3), (2, 4, 2), (1, 1, 1)
+    )
+    assert orm.merge_results(bound_query, results(), new) == new
+    assert orm.merge_results(bound_query, old, results()) == old
+
+    # a null in a sort field
+    assert orm.merge_results(bound_query, old, results((4, None, 1))) is None
+
+    # truncated
+    bound_query.limit = 3
+    assert orm.merge_results(bound_query, old, results((3, 5, 3))) is None
+    bound_query.limit = 2
+    assert orm.merge_results(bound_query, old, results()) is None
+    assert orm.merge_results(bound_query, results(), old) is None
+
+
+@pytest.mark.usefixtures("products")
+def test_get_watermark(req, orm_models):
+    query = Query.from_request("tests.Product", "name", {"size__lt": ["2"]})
+    bound_query = BoundQuery.bind(query, orm_models)
+    ids = models.Product.objects.filter(size__lt=2).values_list("id", flat=True)
+    assert orm.get_watermark(req, bound_query, orm_models, "id") == max(ids)
+
+    for field in ["name", "producer", "bob", "is_onsale"]:
+        with pytest.raises(ValueError):
+            orm.get_watermark(req, bound_query, orm_models, field)
+
+    models.Product.objects.all().delete()
+    assert orm.get_watermark(req, bound_query, orm_models, "id") is None
@@ -0,0 +1,104 @@
+import contextvars
+import threading
+
+import pytest
+from django.contrib.auth.models import User
+
+from data_browser import signals
+from data_browser.timing import Phase, collect_timings, note, phase
+
+
+def test_not_collecting(mocker):
+    perf_counter = mocker.patch("time.perf_counter")
+    with phase("sql", "default") as sql:
+        sql.rows = 3
+    note(cache_hit=True)
+    perf_counter.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_phases(mocker):
+    mocker.patch("time.perf_counter", side_effect=[1, 1.5, 2, 2.25, 3, 4])
+    with collect_timings() as timings:
+        with phase("sql", "default") as sql:
+            list(User.objects.all())
+            list(User.objects.all())
+            sql.rows = 1
+        with phase("format"):
+            pass
+        with phase("sql", "default") as sql:
+            list(User.objects.all())
+            sql.rows = 2
+        note(cache_hit=False)
+
+    assert timings.header() == (
+        'sql;dur=1500.0;desc="3 rows in 3 queries", format;dur=250.0'
+    )
+    assert timings.info == {"cache_hit": False}
+
+
+def test_queries_only():
+    with collect_timings() as timings:
+        calculated = Phase("calculated", None)
+        calculated.duration, calculated.queries = 0.001, 2
+        timings.add(calculated)
+    assert timings.header() == 'calculated;dur=1.0;desc="2 queries"'
+
+
+def test_singular():
+    with collect_timings() as timings:
+        calculated = Phase("calculated", None)
+        calculated.duration, calculated.queries, calculated.rows = 0.001, 1, 1
+        timings.add(calculated)
+    assert timings.header() == 'calculated;dur=1.0;desc="1 row in 1 query"'
+
+
+def test_threads():
+    def work():
+        for _ in range(1000):
+            with phase("sql") as sql:
+                sql.rows = 1
+
+    with collect_timings() as timings:
+        threads = [
+            threading.Thread(target=contextvars.copy_context().run, args=(work,))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert timings.phases["sql"]["rows"] == 4000
+
+
+@pytest.mark.django_db
+def test_signals(mocker):
+    started = mocker.Mock()
+    finished = mocker.Mock()
+    signals.phase_started.connect(started)
+    signals.phase_finished.connect(finished)
+    try:
+        # sent without collecting timings
+        with phase("sql", "default", "bound query") as sql:
+            list(User.objects.all())
+            sql.rows = 2
+        with phase("format"):
+            pass
+    finally:
+        signals.phase_started.disconnect(started)
+        signals.phase_finished.disconnect(finished)
+
+    assert [call.kwargs["phase"] for call in started.call_args_list] == [
+        "sql",
+        "format",
+    ]
+    assert started.call_args_list[0].kwargs["bound_query"] == "bound query"
+    assert finished.call_args_list[0].kwargs == dict(
+        signal=signals.phase_finished,
+        sender=None,
+        phase="sql",
+        bound_query="bound query",
+        duration=mocker.ANY,
+        queries=1,
+        rows=2,
+    )
@@ -1,20 +1,34 @@
+import asyncio
 import csv
 import json
+import threading
+import time
 from datetime import datetime
 
 import pytest
+from django import db
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.http import Http404, HttpResponse
 
 import data_browser.models
+from data_browser import limits, orm, signals, views
+from data_browser.asgi import DISCONNECTED_KEY
 
 from . import models
-from .util import update_fe_fixture
+from .util import SLOW_SQL, update_fe_fixture
 
 
 def dump(val):
     print(json.dumps(val, indent=4, sort_keys=True))
 
 
+@pytest.fixture(autouse=True)
+def clear_index_html_cache():
+    views._get_index_html.cache_clear()
+
+
 @pytest.fixture
 def products(db):
     address = models.Address.objects.create(city="london")
@@ -77,6 +91,59 @@ def test_query_ctx(admin_client, snapshot):
     update_fe_fixture("frontend/src/context_fixture.json", config)
 
 
+def test_query_ctx_etag(admin_client):
+    res = admin_client.get("/data_browser/query//.ctx?")
+    assert res.status_code == 200
+    etag = res["ETag"]
+
+    res = admin_client.get("/data_browser/query//.ctx?", HTTP_IF_NONE_MATCH=etag)
+    assert res.status_code == 304
+    assert res["ETag"] == etag
+    assert not res.content
+
+    res = admin_client.get("/data_browser/query//.ctx?", HTTP_IF_NONE_MATCH='"bob"')
+    assert res.status_code == 200
+    assert res["ETag"] == etag
+
+
+def test_query_html_etag(admin_client):
+    first = admin_client.get("/data_browser/query//.html?")
+    assert first.status_code == 200
+    etag = first["ETag"]
+
+    res = admin_client.get("/data_browser/query//.html?", HTTP_IF_NONE_MATCH="*")
+    assert res.status_code == 304
+    assert res["ETag"] == etag
+
+    # served from the rendered page cache
+    cached = admin_client.get("/data_browser/query//.html?")
+    assert cached.context is None
+    assert cached.content == first.content
+
+    # the cache is bounded
+    info = views._get_index_html.cache_info()
+    assert (info.hits, info.currsize, info.maxsize) == (1, 1, 32)
+
+
+def test_query_ctx_lazy(admin_client, settings):
+    config = admin_client.get("/data_browser/query//.ctx?").json()
+    settings.DATA_BROWSER_LAZY_CONFIG = True
+    lazy_config = admin_client.get("/data_browser/query//.ctx?").json()
+
+    all_model_fields = config.pop("allModelFields")
+    assert lazy_config == config
+
+    for model_name in ["tests.Product", "tests.InlineAdmin", "number"]:
+        res = admin_client.get(f"/data_browser/api/models/{model_name}/")
+        assert res.status_code == 200
+        assert res.json() == all_model_fields[model_name]
+
+
+def test_model_fields_bad_model(admin_client):
+    res = admin_client.get("/data_browser/api/models/tests.NotInAdmin/")
+    assert res.status_code == 404
+
+
 @pytest.mark.usefixtures("products")
 def test_query_json_bad_fields(admin_client):
     res = admin_client.get(
@@ -163,9 +230,8 @@ testdata = [
 ]
 
 
-@pytest.mark.usefixtures("pivot_products")
-@pytest.mark.parametrize("key", testdata)
-def test_query_csv_pivot_permutations(admin_client, key, snapshot):
+def pivot_url(key, media):
+    # d: no filter, r: row field, c: col field, b: body fields
     fields = []
     if "r" in key:
         fields.append("created_time__year+0")
@@ -174,10 +240,13 @@ def test_query_csv_pivot_permutations(admin_client, key, snapshot):
     if "b" in key:
         fields.extend(["id__count", "size__max"])
     filters = "" if "d" in key else "id__equals=123"
+    return f"/data_browser/query/tests.Product/{','.join(fields)}.{media}?{filters}"
 
-    res = admin_client.get(
-        f"/data_browser/query/tests.Product/{','.join(fields)}.csv?{filters}"
-    )
+
+@pytest.mark.usefixtures("pivot_products")
+@pytest.mark.parametrize("key", testdata)
+def test_query_csv_pivot_permutations(admin_client, key, snapshot):
+    res = admin_client.get(pivot_url(key, "csv"))
     assert res.status_code == 200
     print(res.content.decode("utf-8"))
     rows = list(csv.reader(res.content.decode("utf-8").splitlines()))
@@ -185,6 +254,20 @@ def test_query_csv_pivot_permutations(admin_client, key, snapshot):
     snapshot.assert_match(rows, "key")
 
 
+@pytest.mark.usefixtures("pivot_products")
+@pytest.mark.parametrize("key", testdata)
+def test_query_csv_streaming(admin_client, key, settings):
+    url = pivot_url(key, "csv")
+
+    expected = admin_client.get(url).content.decode("utf-8")
+    settings.DATA_BROWSER_CSV_STREAMING = True
+    res = admin_client.get(url)
+    assert res.status_code == 200
+    assert res.streaming
+    assert "attachment" in res["Content-Disposition"]
+    assert b"".join(res.streaming_content).decode("utf-8") == expected
+
+
 @pytest.mark.usefixtures("products")
 def test_query_json(admin_client, snapshot):
     res = admin_client.get(
@@ -195,6 +278,171 @@ def test_query_json(admin_client, snapshot):
     snapshot.assert_match(data, "data")
 
 
+@pytest.mark.usefixtures("products")
+class TestQueryLimits:
+    @pytest.fixture(autouse=True)
+    def limits(self, settings):
+        settings.DATA_BROWSER_MAX_QUERIES = 1
+        cache.clear()
+        yield
+        cache.clear()
+
+    def running(self):
+        return cache.get(f"{limits._LIMITS_PREFIX}:all")
+
+    def test_too_many(self, admin_client, admin_user):
+        url = "/data_browser/query/tests.Product/name.json"
+        assert admin_client.get(url).status_code == 200
+        assert self.running() == 0
+
+        release = limits.acquire_query_slot(admin_user)
+        res = admin_client.get(url)
+        assert res.status_code == 429
+        assert res["Retry-After"] == "5"
+        assert "Too many queries" in res.json()["error"]
+        release()
+
+    def test_error(self, admin_client):
+        res = admin_client.get("/data_browser/query/tests.Missing/name.json")
+        assert res.status_code == 404
+        assert self.running() == 0
+
+    def test_streaming(self, admin_client, settings):
+        settings.DATA_BROWSER_CSV_STREAMING = True
+        res = admin_client.get("/data_browser/query/tests.Product/name.csv")
+        assert res.status_code == 200
+        # held until the response is read and closed
+        assert self.running() == 1
+        assert b"".join(res.streaming_content).decode("utf-8").split() == [
+            "name",
+            "a",
+            "b",
+            "c",
+        ]
+        assert self.running() == 0
+
+    def test_receiver_fails(self, admin_client, mocker):
+        receiver = mocker.Mock(side_effect=ValueError("boom"))
+        log = mocker.patch("logging.Logger.error")
+        signals.query_finished.connect(receiver)
+        try:
+            res = admin_client.get("/data_browser/query/tests.Product/name.json")
+        finally:
+            signals.query_finished.disconnect(receiver)
+        assert res.status_code == 200
+        assert res.json()["rows"]
+        assert log.call_args.args == ("query_finished receiver %r failed", receiver)
+        assert self.running() == 0
+
+    def test_late_failure(self, admin_client, mocker):
+        mocker.patch.object(
+            signals.query_finished, "send_robust", side_effect=RuntimeError("boom")
+        )
+        with pytest.raises(RuntimeError):
+            admin_client.get("/data_browser/query/tests.Product/name.json")
+        assert self.running() == 0
+
+
+@pytest.mark.usefixtures("products")
+def test_query_server_timing(admin_client, settings):
+    url = "/data_browser/query/tests.Product/name,producer__address__bob.json"
+    res = admin_client.get(url)
+    assert res.status_code == 200
+    timings = {
+        metric.split(";")[0]: metric for metric in res["Server-Timing"].split(", ")
+    }
+    assert list(timings) == [
+        "get_models",
+        "bind",
+        "sql",
+        "calculated",
+        "pivot",
+        "format",
+        "serialize",
+    ]
+    assert timings["sql"].endswith(';desc="3 rows in 1 query"')
+    assert timings["calculated"].endswith(';desc="1 row in 1 query"')
+
+    settings.DATA_BROWSER_SERVER_TIMING = False
+    assert "Server-Timing" not in admin_client.get(url)
+
+
+@pytest.mark.usefixtures("products")
+def test_query_finished_signal(admin_client, mocker, settings):
+    settings.DATA_BROWSER_RESULT_CACHE_TTL = 60
+    receiver = mocker.Mock()
+    signals.query_finished.connect(receiver)
+    try:
+        url = "/data_browser/query/tests.Product/name,producer__address__city.json"
+        admin_client.get(url)
+        admin_client.get(url)
+        admin_client.get(url.replace(".json", ".csv"))
+    finally:
+        signals.query_finished.disconnect(receiver)
+
+    miss, hit, csv_ = [call.kwargs for call in receiver.call_args_list]
+    assert miss["model_name"] == "tests.Product"
+    assert miss["bound_query"].model_name == "tests.Product"
+    assert miss["media"] == "json"
+    assert miss["status"] == 200
+    assert miss["view"] is None
+    assert (miss["rows"], miss["cols"], miss["cache_hit"]) == (3, 1, False)
+    assert "sql" in miss["phases"]
+    assert (hit["rows"], hit["cols"], hit["cache_hit"]) == (3, 1, True)
+    assert "sql" not in hit["phases"]
+    assert csv_["media"] == "csv"
+
+
+@pytest.mark.usefixtures("products")
+def test_query_log(admin_client, admin_user, settings):
+    settings.DATA_BROWSER_QUERY_LOG = True
+    url = "/data_browser/query/tests.Product/size-0,name.json?size__lt=2"
+    assert admin_client.get(url).status_code == 200
+    assert admin_client.get(url.replace(".json", ".query")).status_code == 200
+
+    settings.DATA_BROWSER_CSV_STREAMING = True
+    assert admin_client.get(url.replace(".json", ".csv")).status_code == 200
+
+    log = data_browser.models.QueryLog.objects.get()
+    assert (log.model_name, log.fields, log.filters) == (
+        "tests.Product",
+        "size-0,name",
+        "size__lt",
+    )
+    assert (log.media, log.user, log.view, log.rows) == ("json", admin_user, None, 2)
+    assert log.duration >= log.sql_time > 0
+
+    view = data_browser.models.View.objects.create(
+        model_name="tests.Product", fields="name", owner=admin_user, public=True
+    )
+    assert admin_client.get(f"/data_browser/view/{view.public_slug}.json")
+    assert data_browser.models.QueryLog.objects.latest("id").view == view
+
+
+@pytest.mark.usefixtures("products")
+def test_query_log_fails(admin_client, settings, mocker):
+    settings.DATA_BROWSER_QUERY_LOG = True
+    mocker.patch.object(
+        data_browser.models.QueryStats, "update", side_effect=db.DataError("boom")
+    )
+    log = mocker.patch("logging.Logger.exception")
+    res = admin_client.get("/data_browser/query/tests.Product/name.json")
+    assert res.status_code == 200
+    assert res.json()["rows"]
+    log.assert_called_once_with("Failed to log query")
+    assert not data_browser.models.QueryLog.objects.exists()
+
+
+@pytest.mark.usefixtures("products")
+def test_query_timeout(admin_client, mocker):
+    mocker.patch.object(
+        views, "get_results", side_effect=orm.QueryTimeout("Query timed out.")
+    )
+    res = admin_client.get("/data_browser/query/tests.Product/name.json")
+    assert res.status_code == 504
+    assert json.loads(res.content.decode("utf-8")) == {"error": "Query timed out."}
+
+
 @pytest.mark.usefixtures("pivot_products")
 def test_query_json_pivot(admin_client, snapshot):
     res = admin_client.get(
@@ -205,6 +453,42 @@ def test_query_json_pivot(admin_client, snapshot):
     snapshot.assert_match(data, "data")
 
 
+@pytest.mark.usefixtures("pivot_products")
+@pytest.mark.parametrize("key", testdata)
+def test_query_cjson(admin_client, key):
+    data = admin_client.get(pivot_url(key, "json")).json()
+    cdata = admin_client.get(pivot_url(key, "cjson")).json()
+
+    rows, cols, body = data.pop("rows"), data.pop("cols"), data.pop("body")
+    header = cdata.pop("header")
+    assert header["rowCount"] == len(rows)
+    assert header["colCount"] == len(cols)
+    assert cdata.pop("rows") == [[row[f] for row in rows] for f in header["rows"]]
+    assert cdata.pop("cols") == [[col[f] for col in cols] for f in header["cols"]]
+    assert cdata.pop("body") == [
+        [[cell[f] if cell else None for cell in col] for f in header["body"]]
+        for col in body
+    ]
+    data.setdefault("length", 0)
+    assert cdata == data
+
+
+@pytest.mark.usefixtures("pivot_products")
+@pytest.mark.parametrize("key", testdata)
+def test_query_json_sparse(admin_client, key):
+    url = pivot_url(key, "json")
+
+    data = admin_client.get(url).json()
+    sparse = admin_client.get(f"{url}&body=sparse").json()
+
+    body = [[None] * len(sparse["rows"]) for _ in sparse["cols"]]
+    for col, row, cell in sparse.pop("body"):
+        body[col][row] = cell
+    assert body == data.pop("body")
+    data.setdefault("length", 0)
+    assert sparse == data
+
+
 @pytest.mark.usefixtures("products")
 def test_query_json_bad_model(admin_client):
     res = admin_client.get(
@@ -245,6 +529,507 @@ def test_view_csv(admin_client, settings):
     assert res.status_code == 404
 
 
+class TestViewCsvCache:
+    @pytest.fixture
+    def view(self, settings, mocker):
+        settings.DATA_BROWSER_VIEW_CSV_MAX_AGE = 60
+        cache.clear()
+        mocker.patch.object(views, "_run_in_background", lambda func: func())
+        yield data_browser.models.View.objects.create(
+            model_name="tests.Product",
+            fields="name+1",
+            query="size__lt=2",
+            owner=User.objects.get(),
+            public=True,
+        )
+        cache.clear()
+
+    @pytest.fixture
+    def get_names(self, admin_client, view):
+        def helper():
+            res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+            assert res.status_code == 200
+            assert res["Content-Disposition"].startswith("attachment; filename=")
+            return [row[0] for row in csv.reader(res.content.decode().splitlines())]
+
+        return helper
+
+    @pytest.fixture
+    def later(self, mocker):
+        def helper(seconds):
+            mocker.patch("time.time", return_value=now + seconds)
+
+        now = time.time()
+        helper(0)
+        return helper
+
+    @pytest.mark.usefixtures("products")
+    def test_stale_while_revalidate(self, get_names, later):
+        assert get_names() == ["name", "a", "b"]
+        models.Product.objects.filter(name="a").update(name="x")
+        later(60)
+        assert get_names() == ["name", "a", "b"]
+        later(61)
+        assert get_names() == ["name", "a", "b"]  # stale, refreshes in the background
+        assert get_names() == ["name", "b", "x"]
+
+    @pytest.mark.usefixtures("products")
+    def test_coalesced(self, get_names, later, view, mocker):
+        assert get_names() == ["name", "a", "b"]
+        models.Product.objects.filter(name="a").update(name="x")
+        later(61)
+        refresh = mocker.patch.object(views, "_refresh_view_csv")
+        mocker.patch.object(views, "_run_in_background")  # still running
+        get_names()
+        get_names()
+        views._run_in_background.assert_called_once()
+        refresh.assert_not_called()
+
+    @pytest.mark.usefixtures("products")
+    def test_refresh_fails(self, get_names, later, mocker):
+        assert get_names() == ["name", "a", "b"]
+        later(61)
+        mocker.patch.object(views, "_get_csv", side_effect=Exception("boom"))
+        log = mocker.patch("logging.Logger.exception")
+        assert get_names() == ["name", "a", "b"]
+        log.assert_called_once()
+        # the lock was released so the next request tries again
+        assert get_names() == ["name", "a", "b"]
+        assert log.call_count == 2
+
+    @pytest.mark.usefixtures("products")
+    def test_cold_coalesced(self, get_names, view, mocker):
+        # another request holds the lock and is running the query
+        key = views._get_view_csv_key(view, view.get_query())
+        cache.add(f"{key}:lock", True)
+        refresh = mocker.patch.object(views, "_refresh_view_csv")
+
+        def sleep(seconds):
+            cache.set(key, (time.time(), "name\nx\n"))
+
+        mocker.patch("time.sleep", side_effect=sleep)
+        assert get_names() == ["name", "x"]
+        time.sleep.assert_called_once_with(views._VIEW_CSV_POLL_INTERVAL)
+        refresh.assert_not_called()
+
+    @pytest.mark.usefixtures("products")
+    def test_cold_filled_before_lock(self, admin_user, view, mocker):
+        # the holder finished between our cache miss and taking the lock
+        key = views._get_view_csv_key(view, view.get_query())
+        cache.set(key, (time.time(), "name\nx\n"))
+        refresh = mocker.patch.object(views, "_refresh_view_csv")
+        entry, _ = views._get_view_csv(None, view, view.get_query(), key)
+        assert entry[1] == "name\nx\n"
+        refresh.assert_not_called()
+        assert cache.get(f"{key}:lock") is None
+
+    @pytest.mark.usefixtures("products")
+    def test_cold_wait_capped(self, admin_client, view, mocker):
+        key = views._get_view_csv_key(view, view.get_query())
+        cache.add(f"{key}:lock", True)
+        mocker.patch.object(views, "_VIEW_CSV_WAIT", 0)
+        mocker.patch("time.sleep")
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        assert res.status_code == 503
+        assert res["Retry-After"] == "0"
+
+    @pytest.mark.usefixtures("products")
+    def test_expires(self, get_names, view, mocker):
+        set_ = mocker.spy(cache, "set")
+        get_names()
+        key = views._get_view_csv_key(view, view.get_query())
+        set_.assert_called_once_with(key, mocker.ANY, 600)
+
+    @pytest.mark.usefixtures("products")
+    def test_refresh_not_found(self, admin_client, get_names, later, view, mocker):
+        assert get_names() == ["name", "a", "b"]
+        later(61)
+        # e.g. the owner lost access to the model
+        mocker.patch.object(views, "_get_data_response", side_effect=Http404("gone"))
+        log = mocker.patch("logging.Logger.warning")
+        assert get_names() == ["name", "a", "b"]
+        log.assert_called_once()
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        assert res.status_code == 404
+
+    @pytest.mark.usefixtures("products")
+    def test_cold_holder_failed(self, get_names, view, mocker):
+        key = views._get_view_csv_key(view, view.get_query())
+        cache.add(f"{key}:lock", True)
+        # the other request fails without caching anything
+        mocker.patch("time.sleep", side_effect=lambda s: cache.delete(f"{key}:lock"))
+        assert get_names() == ["name", "a", "b"]
+        assert cache.get(f"{key}:lock") is None
+
+    @pytest.mark.usefixtures("products")
+    def test_cold_timeout(self, admin_client, view, mocker):
+        mocker.patch.object(
+            views,
+            "get_sparse_results",
+            side_effect=orm.QueryTimeout("Query timed out."),
+        )
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        assert res.status_code == 504
+        assert json.loads(res.content.decode("utf-8")) == {"error": "Query timed out."}
+
+    @pytest.mark.usefixtures("products")
+    def test_cold_cost_limit(self, admin_client, view, settings, mocker):
+        mocker.patch.object(orm, "_estimate_rows", return_value=10)
+        settings.DATA_BROWSER_QUERY_COST_LIMIT = 5
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        assert res.status_code == 422
+        assert json.loads(res.content.decode("utf-8"))["estimatedRows"] == 10
+
+    @pytest.mark.usefixtures("products")
+    def test_background_cost_limit(self, get_names, later, settings, mocker):
+        assert get_names() == ["name", "a", "b"]
+        models.Product.objects.filter(name="a").update(name="x")
+        later(61)
+        mocker.patch.object(orm, "_estimate_rows", return_value=10)
+        settings.DATA_BROWSER_QUERY_COST_LIMIT = 5
+        # background refreshes aren't held to the cost limit
+        assert get_names() == ["name", "a", "b"]
+        assert get_names() == ["name", "b", "x"]
+
+    @pytest.mark.usefixtures("products")
+    def test_cold_limited(self, admin_client, view, settings):
+        settings.DATA_BROWSER_MAX_QUERIES = 1
+        release = limits.acquire_query_slot(view.owner)
+        try:
+            res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        finally:
+            release()
+        assert res.status_code == 429
+        # the lock was released
+        assert (
+            admin_client.get(f"/data_browser/view/{view.public_slug}.csv").status_code
+            == 200
+        )
+
+    @pytest.mark.usefixtures("products")
+    def test_background_limited(self, get_names, later, view, settings, mocker):
+        assert get_names() == ["name", "a", "b"]
+        later(61)
+        settings.DATA_BROWSER_MAX_QUERIES = 1
+        log = mocker.patch("logging.Logger.warning")
+        release = limits.acquire_query_slot(view.owner)
+        try:
+            assert get_names() == ["name", "a", "b"]
+        finally:
+            release()
+        log.assert_called_once()
+
+    def test_bad_model(self, admin_client, view):
+        view.model_name = "tests.Bob"
+        view.save()
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        assert res.status_code == 404
+
+
+@pytest.mark.usefixtures("products")
+class TestViewSnapshot:
+    @pytest.fixture
+    def view(self):
+        view = data_browser.models.View.objects.create(
+            model_name="tests.Product",
+            fields="name+1",
+            query="size__lt=2",
+            owner=User.objects.get(),
+            public=True,
+            refresh_interval=60,
+        )
+        view.refresh_snapshot()
+        models.Product.objects.filter(name="a").update(name="x")
+        return view
+
+    def test_csv(self, admin_client, view):
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        assert res.status_code == 200
+        assert res["Last-Modified"]
+        assert res["Content-Disposition"].startswith("attachment; filename=")
+        assert res.content.decode().splitlines() == ["name", "a", "b"]
+
+    def test_json(self, admin_client, view):
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.json")
+        assert res.status_code == 200
+        assert res["Last-Modified"]
+        assert res.json()["rows"] == [{"name": "a"}, {"name": "b"}]
+
+    def test_other_media(self, admin_client, view):
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.cjson")
+        assert res.json()["rows"] == [["b", "x"]]
+
+    def test_no_interval(self, admin_client, view):
+        view.refresh_interval = None
+        view.save()
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        assert res.content.decode().splitlines() == ["name", "b", "x"]
+
+    def test_bad_model(self, admin_client, view):
+        view.model_name = "tests.Bob"
+        view.save()
+        res = admin_client.get(f"/data_browser/view/{view.public_slug}.csv")
+        assert res.status_code == 404
+
+
+@pytest.mark.django_db
+def test_run_in_background():
+    ran = []
+    views._run_in_background(lambda: ran.append(True)).join()
+    assert ran == [True]
+
+
+@pytest.mark.django_db(transaction=True)
+class TestAsyncViews:
+    @pytest.fixture
+    def get(self, rf, admin_user):
+        def helper(view_func, path, **kwargs):
+            request = rf.get(path)
+            request.user = admin_user
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(view_func(request, **kwargs))
+            finally:
+                loop.close()
+
+        return helper
+
+    def test_runs_on_executor(self, get):
+        @views._async_view
+        def thread_name(request):
+            return HttpResponse(threading.current_thread().name)
+
+        res = get(thread_name, "/")
+        assert res.content.decode("utf-8").startswith("data_browser_async")
+        assert views._get_async_executor() is views._get_async_executor()
+
+    @pytest.mark.skipif(db.connection.vendor != "sqlite", reason="sqlite interrupts")
+    def test_disconnect(self, rf, admin_user):  # pragma: sqlite
+        started = threading.Event()
+        finished = threading.Event()
+        errors = []
+
+        @views._async_view
+        def slow(request):
+            connection = db.connections["default"]
+            try:
+                with orm._cancellable("default"), connection.cursor() as cursor:
+                    started.set()
+                    cursor.execute(SLOW_SQL)
+            except orm.QueryCancelled as e:
+                errors.append(e)
+            finally:
+                finished.set()
+            return HttpResponse()
+
+        async def disconnect_once_started():
+            request = rf.get("/")
+            request.user = admin_user
+            request.scope = {DISCONNECTED_KEY: asyncio.Event()}
+            response = asyncio.ensure_future(slow(request))
+            await loop.run_in_executor(None, started.wait)
+            await asyncio.sleep(0.2)
+            request.scope[DISCONNECTED_KEY].set()
+            return await response
+
+        loop = asyncio.new_event_loop()
+        try:
+            res = loop.run_until_complete(disconnect_once_started())
+        finally:
+            loop.close()
+        assert res.status_code == 499
+        assert finished.wait(10)
+        assert len(errors) == 1
+
+    def test_connected(self, rf, admin_user):
+        async def connected():
+            request = rf.get("/")
+            request.user = admin_user
+            request.scope = {DISCONNECTED_KEY: asyncio.Event()}
+            return await views.query_ctx_async(request, model_name="tests.Product")
+
+        loop = asyncio.new_event_loop()
+        try:
+            assert loop.run_until_complete(connected()).status_code == 200
+        finally:
+            loop.close()
+
+    @pytest.mark.usefixtures("products")
+    def test_query(self, get, admin_client):
+        path = "/data_browser/query/tests.Product/size-0,name+1.json?size__lt=2"
+        res = get(
+            views.query_async,
+            path,
+            model_name="tests.Product",
+            fields="size-0,name+1",
+            media="json",
+        )
+        assert res.status_code == 200
+        assert json.loads(res.content) == json.loads(admin_client.get(path).content)
+
+    @pytest.mark.usefixtures("products")
+    def test_query_streamed_csv(self, get, settings):
+        settings.DATA_BROWSER_CSV_STREAMING = True
+        res = get(
+            views.query_async,
+            "/",
+            model_name="tests.Product",
+            fields="size-0,name+1",
+            media="csv",
+        )
+        assert res.status_code == 200
+        assert not res.streaming
+        assert res["Content-Disposition"].startswith("attachment;")
+        rows = list(csv.reader(res.content.decode("utf-8").splitlines()))
+        assert rows == [["size", "name"], ["2.0", "c"], ["1.0", "a"], ["1.0", "b"]]
+
+    def test_query_ctx(self, get):
+        res = get(views.query_ctx_async, "/", model_name="tests.Product")
+        assert res.status_code == 200
+        assert "sortedModels" in json.loads(res.content)
+
+    @pytest.mark.usefixtures("products")
+    def test_view(self, get, admin_user):
+        view = data_browser.models.View.objects.create(
+            model_name="tests.Product",
+            fields="name+1",
+            query="size__lt=2",
+            owner=admin_user,
+            public=True,
+        )
+        res = get(views.view_async, "/", pk=view.public_slug, media="csv")
+        assert res.status_code == 200
+        rows = list(csv.reader(res.content.decode("utf-8").splitlines()))
+        assert rows == [["name"], ["a"], ["b"]]
+
+        with pytest.raises(Http404):
+            get(views.view_async, "/", pk="missing", media="csv")
+
+    def test_not_staff(self, get, admin_user):
+        admin_user.is_staff = False
+        admin_user.save()
+        res = get(views.query_async, "/", model_name="tests.Product", media="json")
+        assert res.status_code == 302
+
+
+@pytest.mark.usefixtures("products")
+def test_query_cost(admin_client, settings, mocker):
+    mocker.patch.object(orm, "_estimate_rows", return_value=10)
+    settings.DATA_BROWSER_QUERY_COST_LIMIT = 5
+    url = "/data_browser/query/tests.Product/name.json"
+
+    res = admin_client.get(url)
+    assert res.status_code == 422
+    assert json.loads(res.content.decode("utf-8")) == {
+        "error": "This query is estimated to read 10 rows, more than the 5 allowed."
+        " Add confirm=true to run it anyway.",
+        "estimatedRows": 10,
+    }
+    assert admin_client.get(f"{url}?confirm=true").status_code == 200
+
+    # streamed csvs are checked before they start
+    settings.DATA_BROWSER_CSV_STREAMING = True
+    csv_url = url.replace(".json", ".csv")
+    assert admin_client.get(csv_url).status_code == 422
+    assert admin_client.get(f"{csv_url}?confirm=true").status_code == 200
+
+    settings.DATA_BROWSER_QUERY_CONFIRM = False
+    res = admin_client.get(f"{url}?confirm=true")
+    assert res.status_code == 422
+    assert "confirm" not in json.loads(res.content.decode("utf-8"))["error"]
+
+
+@pytest.mark.usefixtures("products")
+def test_view_cost(admin_client, settings, mocker):
+    mocker.patch.object(orm, "_estimate_rows", return_value=10)
+    settings.DATA_BROWSER_QUERY_COST_LIMIT = 5
+    view = data_browser.models.View.objects.create(
+        model_name="tests.Product", fields="name", public=True, owner=User.objects.get()
+    )
+    res = admin_client.get(f"/data_browser/view/{view.public_slug}.json?confirm=true")
+    assert res.status_code == 422
+    assert "confirm" not in json.loads(res.content.decode("utf-8"))["error"]
+
+
+needs_explain = pytest.mark.skipif(
+    not orm.supports_explain(), reason="QuerySet.explain needs Django 2.1"
+)
+
+
+def get_explain(admin_client, url):
+    res = admin_client.get(f"/data_browser/query/tests.Product/{url}")
+    assert res.status_code == 200
+    return json.loads(res.content.decode("utf-8"))["queries"]
+
+
+@needs_explain
+@pytest.mark.usefixtures("products")
+def test_query_explain(admin_client, settings):
+    settings.DATA_BROWSER_QUERY_LOG = True
+    queries = get_explain(admin_client, "size-0,name+1.explain?size__lt=2")
+    assert [q["name"] for q in queries] == ["main"]
+    assert "WHERE" in queries[0]["sql"]
+    assert queries[0]["plan"]
+    assert not queries[0]["analyzed"]
+    assert not data_browser.models.QueryLog.objects.exists()
+
+    # pivots explain the sub queries too
+    queries = get_explain(
+        admin_client, "created_time__year+0,&created_time__month+1,id__count.explain"
+    )
+    assert [q["name"] for q in queries] == ["main", "rows", "cols"]
+
+    # aggregate only queries
+    queries = get_explain(admin_client, "id__count,size__max.explain?size__lt=2")
+    assert "GROUP BY" not in queries[0]["sql"]
+    assert "COUNT" in queries[0]["sql"]
+
+    assert get_explain(admin_client, ".explain") == []
+
+
+@needs_explain
+def test_query_explain_analyze(admin_client):
+    queries = get_explain(admin_client, "name.explain?analyze=true")
+    assert queries[0]["analyzed"] is (db.connection.vendor == "postgresql")
+
+
+@needs_explain
+@pytest.mark.usefixtures("products")
+def test_query_explain_empty(admin_client, mocker):
+    mocker.patch.object(
+        orm,
+        "_get_explain_queryset",
+        return_value=models.Product.objects.none(),
+    )
+    assert get_explain(admin_client, "name.explain") == [
+        {"name": "main", "sql": None, "plan": None, "analyzed": False}
+    ]
+
+
+def test_query_explain_unsupported(admin_client, monkeypatch):
+    monkeypatch.delattr(QuerySet, "explain", raising=False)
+    res = admin_client.get("/data_browser/query/tests.Product/name.explain")
+    assert res.status_code == 400
+    assert "Django 2.1" in json.loads(res.content.decode("utf-8"))["error"]
+
+
+def test_supports_explain_analyze(mocker):
+    connection = mocker.Mock(vendor="sqlite", features=object())
+    assert not orm._supports_explain_analyze(connection)
+    connection.features = mocker.Mock(supports_explain_analyze=True)
+    assert orm._supports_explain_analyze(connection)
+    connection = mocker.Mock(vendor="postgresql")
+    assert orm._supports_explain_analyze(connection)
+
+
+def test_view_explain(admin_client):
+    view = data_browser.models.View.objects.create(
+        model_name="tests.Product", fields="name", public=True, owner=User.objects.get()
+    )
+    res = admin_client.get(f"/data_browser/view/{view.public_slug}.explain")
+    assert res.status_code == 404
+
+
 @pytest.mark.usefixtures("products")
 def test_view_json(admin_client):
     view = data_browser.models.View.objects.create(
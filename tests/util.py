@@ -1,6 +1,12 @@
 import json
 from pathlib import Path
 
+# an SQLite query that takes minutes unless it's interrupted
+SLOW_SQL = """
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1e9)
+    SELECT count(*) FROM c
+"""
+
 
 class ANY:
     def __init__(self, type):